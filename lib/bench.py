@@ -0,0 +1,153 @@
+from dotenv import load_dotenv
+load_dotenv()
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import subprocess
+from lib.utils import format_duration
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_executor_startup(url: str, rounds: int = 3):
+    """任务启动基准：从拿到任务到即将发起首次LLM调用(kickoff前)的耗时，冷启动 vs 热启动"""
+    from lib.executor import get_cached_executor, get_cdp_urls, _executor_cache
+    cdp_urls = get_cdp_urls()
+
+    _executor_cache.clear()
+    start = time.perf_counter()
+    executor, _ = get_cached_executor(cdp_urls)
+    executor.prepare_crew("bench", url)
+    print(f"冷启动: {format_duration((time.perf_counter() - start) * 1000)}")
+
+    for i in range(rounds):
+        start = time.perf_counter()
+        executor, warm = get_cached_executor(cdp_urls)
+        executor.prepare_crew("bench", url)
+        print(f"热启动#{i + 1}: {format_duration((time.perf_counter() - start) * 1000)} (命中缓存: {warm})")
+
+
+def bench_cli_startup(rounds: int = 5):
+    """CLI冷启动基准：`main.py --help` 与 `import lib.executor` 的耗时，以及导入后常驻的子进程数"""
+    cases = {
+        "main.py --help": [sys.executable, "main.py", "--help"],
+        "import lib.executor": [sys.executable, "-c", "import lib.executor"],
+    }
+    for name, cmd in cases.items():
+        costs = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            costs.append((time.perf_counter() - start) * 1000)
+        print(f"{name}: 平均 {format_duration(sum(costs) / len(costs))} / 最快 {format_duration(min(costs))}")
+
+    probe = "import multiprocessing, lib.executor; print(len(multiprocessing.active_children()))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT_DIR, capture_output=True, text=True)
+    print(f"import lib.executor 后的子进程数: {out.stdout.strip() or out.stderr.strip()[-200:]}")
+
+
+def bench_llm_tls(rounds: int = 5):
+    """LLM连接复用基准：每轮新建客户端 vs 共享连接池，统计建连/TLS握手耗时和单次请求耗时
+
+    请求 CREWAI_LLM_BASE_URL 下的 /models（不消耗token），每轮节省的握手时间即每次LLM调用节省的时间。
+    """
+    import httpx
+    from lib.httpclient import get_http_client, DEFAULT_BASE_URL
+
+    base_url = (os.getenv("CREWAI_LLM_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+    headers = {"Authorization": f"Bearer {os.getenv('CREWAI_LLM_API_KEY', '')}"}
+
+    def timed_request(client):
+        phases = {}
+
+        def trace(name, info):
+            # httpcore 事件: connection.connect_tcp / connection.start_tls 的 started/complete
+            if name.startswith("connection.") and name.endswith(".started"):
+                phases[name[:-len(".started")]] = time.perf_counter()
+            elif name.startswith("connection.") and name.endswith(".complete"):
+                key = name[:-len(".complete")]
+                phases[key] = time.perf_counter() - phases.get(key, time.perf_counter())
+
+        start = time.perf_counter()
+        response = client.get(f"{base_url}/models", headers=headers, extensions={"trace": trace})
+        total = time.perf_counter() - start
+        handshake = phases.get("connection.connect_tcp", 0.0) + phases.get("connection.start_tls", 0.0)
+        return total, handshake, response.http_version
+
+    for name, make_client in (
+        ("每次新建连接", lambda: httpx.Client(timeout=30)),
+        ("共享连接池", lambda: get_http_client(base_url)),
+    ):
+        totals, handshakes, version = [], [], ""
+        for _ in range(rounds):
+            client = make_client()
+            try:
+                total, handshake, version = timed_request(client)
+            except Exception as e:
+                print(f"{name}: 请求失败 {e}")
+                break
+            finally:
+                if name == "每次新建连接":
+                    client.close()
+            totals.append(total * 1000)
+            handshakes.append(handshake * 1000)
+        if totals:
+            print(
+                f"{name}({version}): 平均请求 {format_duration(sum(totals) / len(totals))}，"
+                f"平均建连+TLS {format_duration(sum(handshakes) / len(handshakes))}"
+            )
+
+
+def bench_browser_probe(url: str, rounds: int = 3):
+    """浏览器观察基准：同一观察分别走快速观察(直接CDP)与浏览器代理(LLM)，对比耗时和token
+
+    两条路径共用同一个浏览器会话，会话启动不计入；代理路径的token取自本进程的 browser 角色 llm_call 事件。
+    """
+    from lib.executor import get_cdp_urls
+    from lib.tools import setup_tools
+    from lib.metrics import read_events, get_metrics_path
+
+    cases = {
+        "cookies": "读取当前页面的全部cookie",
+        "forms": "列出页面上所有表单及其输入字段",
+        "local_storage": "读取localStorage的全部内容",
+        "text": "获取页面的全部可见文本",
+    }
+    tools = setup_tools(cdp_urls=get_cdp_urls())
+    browser, probe = tools["browser"], tools["browser_probe"]
+
+    def browser_llm_usage(since: float):
+        calls = [
+            e for e in read_events(get_metrics_path(), ["llm_call"])
+            if e.get("role") == "browser" and e.get("pid") == os.getpid() and e.get("ts", 0) >= since
+        ]
+        return len(calls), sum((e.get("prompt_tokens") or 0) + (e.get("completion_tokens") or 0) for e in calls)
+
+    try:
+        # 预先启动会话并打开页面
+        probe.run(action="text", url=url)
+        for action, task in cases.items():
+            costs = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                probe.run(action=action, url=url)
+                costs.append((time.perf_counter() - start) * 1000)
+
+            since = time.time()
+            start = time.perf_counter()
+            browser.run(task_description=f"访问 {url} ，{task}", max_steps=5)
+            agent_cost = (time.perf_counter() - start) * 1000
+            calls, tokens = browser_llm_usage(since)
+            print(
+                f"{action}: 快速观察 平均 {format_duration(sum(costs) / len(costs))}，0 token；"
+                f"浏览器代理 {format_duration(agent_cost)}，{calls} 次LLM调用 {tokens} tokens"
+            )
+    finally:
+        browser.close_session()
+
+
+if __name__ == "__main__":
+    bench_cli_startup()
+    bench_llm_tls()
+    bench_executor_startup("http://127.0.0.1:8080/")
+    bench_browser_probe("http://127.0.0.1:8080/")
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+from cdp_use import CDPClient
+from pydantic import PrivateAttr
+from browser_use import BrowserSession
+import browser_use.browser.session as browser_session_module
+
+# 同一Chromium内多个隔离的浏览器上下文(类似无痕窗口)：每个任务独占一个上下文，
+# cookie/存储/标签页互不可见，多个任务共享一个浏览器实例。
+# browser_use 默认接管浏览器内的全部target，这里在CDP客户端层按 browserContextId 过滤。
+# 过滤依赖 cdp_use 的私有 _event_registry.handle_event（cdp_use 1.4.x），缺失时拒绝共享实例。
+
+logger = logging.getLogger("main")
+
+# 浏览器级命令：未指定上下文时作用于默认上下文，需补上本会话的 browserContextId
+CONTEXT_SCOPED_METHODS = (
+    "Target.createTarget",
+    "Storage.getCookies",
+    "Storage.setCookies",
+    "Storage.clearCookies",
+    "Browser.setDownloadBehavior",
+    "Browser.grantPermissions",
+    "Browser.resetPermissions",
+    "Browser.setPermission",
+)
+# 带 targetInfo 的target事件，其他上下文的直接丢弃
+TARGET_EVENTS = ("Target.attachedToTarget", "Target.targetCreated", "Target.targetInfoChanged")
+
+_browser_context_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("browser_context_id", default=None)
+
+
+def _wrap_handle_event(client: CDPClient, wrap: Callable[[Callable], Callable]) -> bool:
+    """替换客户端事件注册表的分发函数；cdp_use 版本不提供该私有接口时返回 False"""
+    registry = getattr(client, "_event_registry", None)
+    handle_event = getattr(registry, "handle_event", None)
+    if not callable(handle_event):
+        return False
+    registry.handle_event = wrap(handle_event)
+    return True
+
+
+class ScopedCDPClient(CDPClient):
+    """只看得到指定浏览器上下文的CDP客户端；创建时未设置上下文则直接返回普通 CDPClient"""
+
+    def __new__(cls, *args, **kwargs):
+        if not _browser_context_id.get():
+            return CDPClient(*args, **kwargs)
+        return super().__new__(cls)
+
+    def __init__(self, url: str, *args, **kwargs):
+        super().__init__(url, *args, **kwargs)
+        self.browser_context_id = _browser_context_id.get()
+
+        def wrap(handle_event):
+            async def scoped_handle_event(method: str, params: Any, session_id: Optional[str] = None) -> bool:
+                if method in TARGET_EVENTS and not self._owns(params.get("targetInfo") or {}):
+                    if method == "Target.attachedToTarget" and params.get("sessionId"):
+                        # 浏览器级自动附加会附加到其他上下文的target，立即分离
+                        asyncio.create_task(self._detach(params["sessionId"]))
+                    return True
+                return await handle_event(method, params, session_id)
+            return scoped_handle_event
+
+        if not _wrap_handle_event(self, wrap):
+            raise RuntimeError(
+                "当前 cdp_use 版本缺少 _event_registry.handle_event，无法按浏览器上下文过滤事件；"
+                "请设置 CDP_CONTEXTS_PER_INSTANCE=1 以独占实例运行"
+            )
+
+    def _owns(self, target_info: Dict[str, Any]) -> bool:
+        return target_info.get("browserContextId") == self.browser_context_id
+
+    async def _detach(self, session_id: str):
+        try:
+            await super().send_raw("Target.detachFromTarget", {"sessionId": session_id})
+        except Exception:
+            pass
+
+    async def send_raw(self, method: str, params: Optional[Any] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+        if not self.browser_context_id or session_id is not None:
+            return await super().send_raw(method, params, session_id)
+        if method == "Network.clearBrowserCookies":
+            # 浏览器级清cookie会清掉所有上下文，改为只清本上下文
+            method, params = "Storage.clearCookies", None
+        if method in CONTEXT_SCOPED_METHODS:
+            params = {"browserContextId": self.browser_context_id, **(params or {})}
+        result = await super().send_raw(method, params, session_id)
+        if method == "Target.getTargets":
+            result = {**result, "targetInfos": [t for t in result.get("targetInfos", []) if self._owns(t)]}
+        return result
+
+
+# browser_use 在 connect()/reconnect() 中按模块全局名创建CDP客户端，没有注入点：
+# 仅在 ContextBrowserSession 连接期间换成 ScopedCDPClient，其他会话此时创建的仍是普通 CDPClient
+_original_cdp_client = browser_session_module.CDPClient
+_patch_lock = threading.Lock()
+_patch_depth = 0
+
+
+@contextmanager
+def _scoped_cdp_client(browser_context_id: Optional[str]):
+    global _patch_depth
+    token = _browser_context_id.set(browser_context_id)
+    with _patch_lock:
+        if _patch_depth == 0:
+            browser_session_module.CDPClient = ScopedCDPClient
+        _patch_depth += 1
+    try:
+        yield
+    finally:
+        with _patch_lock:
+            _patch_depth -= 1
+            if _patch_depth == 0:
+                browser_session_module.CDPClient = _original_cdp_client
+        _browser_context_id.reset(token)
+
+
+class ContextBrowserSession(BrowserSession):
+    """限定在一个浏览器上下文内的 BrowserSession"""
+
+    _browser_context_id: Optional[str] = PrivateAttr(default=None)
+
+    def bind_context(self, browser_context_id: str) -> "ContextBrowserSession":
+        self._browser_context_id = browser_context_id
+        return self
+
+    async def connect(self, *args, **kwargs):
+        with _scoped_cdp_client(self._browser_context_id):
+            return await super().connect(*args, **kwargs)
+
+    async def reconnect(self, *args, **kwargs):
+        with _scoped_cdp_client(self._browser_context_id):
+            return await super().reconnect(*args, **kwargs)
+
+
+def tap_cdp_events(client: CDPClient, prefix: str, callback: Callable[[str, Dict[str, Any]], None]) -> bool:
+    """旁路监听CDP事件：不占用(也不会被覆盖)事件注册表中该事件唯一的处理函数
+
+    cdp_use 版本不提供事件注册表私有接口时不监听，记录警告并返回 False。
+    """
+    def wrap(handle_event):
+        async def tapped_handle_event(method: str, params: Any, session_id: Optional[str] = None) -> bool:
+            if method.startswith(prefix):
+                callback(method, params or {})
+            return await handle_event(method, params, session_id)
+        return tapped_handle_event
+
+    if not _wrap_handle_event(client, wrap):
+        logger.warning(f"当前 cdp_use 版本缺少 _event_registry.handle_event，跳过 {prefix} 事件监听")
+        return False
+    return True
+
+
+async def resolve_ws_url(cdp_url: str) -> str:
+    """http(s) 形式的CDP地址通过 /json/version 解析为浏览器websocket地址"""
+    if cdp_url.startswith("ws"):
+        return cdp_url
+    parsed = urlparse(cdp_url)
+    path = parsed.path.rstrip("/")
+    if not path.endswith("/json/version"):
+        path += "/json/version"
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.get(urlunparse(parsed._replace(path=path)))
+        return response.json()["webSocketDebuggerUrl"]
+
+
+class IsolatedBrowserContext:
+    """通过独立CDP连接创建的浏览器上下文
+
+    以 disposeOnDetach 创建：持有连接的进程退出(包括被pebble超时杀死)时，
+    Chromium 自动销毁该上下文及其标签页，不会遗留。
+    """
+
+    def __init__(self, cdp_url: str):
+        self.cdp_url = cdp_url
+        self.browser_context_id: Optional[str] = None
+        self._client: Optional[CDPClient] = None
+
+    async def create(self) -> str:
+        self._client = CDPClient(await resolve_ws_url(self.cdp_url))
+        await self._client.start()
+        try:
+            result = await self._client.send.Target.createBrowserContext(params={"disposeOnDetach": True})
+        except Exception:
+            await self._client.stop()
+            self._client = None
+            raise
+        self.browser_context_id = result["browserContextId"]
+        logger.info(f"✅ 创建隔离浏览器上下文: {self.browser_context_id} @ {self.cdp_url}")
+        return self.browser_context_id
+
+    async def dispose(self):
+        if self._client is None:
+            return
+        try:
+            if self.browser_context_id:
+                await self._client.send.Target.disposeBrowserContext(params={"browserContextId": self.browser_context_id})
+        except Exception as e:
+            logger.warning(f"销毁浏览器上下文失败(断开连接后由浏览器回收): {e}")
+        finally:
+            await self._client.stop()
+            self._client = None
+            self.browser_context_id = None
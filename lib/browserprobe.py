@@ -0,0 +1,173 @@
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from browser_use import BrowserSession
+
+from lib.metrics import record_event
+
+# 浏览器快速观察：在 BrowserTool 的现有会话上直接执行CDP命令，不经过浏览器LLM。
+# 读cookie/表单/存储/页面文本这类单步观察耗时毫秒级、不消耗token；
+# 点击、填写、多步流程仍交给 BrowserTool 的浏览器代理。
+
+PROBE_ACTIONS = ("cookies", "forms", "local_storage", "session_storage", "text", "links", "html")
+
+# 表单及表单外的独立输入框（含隐藏字段、当前值）
+FORMS_JS = """(() => {
+  const field = (el) => ({
+    tag: el.tagName.toLowerCase(), type: el.type || '', name: el.name || el.id || '',
+    value: el.type === 'password' ? '' : String(el.value ?? '').slice(0, 200),
+    placeholder: el.placeholder || '', required: !!el.required,
+    options: el.tagName === 'SELECT' ? Array.from(el.options).slice(0, 20).map(o => o.value) : undefined,
+  });
+  const forms = Array.from(document.forms).map((f, i) => ({
+    index: i, id: f.id || '', name: f.getAttribute('name') || '',
+    action: f.action || location.href, method: (f.getAttribute('method') || 'GET').toUpperCase(),
+    enctype: f.enctype || '', fields: Array.from(f.elements).filter(e => e.name || e.id).map(field),
+  }));
+  const loose = Array.from(document.querySelectorAll('input, textarea, select'))
+    .filter(e => !e.form && (e.name || e.id)).map(field);
+  return {url: location.href, forms, inputs: loose};
+})()"""
+
+STORAGE_JS = """(() => {
+  const store = window.%s;
+  const items = {};
+  for (let i = 0; i < store.length; i++) { const k = store.key(i); items[k] = store.getItem(k); }
+  return {url: location.href, items};
+})()"""
+
+TEXT_JS = "({url: location.href, title: document.title, text: document.body ? document.body.innerText : ''})"
+
+LINKS_JS = """(() => {
+  const uniq = (xs) => Array.from(new Set(xs.filter(Boolean)));
+  return {
+    url: location.href,
+    links: uniq(Array.from(document.querySelectorAll('a[href], area[href]')).map(a => a.href)),
+    forms: uniq(Array.from(document.forms).map(f => f.action)),
+    scripts: uniq(Array.from(document.scripts).map(s => s.src)),
+    frames: uniq(Array.from(document.querySelectorAll('iframe[src], frame[src]')).map(f => f.src)),
+    comments: (() => {
+      const out = [], walker = document.createTreeWalker(document, NodeFilter.SHOW_COMMENT);
+      while (walker.nextNode() && out.length < 20) out.push(walker.currentNode.nodeValue.trim().slice(0, 200));
+      return out;
+    })(),
+  };
+})()"""
+
+HTML_JS = "({url: location.href, html: document.documentElement ? document.documentElement.outerHTML : ''})"
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if max_chars and len(text) > max_chars:
+        return text[:max_chars] + f"\n...(已截断，共 {len(text)} 字符)"
+    return text
+
+
+async def _evaluate(browser: BrowserSession, expression: str) -> Any:
+    cdp_session = await browser.get_or_create_cdp_session()
+    result = await asyncio.wait_for(
+        cdp_session.cdp_client.send.Runtime.evaluate(
+            params={"expression": expression, "returnByValue": True, "awaitPromise": True},
+            session_id=cdp_session.session_id,
+        ),
+        timeout=10,
+    )
+    if result.get("exceptionDetails"):
+        details = result["exceptionDetails"]
+        raise RuntimeError((details.get("exception") or {}).get("description") or details.get("text", "页面脚本执行失败"))
+    return (result.get("result") or {}).get("value")
+
+
+async def _cookies(browser: BrowserSession) -> List[Dict[str, Any]]:
+    """当前页面可见的cookie（Network.getCookies 按页面URL过滤，含 HttpOnly）"""
+    cdp_session = await browser.get_or_create_cdp_session()
+    result = await asyncio.wait_for(
+        cdp_session.cdp_client.send.Network.getCookies(session_id=cdp_session.session_id),
+        timeout=10,
+    )
+    return result.get("cookies", [])
+
+
+def _format_cookies(cookies: List[Dict[str, Any]]) -> str:
+    if not cookies:
+        return "（当前页面没有cookie）"
+    lines = []
+    for c in cookies:
+        flags = [f for f, on in (("HttpOnly", c.get("httpOnly")), ("Secure", c.get("secure"))) if on]
+        if c.get("sameSite"):
+            flags.append(f"SameSite={c['sameSite']}")
+        lines.append(f"{c.get('name')}={c.get('value')}  [{c.get('domain')}{c.get('path', '')}] {' '.join(flags)}".rstrip())
+    return "\n".join(lines)
+
+
+def _format_forms(data: Dict[str, Any]) -> str:
+    lines = []
+    for form in data.get("forms", []):
+        lines.append(f"表单#{form['index']} {form['method']} {form['action']}" + (f" enctype={form['enctype']}" if form.get("enctype") else ""))
+        for f in form.get("fields", []):
+            lines.append(f"  - {_format_field(f)}")
+    if data.get("inputs"):
+        lines.append("表单外的输入框:")
+        lines += [f"  - {_format_field(f)}" for f in data["inputs"]]
+    return "\n".join(lines) or "（页面没有表单和输入框）"
+
+
+def _format_field(field: Dict[str, Any]) -> str:
+    text = f"{field['name']} ({field['tag']}{'/' + field['type'] if field.get('type') else ''})"
+    if field.get("value"):
+        text += f" = {field['value']}"
+    if field.get("placeholder"):
+        text += f" placeholder={field['placeholder']}"
+    if field.get("options"):
+        text += f" 选项: {', '.join(field['options'])}"
+    if field.get("required"):
+        text += " 必填"
+    return text
+
+
+def _format_links(data: Dict[str, Any]) -> str:
+    lines = []
+    for key, title in (("links", "链接"), ("forms", "表单提交地址"), ("scripts", "脚本"), ("frames", "框架"), ("comments", "HTML注释")):
+        if data.get(key):
+            lines.append(f"{title}({len(data[key])}):")
+            lines += [f"  {v}" for v in data[key][:100]]
+    return "\n".join(lines) or "（页面没有链接）"
+
+
+async def probe(browser: BrowserSession, action: str, url: Optional[str] = None, max_chars: int = 4000) -> str:
+    """在浏览器会话上执行一次快速观察，返回格式化文本
+
+    url 非空且与当前页面不同时先导航过去；不给 url 则观察浏览器代理当前所在页面。
+    """
+    if action not in PROBE_ACTIONS:
+        raise ValueError(f"不支持的操作: {action}，可选: {', '.join(PROBE_ACTIONS)}")
+    start = time.perf_counter()
+    if url and url.rstrip("/") != (await browser.get_current_page_url()).rstrip("/"):
+        await browser.navigate_to(url)
+
+    if action == "cookies":
+        body = _format_cookies(await _cookies(browser))
+        page = await browser.get_current_page_url()
+    elif action == "forms":
+        data = await _evaluate(browser, FORMS_JS) or {}
+        body, page = _format_forms(data), data.get("url", "")
+    elif action in ("local_storage", "session_storage"):
+        storage = "localStorage" if action == "local_storage" else "sessionStorage"
+        data = await _evaluate(browser, STORAGE_JS % storage) or {}
+        items = data.get("items") or {}
+        body = "\n".join(f"{k} = {v}" for k, v in items.items()) or f"（{storage} 为空）"
+        page = data.get("url", "")
+    elif action == "text":
+        data = await _evaluate(browser, TEXT_JS) or {}
+        body, page = f"标题: {data.get('title', '')}\n{data.get('text', '')}", data.get("url", "")
+    elif action == "links":
+        data = await _evaluate(browser, LINKS_JS) or {}
+        body, page = _format_links(data), data.get("url", "")
+    else:
+        data = await _evaluate(browser, HTML_JS) or {}
+        body, page = data.get("html", ""), data.get("url", "")
+
+    seconds = time.perf_counter() - start
+    record_event("browser_probe", action=action, seconds=round(seconds, 3), navigated=bool(url))
+    return f"[{action}] {page} ({seconds * 1000:.0f}ms)\n{_truncate(body, max_chars)}"
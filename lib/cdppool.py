@@ -1,7 +1,13 @@
 import logging
 import asyncio
-from typing import Dict, List, Any
-from contextlib import asynccontextmanager
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager, contextmanager
 
 class CDPConnectionPool:
     """CDP URL 连接池 - 线程安全"""
@@ -49,3 +55,227 @@ class CDPConnectionPool:
             "in_use": in_use_count,
             "urls": list(self.cdp_urls)
         }
+
+
+class CDPLeasePool:
+    """跨进程CDP浏览器租约池 - 基于SQLite文件锁
+
+    所有worker进程共享同一个租约库：任务首次需要浏览器时才租用空闲实例，
+    用完归还。持有者进程已退出（如被pebble超时杀死）的租约会被自动回收，
+    健康检查失败的实例在冷却期内不再分配。
+    每个实例有 slots 个租约位（CDP_CONTEXTS_PER_INSTANCE，默认1即独占）；
+    大于1时各租约在同一浏览器内使用独立的浏览器上下文，优先分配负载最低的实例。
+    """
+
+    def __init__(self, cdp_urls: List[str], db_path: str = None, unhealthy_cooldown: float = 30.0, slots: int = None):
+        self.cdp_urls = list(cdp_urls)
+        self.db_path = db_path or os.getenv("CDP_LEASE_DB", "logs/cdp_leases.db")
+        self.unhealthy_cooldown = unhealthy_cooldown
+        self.slots = max(1, slots if slots is not None else int(os.getenv("CDP_CONTEXTS_PER_INSTANCE", "1")))
+        self.logger = logging.getLogger("cdp.pool")
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            # 检查、删除、建表在同一个写事务内完成，多个进程同时启动时不会删掉对方刚建好的表
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(leases)")]
+                if columns and "slot" not in columns:
+                    # 旧版按实例独占的租约表，租约是临时状态，直接重建
+                    conn.execute("DROP TABLE leases")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS leases ("
+                    "cdp_url TEXT, slot INTEGER, owner_pid INTEGER, leased_at REAL, PRIMARY KEY (cdp_url, slot))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS health ("
+                    "cdp_url TEXT PRIMARY KEY, unhealthy_until REAL, released_at REAL)"
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None 以便手动 BEGIN IMMEDIATE 获取跨进程写锁
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _reclaim_stale(self, conn: sqlite3.Connection):
+        """回收持有者进程已退出的租约"""
+        for cdp_url, slot, owner_pid in conn.execute("SELECT cdp_url, slot, owner_pid FROM leases").fetchall():
+            if not self._pid_alive(owner_pid):
+                conn.execute("DELETE FROM leases WHERE cdp_url = ? AND slot = ?", (cdp_url, slot))
+                self.logger.warning(f"回收失效租约: {cdp_url}#{slot} (pid {owner_pid})")
+
+    def check_health(self, cdp_url: str, timeout: float = 2.0) -> bool:
+        """健康检查：确认实例端口可连接"""
+        parsed = urlparse(cdp_url)
+        port = parsed.port or (443 if parsed.scheme in ("wss", "https") else 80)
+        try:
+            with socket.create_connection((parsed.hostname, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def _try_acquire(self, urls: Optional[List[str]] = None) -> Optional[str]:
+        """尝试租用一个有空闲租约位且未处于冷却期的实例，优先负载最低、最久未使用的；urls 限定候选实例"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._reclaim_stale(conn)
+                used: Dict[str, set] = {}
+                for url, slot in conn.execute("SELECT cdp_url, slot FROM leases"):
+                    used.setdefault(url, set()).add(slot)
+                health = {
+                    row[0]: (row[1] or 0, row[2] or 0)
+                    for row in conn.execute("SELECT cdp_url, unhealthy_until, released_at FROM health")
+                }
+                candidates = [
+                    url for url in (urls or self.cdp_urls)
+                    if len(used.get(url, ())) < self.slots and health.get(url, (0, 0))[0] <= now
+                ]
+                if not candidates:
+                    conn.execute("COMMIT")
+                    return None
+                cdp_url = min(candidates, key=lambda url: (len(used.get(url, ())), health.get(url, (0, 0))[1]))
+                slot = min(set(range(self.slots)) - used.get(cdp_url, set()))
+                conn.execute(
+                    "INSERT INTO leases (cdp_url, slot, owner_pid, leased_at) VALUES (?, ?, ?, ?)",
+                    (cdp_url, slot, os.getpid(), now)
+                )
+                conn.execute("COMMIT")
+                return cdp_url
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _mark_unhealthy(self, cdp_url: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO health (cdp_url, unhealthy_until, released_at) VALUES (?, ?, 0) "
+                "ON CONFLICT(cdp_url) DO UPDATE SET unhealthy_until = excluded.unhealthy_until",
+                (cdp_url, time.time() + self.unhealthy_cooldown)
+            )
+
+    def acquire(self, timeout: float = 300.0, poll_interval: float = 1.0) -> str:
+        """阻塞租用一个健康的CDP URL，超时抛出 TimeoutError"""
+        deadline = time.time() + timeout
+        while True:
+            cdp_url = self._try_acquire()
+            if cdp_url is not None:
+                if self.check_health(cdp_url):
+                    self.logger.info(f"租用CDP URL: {cdp_url} (pid {os.getpid()})")
+                    return cdp_url
+                self.logger.warning(f"CDP实例健康检查失败，冷却{self.unhealthy_cooldown:.0f}s: {cdp_url}")
+                self._mark_unhealthy(cdp_url)
+                self.release(cdp_url)
+                continue
+            if time.time() >= deadline:
+                raise TimeoutError(f"{timeout:.0f}s内没有可用的CDP浏览器实例")
+            time.sleep(poll_interval)
+
+    def try_acquire(self, cdp_url: str, exclusive: bool = False) -> bool:
+        """非阻塞租用指定实例的一个租约位（不做健康检查），成功返回 True
+
+        exclusive: 仅在实例完全空闲时租用，并占满全部租约位（如重建浏览器会话前）
+        """
+        if not exclusive:
+            return self._try_acquire([cdp_url]) is not None
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._reclaim_stale(conn)
+                if conn.execute("SELECT 1 FROM leases WHERE cdp_url = ? LIMIT 1", (cdp_url,)).fetchone():
+                    conn.execute("COMMIT")
+                    return False
+                now = time.time()
+                conn.executemany(
+                    "INSERT INTO leases (cdp_url, slot, owner_pid, leased_at) VALUES (?, ?, ?, ?)",
+                    [(cdp_url, slot, os.getpid(), now) for slot in range(self.slots)]
+                )
+                conn.execute("COMMIT")
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def read_live_leases(self, conn: sqlite3.Connection) -> Dict[str, List[int]]:
+        """在调用方已开启的写事务内回收失效租约并读取有效租约，便于与同库其他表一致读取"""
+        self._reclaim_stale(conn)
+        leases: Dict[str, List[int]] = {}
+        for url, owner_pid in conn.execute("SELECT cdp_url, owner_pid FROM leases"):
+            leases.setdefault(url, []).append(owner_pid)
+        return leases
+
+    def live_leases(self) -> Dict[str, List[int]]:
+        """当前有效租约 {cdp_url: [持有者pid]}（先回收已退出进程的租约）"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                leases = self.read_live_leases(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return leases
+
+    def release(self, cdp_url: str, all_slots: bool = False):
+        """归还租约（仅归还本进程持有的一个租约位；all_slots 时归还本进程在该实例上的全部租约位）"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if all_slots:
+                conn.execute("DELETE FROM leases WHERE cdp_url = ? AND owner_pid = ?", (cdp_url, os.getpid()))
+            else:
+                conn.execute(
+                    "DELETE FROM leases WHERE rowid IN (SELECT rowid FROM leases WHERE cdp_url = ? AND owner_pid = ? LIMIT 1)",
+                    (cdp_url, os.getpid())
+                )
+            conn.execute(
+                "INSERT INTO health (cdp_url, unhealthy_until, released_at) VALUES (?, 0, ?) "
+                "ON CONFLICT(cdp_url) DO UPDATE SET released_at = excluded.released_at",
+                (cdp_url, time.time())
+            )
+            conn.execute("COMMIT")
+        self.logger.info(f"归还CDP URL: {cdp_url}")
+
+    @contextmanager
+    def lease(self, timeout: float = 300.0):
+        """租约上下文管理器"""
+        cdp_url = self.acquire(timeout=timeout)
+        try:
+            yield cdp_url
+        finally:
+            self.release(cdp_url)
+
+    def get_pool_status(self) -> Dict[str, Any]:
+        """获取租约池状态"""
+        with self._connect() as conn:
+            leases: Dict[str, List[int]] = {}
+            for url, owner_pid in conn.execute("SELECT cdp_url, owner_pid FROM leases"):
+                leases.setdefault(url, []).append(owner_pid)
+            unhealthy = [
+                row[0] for row in conn.execute(
+                    "SELECT cdp_url FROM health WHERE unhealthy_until > ?", (time.time(),)
+                )
+            ]
+        return {
+            "total_urls": len(self.cdp_urls),
+            "slots": self.slots,
+            "available": sum(
+                max(0, self.slots - len(leases.get(url, []))) for url in self.cdp_urls if url not in unhealthy
+            ),
+            "in_use": sum(len(leases.get(url, [])) for url in self.cdp_urls),
+            "unhealthy": unhealthy,
+            "leases": leases,
+            "urls": list(self.cdp_urls)
+        }
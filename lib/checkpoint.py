@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from lib.logger import get_logger
+
+# 阶段 -> (负责的agent, 中文名)，用于断点续跑时跳过已完成阶段
+PHASES = {
+    "recon": ("quick_scout", "侦察"),
+    "hunt": ("opportunistic_hunter", "漏洞验证"),
+    "exploit": ("ctf_exploiter", "利用"),
+}
+AGENT_PHASE = {agent_key: phase for phase, (agent_key, _) in PHASES.items()}
+
+URL_PATTERN = re.compile(r"https?://[^\s'\"<>()\[\]{}]+")
+PATH_PATTERN = re.compile(r"(?<![\w/])/[\w\-.]+(?:/[\w\-.]+)*\.(?:php|jsp|asp|aspx|html|js|json|txt|bak|zip|git|env)\b")
+PARAM_PATTERN = re.compile(r"[?&]([A-Za-z_][\w\-]{0,40})=")
+VULN_KEYWORDS = (
+    "SQL注入", "命令注入", "XSS", "SSTI", "模板注入", "文件包含", "LFI", "RFI", "SSRF", "XXE",
+    "反序列化", "文件上传", "目录遍历", "路径遍历", "越权", "IDOR", "弱口令", "未授权", "源码泄露", "JWT",
+)
+VULN_CONFIRM = ("确认", "存在", "成功", "可利用", "vulnerable", "confirmed")
+# 记录payload的工具（其输入即为有效载荷）
+PAYLOAD_TOOLS = ("RawHttpTool", "SQLMapTool", "SandboxExec", "BrowserTool")
+
+MAX_ITEMS = 50
+MAX_TEXT = 1500
+
+
+def get_checkpoint_dir() -> Path:
+    return Path(os.getenv("CHECKPOINT_DIR", "logs/checkpoints"))
+
+
+def _truncate(text: str, limit: int = MAX_TEXT) -> str:
+    text = str(text or "").strip()
+    return text if len(text) <= limit else text[:limit] + "...(截断)"
+
+
+def _add_unique(items: List[str], values, limit: int = MAX_ITEMS):
+    for v in values:
+        v = str(v).strip().rstrip(".,;:，。；")
+        if v and v not in items and len(items) < limit:
+            items.append(v)
+
+
+class ChallengeCheckpoint:
+    """单题断点 - 持久化结构化发现(端点/参数/漏洞/payload/已完成阶段)
+
+    存储为 logs/checkpoints/<target_key>.json，原子写入；
+    进程被 pebble 超时强杀时，最近一次落盘的进度仍可用于续跑。
+    """
+
+    def __init__(self, target_key: str, save_interval: float = None):
+        safe_key = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in target_key)
+        self.path = get_checkpoint_dir() / f"{safe_key}.json"
+        self.save_interval = save_interval if save_interval is not None else float(os.getenv("CHECKPOINT_INTERVAL", "10"))
+        self.logger = get_logger("checkpoint")
+        self.data: Dict[str, Any] = self._load()
+        self._dirty = False
+        self._last_save = 0.0
+
+    def _empty(self) -> Dict[str, Any]:
+        return {"runs": 0, "updated_at": None, "endpoints": [], "params": [], "vulns": [], "payloads": [], "phases": {}}
+
+    def _load(self) -> Dict[str, Any]:
+        data = self._empty()
+        try:
+            if self.path.exists():
+                data.update(json.loads(self.path.read_text(encoding="utf-8")))
+        except Exception as e:
+            self.logger.warning(f"读取断点失败，忽略: {self.path} - {e}")
+        return data
+
+    @property
+    def has_progress(self) -> bool:
+        d = self.data
+        return bool(d["endpoints"] or d["params"] or d["vulns"] or d["payloads"] or d["phases"])
+
+    @property
+    def findings_count(self) -> int:
+        """已发现的端点/参数/漏洞总数，用于判断是否有新进展"""
+        d = self.data
+        return len(d["endpoints"]) + len(d["params"]) + len(d["vulns"])
+
+    def start_run(self):
+        """新一轮执行开始（在 to_prompt 之后调用）"""
+        self.data["runs"] = int(self.data.get("runs", 0)) + 1
+        self._dirty = True
+        self.save(force=True)
+
+    def _extract(self, text: str):
+        _add_unique(self.data["endpoints"], URL_PATTERN.findall(text) + PATH_PATTERN.findall(text))
+        _add_unique(self.data["params"], PARAM_PATTERN.findall(text))
+        for line in text.splitlines():
+            if any(k.lower() in line.lower() for k in VULN_KEYWORDS) and any(c in line for c in VULN_CONFIRM):
+                _add_unique(self.data["vulns"], [_truncate(line, 300)])
+
+    def record_step(self, step_output: Any, agent_key: Optional[str] = None):
+        """记录agent步骤(AgentAction/AgentFinish)"""
+        tool = getattr(step_output, "tool", None)
+        if tool is not None:
+            tool_input = str(getattr(step_output, "tool_input", "") or "")
+            self._extract(tool_input)
+            self._extract(str(getattr(step_output, "result", "") or ""))
+            if any(t.lower() in str(tool).lower() for t in PAYLOAD_TOOLS):
+                _add_unique(self.data["payloads"], [f"{tool}: {_truncate(tool_input, 500)}"])
+        else:
+            output = str(getattr(step_output, "output", "") or getattr(step_output, "raw", "") or step_output)
+            self._extract(output)
+            phase = AGENT_PHASE.get(agent_key or "")
+            if phase:
+                # worker给出最终答案即视为该阶段完成
+                self.data["phases"][phase] = _truncate(output)
+        self._dirty = True
+        self.save()
+
+    def record_task(self, task_output: Any):
+        """记录任务输出(TaskOutput)并立即落盘"""
+        self._extract(str(getattr(task_output, "raw", "") or task_output))
+        self._dirty = True
+        self.save(force=True)
+
+    def save(self, force: bool = False):
+        """按间隔落盘；force 时立即写入"""
+        if not self._dirty:
+            return
+        now = time.time()
+        if not force and now - self._last_save < self.save_interval:
+            return
+        self.data["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._last_save = now
+        except Exception as e:
+            self.logger.warning(f"写入断点失败: {self.path} - {e}")
+
+    def clear(self):
+        """解题成功后删除断点"""
+        try:
+            self.path.unlink(missing_ok=True)
+        except Exception as e:
+            self.logger.warning(f"删除断点失败: {self.path} - {e}")
+        self.data = self._empty()
+        self._dirty = False
+
+    def to_prompt(self) -> str:
+        """生成续跑上下文，注入任务描述；无进度时返回空串"""
+        if not self.has_progress:
+            return ""
+        d = self.data
+        lines = [f"此前已执行 {max(int(d.get('runs', 0)), 1)} 轮未完成，以下为已确认的进度，直接在此基础上继续："]
+        if d["phases"]:
+            done = "、".join(PHASES[p][1] for p in PHASES if p in d["phases"])
+            lines.append(f"- 已完成阶段: {done}（不要重复委托已完成阶段，从下一阶段开始）")
+            for phase, (_, name) in PHASES.items():
+                if phase in d["phases"]:
+                    lines.append(f"  [{name}结论] {d['phases'][phase]}")
+        if d["endpoints"]:
+            lines.append(f"- 已发现端点: {', '.join(d['endpoints'][:30])}")
+        if d["params"]:
+            lines.append(f"- 已发现参数: {', '.join(d['params'][:30])}")
+        if d["vulns"]:
+            lines.append("- 已确认漏洞线索:")
+            lines.extend(f"  • {v}" for v in d["vulns"][:15])
+        if d["payloads"]:
+            lines.append("- 已尝试的payload(避免重复):")
+            lines.extend(f"  • {p}" for p in d["payloads"][-15:])
+        return "\n".join(lines)
@@ -0,0 +1,395 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import socket
+import ipaddress
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+from lib.logger import get_logger
+from lib.executor import PebbleCTFExecutor, get_cdp_urls
+
+HEARTBEAT_INTERVAL = float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", "10"))
+HEARTBEAT_TIMEOUT = float(os.getenv("CLUSTER_HEARTBEAT_TIMEOUT", "45"))
+MAX_REQUEUE = int(os.getenv("CLUSTER_MAX_REQUEUE", "3"))
+# 单个worker上报的槽位上限
+MAX_SLOTS = int(os.getenv("CLUSTER_MAX_SLOTS", "64"))
+
+
+class WorkerLost(Exception):
+    """worker失联且任务重排次数耗尽"""
+
+
+def parse_address(address: str, default_host: str = "127.0.0.1") -> Tuple[str, int]:
+    """解析 host:port 或 :port"""
+    host, _, port = address.rpartition(":")
+    return host or default_host, int(port)
+
+
+def is_loopback(host: str) -> bool:
+    """是否为本机回环地址"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_slots(value: Any, default: int) -> int:
+    """解析worker上报的槽位数（来自网络，不可信）：无法解析时沿用 default，并限制在 [1, MAX_SLOTS]"""
+    try:
+        slots = int(value)
+    except (TypeError, ValueError, OverflowError):
+        slots = default
+    return min(max(1, slots), MAX_SLOTS)
+
+
+def send_message(sock: socket.socket, lock: threading.Lock, message: Dict[str, Any]):
+    """发送一行JSON消息"""
+    data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+
+class _WorkerConn:
+    """协调器侧的worker连接状态"""
+
+    def __init__(self, worker_id: str, sock: socket.socket, slots: int):
+        self.worker_id = worker_id
+        self.sock = sock
+        self.slots = slots
+        self.running: set = set()
+        self.last_seen = time.time()
+        self.write_lock = threading.Lock()
+        self.alive = True
+
+    @property
+    def free_slots(self) -> int:
+        return self.slots - len(self.running)
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    """每个worker一条长连接，按行收发JSON"""
+
+    def handle(self):
+        coordinator: "ClusterCTFExecutor" = self.server.coordinator
+        conn: Optional[_WorkerConn] = None
+        try:
+            for raw in self.rfile:
+                try:
+                    message = json.loads(raw.decode("utf-8"))
+                except ValueError:
+                    continue
+                if conn is None:
+                    conn = coordinator._register(self.request, message)
+                    if conn is None:
+                        return
+                else:
+                    coordinator._on_message(conn, message)
+        except OSError:
+            pass
+        finally:
+            if conn is not None:
+                coordinator._drop_worker(conn, "连接断开")
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ClusterCTFExecutor(PebbleCTFExecutor):
+    """多机协调器 - 与 PebbleCTFExecutor 接口一致，任务经TCP分发给远程worker
+
+    协议为换行分隔的JSON：worker连接后发送 hello(声明槽位数)，之后定期 heartbeat；
+    协调器向有空闲槽位的worker推送 job，worker执行完回传 result。
+    worker连接断开或心跳超时，其执行中的任务重新排队（最多 MAX_REQUEUE 次）。
+    只写端口(:9700)时仅监听本机；监听其他地址必须设置 CLUSTER_TOKEN，hello 中的令牌不符即拒绝连接。
+    """
+
+    def __init__(self, listen: str, token: Optional[str] = None):
+        self.logger = get_logger("cluster")
+        self.token = token if token is not None else os.getenv("CLUSTER_TOKEN", "")
+        host, port = parse_address(listen)
+        if not self.token and not is_loopback(host):
+            raise ValueError(f"协调器监听非本机地址 {host} 时必须设置 CLUSTER_TOKEN")
+        # cdp_urls 由各worker使用自己的配置，这里仅用于构造任务数据
+        self.cdp_urls = []
+        self._lock = threading.RLock()
+        self._workers: Dict[str, _WorkerConn] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._pending: deque = deque()
+        self._closed = threading.Event()
+
+        self.server = _CoordinatorServer((host, port), _CoordinatorHandler)
+        self.server.coordinator = self
+        self.address = self.server.server_address
+        threading.Thread(target=self.server.serve_forever, name="cluster-server", daemon=True).start()
+        threading.Thread(target=self._reap_loop, name="cluster-reaper", daemon=True).start()
+        self.logger.info(f"多机协调器已启动 - 监听: {self.address[0]}:{self.address[1]}")
+
+    @property
+    def max_workers(self) -> int:
+        """当前在线worker的总槽位数（至少为1，worker上线前任务先排队）"""
+        with self._lock:
+            return max(1, sum(w.slots for w in self._workers.values()))
+
+    def admission_limit(self) -> int:
+        """多机模式下并发由各worker的槽位决定"""
+        return self.max_workers
+
+    # ---- 任务提交 ----
+
+    def schedule_task_data(self, task_data: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"task_data": task_data, "future": future, "worker": None, "attempts": 0}
+            self._pending.append(job_id)
+        future.add_done_callback(lambda f, job_id=job_id: self._on_future_done(job_id, f))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """把排队任务推送给有空闲槽位的worker"""
+        with self._lock:
+            while self._pending:
+                worker = max(self._workers.values(), key=lambda w: w.free_slots, default=None)
+                if worker is None or worker.free_slots <= 0:
+                    return
+                job_id = self._pending.popleft()
+                job = self._jobs.get(job_id)
+                if job is None or job["future"].done():
+                    continue
+                job["worker"] = worker.worker_id
+                job["attempts"] += 1
+                worker.running.add(job_id)
+                try:
+                    send_message(worker.sock, worker.write_lock, {"type": "job", "job_id": job_id, "task_data": job["task_data"]})
+                except OSError as e:
+                    worker.running.discard(job_id)
+                    job["worker"] = None
+                    self._pending.appendleft(job_id)
+                    self._drop_worker(worker, f"发送任务失败: {e}")
+                    continue
+                self.logger.info(f"分发任务: {job['task_data'].get('code')} -> {worker.worker_id}")
+
+    def _on_future_done(self, job_id: str, future: Future):
+        """future被取消(抢占)时通知worker终止任务"""
+        if not future.cancelled():
+            return
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            worker = self._workers.get(job["worker"]) if job and job["worker"] else None
+            if worker is not None:
+                worker.running.discard(job_id)
+        if worker is not None:
+            try:
+                send_message(worker.sock, worker.write_lock, {"type": "cancel", "job_id": job_id})
+            except OSError:
+                pass
+        self._dispatch()
+
+    # ---- worker 连接 ----
+
+    def _register(self, sock: socket.socket, message: Dict[str, Any]) -> Optional[_WorkerConn]:
+        if message.get("type") != "hello" or not hmac.compare_digest(
+            str(message.get("token") or "").encode("utf-8"), self.token.encode("utf-8")
+        ):
+            self.logger.warning(f"拒绝worker连接: {sock.getpeername()}")
+            return None
+        worker_id = str(message.get("worker_id") or uuid.uuid4().hex[:8])
+        conn = _WorkerConn(worker_id, sock, parse_slots(message.get("slots"), 1))
+        with self._lock:
+            old = self._workers.get(worker_id)
+        if old is not None:
+            self._drop_worker(old, "同名worker重新连接")
+        with self._lock:
+            self._workers[worker_id] = conn
+        self.logger.info(f"worker上线: {worker_id} ({sock.getpeername()[0]}) 槽位: {conn.slots}")
+        self._dispatch()
+        return conn
+
+    def _on_message(self, conn: _WorkerConn, message: Dict[str, Any]):
+        conn.last_seen = time.time()
+        if message.get("type") == "heartbeat":
+            # worker的自适应并发上限随心跳更新
+            if "slots" in message:
+                conn.slots = parse_slots(message["slots"], conn.slots)
+                self._dispatch()
+            return
+        if message.get("type") != "result":
+            return
+        job_id = message.get("job_id")
+        with self._lock:
+            conn.running.discard(job_id)
+            job = self._jobs.get(job_id)
+            # 仅接受当前负责该任务的worker的结果（失联后重排的任务可能被重复执行）
+            if job is None or job["worker"] != conn.worker_id:
+                job = None
+            else:
+                del self._jobs[job_id]
+        if job is not None:
+            result = message.get("result") or (job["task_data"]["url"], False, "执行异常: 结果为空")
+            self._resolve(job["future"], result=tuple(result))
+        self._dispatch()
+
+    @staticmethod
+    def _resolve(future: Future, result=None, exception: Exception = None):
+        """设置future结果；与取消并发时忽略"""
+        if future.done():
+            return
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except Exception:
+            pass
+
+    def _drop_worker(self, conn: _WorkerConn, reason: str):
+        """worker失联：关闭连接并把其执行中的任务重新排队"""
+        failed = []
+        with self._lock:
+            if not conn.alive:
+                return
+            conn.alive = False
+            if self._workers.get(conn.worker_id) is conn:
+                del self._workers[conn.worker_id]
+            for job_id in list(conn.running):
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job["worker"] = None
+                if job["attempts"] >= MAX_REQUEUE:
+                    del self._jobs[job_id]
+                    failed.append(job)
+                else:
+                    self._pending.appendleft(job_id)
+            requeued = len(conn.running) - len(failed)
+            conn.running.clear()
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+        self.logger.warning(f"worker下线: {conn.worker_id} - {reason}，重新排队 {requeued} 个任务")
+        for job in failed:
+            self._resolve(job["future"], exception=WorkerLost(f"worker失联且已重试{MAX_REQUEUE}次"))
+        self._dispatch()
+
+    def _reap_loop(self):
+        """心跳超时检测"""
+        while not self._closed.wait(HEARTBEAT_INTERVAL):
+            deadline = time.time() - HEARTBEAT_TIMEOUT
+            with self._lock:
+                stale = [w for w in self._workers.values() if w.last_seen < deadline]
+            for worker in stale:
+                self._drop_worker(worker, "心跳超时")
+
+    def close(self):
+        self.logger.info("关闭多机协调器...")
+        self._closed.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.sock.close()
+            except OSError:
+                pass
+
+
+class ClusterWorker:
+    """worker守护进程 - 连接协调器，用本机的Pebble进程池和CDP浏览器执行任务
+
+    executor 可替换为任何提供 cdp_urls/admission_limit/schedule_task_data/collect_result 的本地执行器（测试用）。
+    """
+
+    def __init__(self, coordinator: str, max_concurrent: int = 1, worker_id: Optional[str] = None, token: Optional[str] = None,
+                 executor: Optional[PebbleCTFExecutor] = None):
+        self.address = parse_address(coordinator)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.token = token if token is not None else os.getenv("CLUSTER_TOKEN", "")
+        self.logger = get_logger("cluster")
+        # 本机子进程共享同一组记忆初始化标记
+        os.environ.setdefault("CTF_RUN_ID", str(os.getpid()))
+        self.executor = executor or PebbleCTFExecutor(get_cdp_urls(), max_concurrent=max_concurrent)
+        self.running: Dict[str, Any] = {}
+        self._sock: Optional[socket.socket] = None
+        self._write_lock = threading.Lock()
+
+    def _send(self, message: Dict[str, Any]):
+        sock = self._sock
+        if sock is None:
+            return
+        try:
+            send_message(sock, self._write_lock, message)
+        except OSError as e:
+            self.logger.warning(f"发送消息失败: {e}")
+
+    def _heartbeat_loop(self, sock: socket.socket):
+        while self._sock is sock:
+            self._send({"type": "heartbeat", "running": list(self.running), "slots": self.executor.admission_limit()})
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def _on_job(self, job_id: str, task_data: Dict[str, Any]):
+        # 使用本机的浏览器
+        task_data = dict(task_data, cdp_urls=self.executor.cdp_urls)
+        item = {"url": task_data["url"], "code": task_data.get("code")}
+        future = self.executor.schedule_task_data(task_data)
+        self.running[job_id] = future
+        self.logger.info(f"接收任务: {item['code']} - {item['url']}")
+
+        def _done(f, job_id=job_id, item=item):
+            if self.running.pop(job_id, None) is None or f.cancelled():
+                return
+            result = self.executor.collect_result(f, item)
+            self._send({"type": "result", "job_id": job_id, "result": list(result)})
+
+        future.add_done_callback(_done)
+
+    def _cancel_all(self):
+        for job_id, future in list(self.running.items()):
+            self.running.pop(job_id, None)
+            future.cancel()
+
+    def _serve(self, sock: socket.socket):
+        self._sock = sock
+        self._send({"type": "hello", "worker_id": self.worker_id, "slots": self.executor.admission_limit(), "token": self.token})
+        threading.Thread(target=self._heartbeat_loop, args=(sock,), daemon=True).start()
+        self.logger.info(f"已连接协调器 {self.address[0]}:{self.address[1]} - worker: {self.worker_id}，槽位: {self.executor.admission_limit()}")
+        for raw in sock.makefile("rb"):
+            try:
+                message = json.loads(raw.decode("utf-8"))
+            except ValueError:
+                continue
+            if message.get("type") == "job":
+                self._on_job(message["job_id"], message["task_data"])
+            elif message.get("type") == "cancel":
+                future = self.running.pop(message.get("job_id"), None)
+                if future is not None:
+                    self.logger.info(f"协调器取消任务: {message.get('job_id')}")
+                    future.cancel()
+
+    def run(self):
+        """常驻运行，断线后自动重连（不会返回）"""
+        while True:
+            try:
+                with socket.create_connection(self.address, timeout=10) as sock:
+                    sock.settimeout(None)
+                    self._serve(sock)
+                self.logger.warning("与协调器的连接已关闭")
+            except OSError as e:
+                self.logger.warning(f"连接协调器失败: {e}")
+            finally:
+                self._sock = None
+                # 协调器会把断线worker的任务重新排队，本地任务不再需要
+                self._cancel_all()
+            time.sleep(5)
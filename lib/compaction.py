@@ -0,0 +1,181 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.logger import get_logger
+from lib.metrics import record_event
+from lib.ratelimit import estimate_tokens
+from lib.checkpoint import URL_PATTERN, PATH_PATTERN, PARAM_PATTERN, VULN_KEYWORDS
+from lib.utils import find_flags
+
+OBSERVATION_MARK = "Observation:"
+COMPACTED_MARK = "[已压缩"
+STATUS_PATTERN = re.compile(r"\bHTTP/[\d.]+\s+\d{3}[^\r\n]*|(?:状态码|status(?:_code)?)\s*[:=：]\s*\d{3}", re.IGNORECASE)
+REF_PATTERN = re.compile(r"^\[R\d+\]")
+ACTION_PATTERN = re.compile(r"Action:\s*([^\n]+)")
+ACTION_INPUT_PATTERN = re.compile(r"Action Input:\s*(.+)", re.DOTALL)
+
+
+def _unique(values, limit: int) -> List[str]:
+    items: List[str] = []
+    for v in values:
+        v = str(v).strip().rstrip(".,;:，。；")
+        if v and v not in items:
+            items.append(v)
+        if len(items) >= limit:
+            break
+    return items
+
+
+def _one_line(text: str, limit: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class ConversationCompactor:
+    """对话压缩 - prompt 超过阈值后，把较早的工具观察结果替换为结构化摘要
+
+    在每次LLM调用前(before_llm_call钩子)检查当前agent的消息列表：
+    - 估算token超过 COMPACT_TOKEN_THRESHOLD（默认12000）才压缩，一次从最早的观察结果开始
+      批量压缩到低水位 threshold*COMPACT_LOW_WATER（默认0.6）
+    - 首条system/任务消息和最近 COMPACT_KEEP_RECENT 条（默认4）保持原样
+    - 较早的观察结果只保留状态行、端点、参数、漏洞线索、flag和结果开头，丢弃原始响应体；
+      Thought/Action/Action Input 原样保留，即已尝试的payload仍可见
+
+    改写prompt中段会使提供商的前缀缓存从该处失效，因此按批压缩：压缩一次后prompt需再增长
+    (threshold - 低水位)才会再次改写（压不到低水位时以压缩后的大小为起点），而不是每步改写一条。
+    压缩直接修改消息内容（执行器复用同一列表），已压缩的消息不会重复处理；
+    每次压缩记录 compaction 指标事件（压缩前后token数、前缀缓存失效的token数），便于统计得失。
+    """
+
+    def __init__(self, threshold: int = None, keep_recent: int = None, min_chars: int = None, snippet_chars: int = None,
+                 low_water: float = None):
+        self.threshold = threshold if threshold is not None else int(os.getenv("COMPACT_TOKEN_THRESHOLD", "12000"))
+        self.low_water = low_water if low_water is not None else float(os.getenv("COMPACT_LOW_WATER", "0.6"))
+        self.keep_recent = keep_recent if keep_recent is not None else int(os.getenv("COMPACT_KEEP_RECENT", "4"))
+        self.min_chars = min_chars if min_chars is not None else int(os.getenv("COMPACT_MIN_CHARS", "600"))
+        self.snippet_chars = snippet_chars if snippet_chars is not None else int(os.getenv("COMPACT_SNIPPET_CHARS", "200"))
+        self.logger = get_logger("compaction")
+        self.saved_tokens = 0
+        self.invalidated_tokens = 0
+        self.compactions = 0
+        # 各agent当前对话下次触发压缩的token数：{role: (消息列表id, 压缩时的消息条数, 触发线)}
+        self._next_trigger: Dict[str, Tuple[int, int, int]] = {}
+
+    def reset(self):
+        """新题开始时清零统计"""
+        self.saved_tokens = 0
+        self.invalidated_tokens = 0
+        self.compactions = 0
+        self._next_trigger = {}
+
+    def _trigger(self, messages: List[Dict[str, Any]], role: str) -> int:
+        """当前对话的触发线；同一角色再次委派/执行新任务时是新的消息列表(或条数变少)，重新从阈值开始"""
+        record = self._next_trigger.get(role)
+        if record is None or record[0] != id(messages) or len(messages) < record[1]:
+            return self.threshold
+        return max(self.threshold, record[2])
+
+    def summarize(self, observation: str, action: str = "") -> str:
+        """把一条观察结果压缩为结构化摘要"""
+        text = str(observation or "").strip()
+        lines = [f"{COMPACTED_MARK}，原 {len(text)} 字符]"]
+        ref = REF_PATTERN.match(text)
+        if ref:
+            # 保留响应编号，后续 diff 引用 [Rk] 时仍能对应
+            lines[0] = f"{ref.group(0)} {lines[0]}"
+        if action:
+            lines.append(f"- 操作: {_one_line(action, 300)}")
+        status = _unique(STATUS_PATTERN.findall(text), 3)
+        if status:
+            lines.append(f"- 状态: {' | '.join(status)}")
+        endpoints = _unique(URL_PATTERN.findall(text) + PATH_PATTERN.findall(text), 15)
+        if endpoints:
+            lines.append(f"- 端点: {', '.join(endpoints)}")
+        params = _unique(PARAM_PATTERN.findall(text), 15)
+        if params:
+            lines.append(f"- 参数: {', '.join(params)}")
+        clues = _unique(
+            (_one_line(line, 200) for line in text.splitlines() if any(k.lower() in line.lower() for k in VULN_KEYWORDS)), 5
+        )
+        if clues:
+            lines.append("- 线索: " + " / ".join(clues))
+        flags = find_flags(text)
+        if flags:
+            lines.append(f"- Flag: {', '.join(_unique(flags, 3))}")
+        lines.append(f"- 结果: {_one_line(text[ref.end() if ref else 0:], self.snippet_chars)}")
+        return "\n".join(lines)
+
+    def _compact_content(self, content: str, role: str) -> Optional[str]:
+        """返回压缩后的内容；无需压缩时返回 None"""
+        if role == "tool":
+            head, observation = "", content
+        else:
+            at = content.find(OBSERVATION_MARK)
+            if at < 0:
+                return None
+            head, observation = content[:at], content[at + len(OBSERVATION_MARK):]
+        if COMPACTED_MARK in observation[:80] or len(observation) < self.min_chars:
+            return None
+        action = ""
+        match = ACTION_PATTERN.search(head)
+        if match:
+            action = match.group(1).strip()
+            input_match = ACTION_INPUT_PATTERN.search(head)
+            if input_match:
+                action = f"{action} {input_match.group(1).strip()}"
+        summary = self.summarize(observation, action)
+        return summary if role == "tool" else f"{head}{OBSERVATION_MARK} {summary}"
+
+    def compact(self, messages: List[Dict[str, Any]], role: str = "") -> int:
+        """超过触发线时从最早的观察结果开始原地压缩到低水位，返回节省的token估算值"""
+        if not messages or len(messages) <= self.keep_recent + 1:
+            return 0
+        before = estimate_tokens(messages)
+        if before <= self._trigger(messages, role):
+            return 0
+
+        target = int(self.threshold * self.low_water)
+        current = before
+        changed = 0
+        first = None
+        for index in range(1, len(messages) - self.keep_recent):
+            if current <= target:
+                break
+            message = messages[index]
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str) or message.get("role") == "system":
+                continue
+            compacted = self._compact_content(content, message.get("role", ""))
+            if compacted is not None and len(compacted) < len(content):
+                message["content"] = compacted
+                current -= (len(content) - len(compacted)) // 3
+                changed += 1
+                first = index if first is None else first
+
+        after = estimate_tokens(messages)
+        # 再增长一段余量才再次压缩；压不到低水位(近期消息本身很长)时同样推迟，避免每步改写
+        self._next_trigger[role] = (id(messages), len(messages), after + max(0, self.threshold - target))
+        if not changed:
+            return 0
+
+        saved = before - after
+        # 从第一条被改写的消息起，下一次调用的prompt无法命中前缀缓存
+        invalidated = after - estimate_tokens(messages[:first])
+        self.saved_tokens += saved
+        self.invalidated_tokens += invalidated
+        self.compactions += 1
+        self.logger.info(
+            f"🗜️ {role} 对话压缩: {changed} 条观察结果，{before} -> {after} tokens（节省 {saved}，前缀缓存失效约 {invalidated}）"
+        )
+        record_event(
+            "compaction", role=role, messages=changed, tokens_before=before, tokens_after=after, saved=saved,
+            cache_invalidated=invalidated,
+        )
+        return saved
+
+    def on_llm_call(self, context) -> None:
+        """before_llm_call钩子：两步之间压缩当前agent的对话"""
+        agent = getattr(context, "agent", None)
+        self.compact(context.messages, getattr(agent, "role", "") or "")
+        return None
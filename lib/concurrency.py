@@ -0,0 +1,115 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lib.logger import get_logger
+from lib.metrics import EventTail, record_event
+
+
+class ConcurrencyController:
+    """自适应并发控制器 - 按LLM错误率/延迟、主机负载和进程池健康度调整同时执行的任务数
+
+    加性增、乘性减(AIMD)：
+    - 出现 429、错误率或延迟过高、负载过高、任务大量超时/异常、可用浏览器不足 → 乘性下调
+    - 近期调用足够多且各项指标良好 → 加 1
+    下调后只统计下调之后的事件，窗口内同一个 429/慢调用/失败任务只触发一次下调。
+    每次调整都记录 concurrency 指标事件。
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        maximum: int,
+        minimum: int = 1,
+        interval: float = None,
+        window: float = None,
+        browser_status: Optional[Callable[[], Dict[str, Any]]] = None,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.interval = interval if interval is not None else float(os.getenv("CONCURRENCY_INTERVAL", "30"))
+        window = window if window is not None else float(os.getenv("CONCURRENCY_WINDOW", "180"))
+        self.latency_high = float(os.getenv("CONCURRENCY_LATENCY_HIGH", "40"))
+        self.latency_low = float(os.getenv("CONCURRENCY_LATENCY_LOW", "20"))
+        self.load_high = float(os.getenv("CONCURRENCY_LOAD_HIGH", "1.5"))
+        self.load_low = float(os.getenv("CONCURRENCY_LOAD_LOW", "0.8"))
+        self.browser_status = browser_status
+        self.logger = get_logger("concurrency")
+        self._llm_events = EventTail(["llm_call"], window)
+        self._task_events = EventTail(["task_result"], window)
+        self._next_update = time.time() + self.interval
+        # 上次下调的时间：早于它的事件已经被惩罚过
+        self._decreased_at = 0.0
+
+    @staticmethod
+    def host_load() -> float:
+        """1分钟平均负载 / CPU核数"""
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (OSError, AttributeError):
+            return 0.0
+
+    def observe(self) -> Dict[str, Any]:
+        """汇总窗口内的观测值"""
+        calls = [e for e in self._llm_events.poll() if e.get("ts", 0) > self._decreased_at]
+        tasks = [e for e in self._task_events.poll() if e.get("ts", 0) > self._decreased_at]
+        latencies = sorted(e.get("latency", 0) for e in calls if e.get("ok"))
+        stats = {
+            "llm_calls": len(calls),
+            "llm_error_rate": round(sum(1 for e in calls if not e.get("ok")) / len(calls), 3) if calls else 0.0,
+            "llm_rate_limited": sum(1 for e in calls if e.get("rate_limited")),
+            "llm_p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+            "load": round(self.host_load(), 2),
+            "tasks": len(tasks),
+            "task_failure_rate": round(sum(1 for e in tasks if e.get("status") in ("timeout", "error")) / len(tasks), 3) if tasks else 0.0,
+        }
+        if self.browser_status is not None:
+            try:
+                status = self.browser_status()
+                stats["browsers_healthy"] = status["total_urls"] - len(status.get("unhealthy", []))
+            except Exception:
+                pass
+        return stats
+
+    def _decide(self, stats: Dict[str, Any]) -> Tuple[int, str]:
+        reasons: List[str] = []
+        if stats["llm_rate_limited"]:
+            reasons.append(f"429x{stats['llm_rate_limited']}")
+        if stats["llm_calls"] >= 5 and stats["llm_error_rate"] > 0.2:
+            reasons.append(f"LLM错误率{stats['llm_error_rate']:.0%}")
+        if stats["llm_p50_latency"] > self.latency_high:
+            reasons.append(f"LLM延迟{stats['llm_p50_latency']:.1f}s")
+        if stats["load"] > self.load_high:
+            reasons.append(f"负载{stats['load']}")
+        if stats["tasks"] >= 2 and stats["task_failure_rate"] > 0.5:
+            reasons.append(f"任务超时/异常率{stats['task_failure_rate']:.0%}")
+        if stats.get("browsers_healthy") == 0:
+            reasons.append("无可用浏览器")
+        if reasons:
+            return max(self.minimum, int(self.limit * 0.7)), "下调: " + ", ".join(reasons)
+
+        if (
+            stats["llm_calls"] >= 5
+            and stats["llm_error_rate"] < 0.05
+            and stats["llm_p50_latency"] < self.latency_low
+            and stats["load"] < self.load_low
+        ):
+            return min(self.maximum, self.limit + 1), "上调: 指标良好"
+        return self.limit, "保持"
+
+    def update(self, force: bool = False) -> int:
+        """到达评估周期时重新计算并返回当前并发上限"""
+        now = time.time()
+        if not force and now < self._next_update:
+            return self.limit
+        self._next_update = now + self.interval
+        stats = self.observe()
+        new_limit, reason = self._decide(stats)
+        if new_limit != self.limit:
+            self.logger.info(f"并发调整: {self.limit} -> {new_limit} ({reason}) {stats}")
+        record_event("concurrency", previous=self.limit, limit=new_limit, reason=reason, **stats)
+        if new_limit < self.limit:
+            self._decreased_at = now
+        self.limit = new_limit
+        return self.limit
@@ -0,0 +1,105 @@
+import os
+from typing import Any, Dict, Optional
+
+from lib.logger import get_logger
+from lib.metrics import record_event
+
+
+def is_tool_error(result: str) -> bool:
+    """工具输出是否为失败（本项目工具失败统一以 ❌ 开头）"""
+    text = (result or "").lstrip()
+    return text.startswith("❌") or text.startswith("I encountered an error")
+
+
+class ModelEscalator:
+    """模型档位升级 - fast 档角色卡住时切换到 strong 档
+
+    卡住的判定（按角色统计，每题重新计数）：
+    - 同一工具连续返回相同错误 ESCALATE_REPEAT_ERRORS 次（默认2）
+    - 连续 ESCALATE_IDLE_STEPS 次工具调用（默认4）断点中没有新的端点/参数/漏洞
+
+    升级立即作用于该agent当前的执行循环(agent_executor.llm)及之后的委派，
+    本题结束时恢复原档位；升级及其收益(是否解出、升级后新增发现)记录为指标事件。
+    """
+
+    def __init__(self, llm_config, repeat_errors: int = None, idle_steps: int = None):
+        self.llm_config = llm_config
+        self.repeat_errors = repeat_errors if repeat_errors is not None else int(os.getenv("ESCALATE_REPEAT_ERRORS", "2"))
+        self.idle_steps = idle_steps if idle_steps is not None else int(os.getenv("ESCALATE_IDLE_STEPS", "4"))
+        self.logger = get_logger("escalation")
+        self.agents: Dict[str, Any] = {}
+        self.checkpoint = None
+        self._keys: Dict[int, str] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._escalated: Dict[str, Dict[str, Any]] = {}
+
+    def _findings(self) -> int:
+        return self.checkpoint.findings_count if self.checkpoint is not None else 0
+
+    def start(self, agents: Dict[str, Any], checkpoint):
+        """开始新题：记录agent与角色的对应关系，清空计数"""
+        self.agents = agents or {}
+        self.checkpoint = checkpoint
+        self._keys = {id(agent): key for key, agent in self.agents.items()}
+        self._state = {}
+        self._escalated = {}
+
+    def on_tool_result(self, context) -> Optional[str]:
+        """after_tool_call钩子：统计重复错误和无进展步数，卡住时升级"""
+        key = self._keys.get(id(context.agent))
+        if key is None:
+            return None
+
+        findings = self._findings()
+        state = self._state.setdefault(key, {"steps": 0, "idle": 0, "findings": findings, "error": None, "repeats": 0})
+        state["steps"] += 1
+        if findings > state["findings"]:
+            state["findings"], state["idle"] = findings, 0
+        else:
+            state["idle"] += 1
+
+        result = str(context.tool_result or "")
+        if is_tool_error(result):
+            signature = f"{context.tool_name}:{result[:120]}"
+            state["repeats"] = state["repeats"] + 1 if signature == state["error"] else 1
+            state["error"] = signature
+        else:
+            state["error"], state["repeats"] = None, 0
+
+        if getattr(context.agent.llm, "tier", "strong") != "fast":
+            return None
+        if state["repeats"] >= self.repeat_errors:
+            self._escalate(context.agent, key, f"{context.tool_name} 重复错误x{state['repeats']}", state)
+        elif state["idle"] >= self.idle_steps:
+            self._escalate(context.agent, key, f"连续{state['idle']}步无新发现", state)
+        return None
+
+    def _escalate(self, agent, key: str, reason: str, state: Dict[str, Any]):
+        old = agent.llm
+        # key 是agent键(quick_scout等)，按LLM的角色类型(recon_scout等)取同角色的strong档配置
+        role = getattr(old, "role", None) or key
+        strong = self.llm_config.get_llm_by_role(role, tier="strong")
+        # 执行器在创建时给LLM设置了ReAct停止词，新模型沿用
+        strong.stop = list(dict.fromkeys([*(strong.stop or []), *(old.stop or [])]))
+        agent.llm = strong
+        if getattr(agent, "agent_executor", None) is not None:
+            agent.agent_executor.llm = strong
+        self._escalated[key] = {"original": old, "role": role, "reason": reason, "steps": state["steps"], "findings": self._findings()}
+        self.logger.info(f"⬆️ {key} 升级模型 {old.model} -> {strong.model}（{reason}）")
+        record_event("model_escalation", role=role, agent=key, from_model=old.model, to_model=strong.model, reason=reason, steps=state["steps"])
+
+    def finish(self, solved: bool):
+        """本题结束：记录每次升级的收益并恢复原档位（可重复调用）"""
+        for key, info in self._escalated.items():
+            agent = self.agents.get(key)
+            steps_after = self._state.get(key, {}).get("steps", 0) - info["steps"]
+            gained = self._findings() - info["findings"]
+            record_event(
+                "escalation_outcome", role=info["role"], agent=key, reason=info["reason"], solved=solved,
+                findings_gained=gained, steps_after=steps_after,
+            )
+            self.logger.info(f"{key} 升级收益: {'已解出' if solved else '未解出'}，升级后 {steps_after} 步新增 {gained} 项发现")
+            if agent is not None:
+                agent.llm = info["original"]
+        self._escalated = {}
+        self._state = {}
@@ -1,14 +1,19 @@
-import os, time, json
+import os, time, json, queue
+import atexit, signal, shutil
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterator, Optional
 from pebble import ProcessPool, ProcessExpired
 from concurrent.futures import TimeoutError
-import multiprocessing
 import traceback
 from lib.logger import get_logger
-from lib.utils import format_duration, is_in_last_hour_of_competition, get_embedder_config_from_env, get_db_storage_path
+from lib.utils import format_duration, is_in_last_hour_of_competition, get_embedder_config_from_env, get_db_storage_path, find_flags
 from lib.config import is_debug, is_verbose
+from lib.checkpoint import ChallengeCheckpoint
+from lib.response_memory import response_memory
+from lib.requestindex import request_index
+from lib.metrics import record_event, set_context as set_metrics_context
 
 try:
     from ctf_api import fetch_ctf_challenges, submit_ctf_flag, get_ctf_hint
@@ -18,13 +23,30 @@ except Exception:
     submit_ctf_flag = None
     get_ctf_hint = None
 
-# 线程安全的memory_key_status
-manager = multiprocessing.Manager()
-memory_key_status: Dict[str, bool] = manager.dict() 
-memory_lock = manager.Lock()
+def _memory_init_dir() -> Path:
+    """本次运行的记忆初始化标记目录（子进程继承主进程设置的 CTF_RUN_ID）"""
+    run_id = os.getenv("CTF_RUN_ID") or str(os.getpid())
+    return Path(os.getenv("MEMORY_INIT_DIR", "logs/memory_init")) / run_id
+
+
+def claim_memory_init(target_key: str) -> bool:
+    """跨进程原子地认领题目记忆的初始化，本次运行内仅首个认领者返回 True
+
+    以 O_CREAT|O_EXCL 创建标记文件代替 multiprocessing.Manager 字典，
+    无需常驻的 Manager 服务进程。
+    """
+    marker_dir = _memory_init_dir()
+    marker_dir.mkdir(parents=True, exist_ok=True)
+    safe_key = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in target_key)
+    try:
+        os.close(os.open(marker_dir / safe_key, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
 
 class CTFExecutor:
-    def __init__(self, cdp_url: str = None):
+    def __init__(self, cdp_urls: List[str] = None):
         from lib.workflow import CTFOpportunisticWorkflow
         from lib.llm import CrewLLMConfig
         from lib.tools import setup_tools
@@ -32,8 +54,123 @@ class CTFExecutor:
         # init_rag_countext()
         knowledge = get_knowledge()
         # 初始化系统
-        self.system = CTFOpportunisticWorkflow(llm_config=CrewLLMConfig(), tools=setup_tools(cdp_url), knowledge=knowledge)
+        self.system = CTFOpportunisticWorkflow(llm_config=CrewLLMConfig(), tools=setup_tools(cdp_urls=cdp_urls), knowledge=knowledge)
         self.logger = get_logger("executor")
+        self._agents = None
+        self.checkpoint: ChallengeCheckpoint | None = None
+        self.ailogger = None
+        # 首次LLM调用时间点，用于统计冷/热启动耗时
+        self.first_llm_call_at: float | None = None
+        # 当前题目及工具输出中嗅探到的flag
+        self.target_code: str | None = None
+        self.found_flag: str | None = None
+        self.submitted_flag: str | None = None
+        # 本题已提交过的候选flag及平台结论（True 正确 / False 错误 / None 无法判断）
+        self.flag_verdicts: Dict[str, Optional[bool]] = {}
+        from crewai.hooks import register_before_llm_call_hook, register_after_tool_call_hook
+        register_before_llm_call_hook(self._mark_first_llm_call)
+        register_before_llm_call_hook(self._block_after_flag)
+        register_after_tool_call_hook(self._sniff_flag)
+        from lib.escalation import ModelEscalator
+        self.escalator = ModelEscalator(self.system.llm_config)
+        register_after_tool_call_hook(self._escalate_on_stall)
+        from lib.compaction import ConversationCompactor
+        self.compactor = ConversationCompactor()
+        register_before_llm_call_hook(self._compact_conversation)
+        from lib.llm import register_stream_listener
+        register_stream_listener(self._on_llm_stream)
+
+    def _mark_first_llm_call(self, context):
+        """before_llm_call钩子：记录本次任务的首次LLM调用时间"""
+        if self.first_llm_call_at is None:
+            self.first_llm_call_at = time.perf_counter()
+
+    def _try_flags(self, flags: List[str], source: str) -> bool:
+        """依次提交尚未提交过的候选flag，平台确认正确才记录为 found_flag（随后阻止LLM调用、结束Crew）
+
+        源码/文档中的示例flag、反射回来的payload、诱饵等被拒绝时只记录，Crew继续执行；
+        无提交接口或结果无法解析时同样继续，以最终答案为准。
+        """
+        for flag in flags:
+            if flag in self.flag_verdicts:
+                continue
+            verdict = auto_submit_flag(self.target_code, flag, self.logger)
+            self.flag_verdicts[flag] = verdict
+            if verdict:
+                self.found_flag = self.submitted_flag = flag
+                self.logger.info(f"🚩 {source}中的Flag已被平台确认: {flag}，停止Crew")
+                return True
+            if verdict is False:
+                self.logger.warning(f"⚠️ {source}中的候选Flag被平台拒绝，继续执行: {flag}")
+            else:
+                self.logger.info(f"{source}中的候选Flag无法确认，继续执行: {flag}")
+        return False
+
+    def _sniff_flag(self, context):
+        """after_tool_call钩子：工具输出中出现flag即提交，平台确认后停止Crew"""
+        if self.target_code is None or self.found_flag is not None:
+            # 非执行中(同进程内其他执行器的任务)或已确认，忽略
+            return None
+        flags = find_flags(str(context.tool_result or ""))
+        if flags:
+            self._try_flags(flags, f"工具 {context.tool_name} 输出")
+        return None
+
+    def _on_llm_stream(self, role: str, text: str, delta: str):
+        """流式LLM输出监听：逐行写入AI日志，Final Answer 中出现flag即提前提交"""
+        if self.target_code is None:
+            return
+        if "\n" in delta and self.ailogger is not None:
+            start = text.rfind("\n", 0, len(text) - len(delta)) + 1
+            for line in text[start:text.rfind("\n")].splitlines():
+                if line.strip():
+                    self.ailogger.info(f"💭 [{role}] {line}")
+        if self.found_flag is not None:
+            return
+        answer_at = text.find("Final Answer")
+        flags = find_flags(text[answer_at:]) if answer_at >= 0 else []
+        if flags:
+            self._try_flags(flags, f"{role} 流式输出的Final Answer")
+
+    def _escalate_on_stall(self, context):
+        """after_tool_call钩子：fast档角色卡住时升级模型"""
+        if self.target_code is None:
+            return None
+        return self.escalator.on_tool_result(context)
+
+    def _compact_conversation(self, context):
+        """before_llm_call钩子：prompt过长时压缩较早的工具观察结果"""
+        if self.target_code is None:
+            return None
+        return self.compactor.on_llm_call(context)
+
+    def _block_after_flag(self, context):
+        """before_llm_call钩子：flag经平台确认后阻止后续所有LLM调用，使Crew尽快结束"""
+        if self.found_flag is not None:
+            return False
+        return None
+
+    def _log_prompt_cache_ratio(self, usage_before: Dict[str, int], target_code: str):
+        """记录本crew的prompt前缀缓存命中率（LLM实例跨crew复用，按差值计算）"""
+        from lib.llm import token_usage_snapshot
+        usage_after = token_usage_snapshot(self.system.llm_config.cache.values())
+        prompt = usage_after["prompt_tokens"] - usage_before["prompt_tokens"]
+        cached = usage_after["cached_prompt_tokens"] - usage_before["cached_prompt_tokens"]
+        ratio = cached / prompt if prompt else 0.0
+        self.logger.info(f"prompt缓存命中: {cached}/{prompt} tokens ({ratio:.1%})")
+        record_event("crew_prompt_cache", code=str(target_code), prompt_tokens=prompt, cached_tokens=cached, ratio=round(ratio, 4))
+
+    def _get_agents(self):
+        """获取机会主义agents - 只构建一次，后续任务复用"""
+        if self._agents is None:
+            self._agents = self.system._get_opportunistic_agents()
+            for key, agent in self._agents.items():
+                # 按agent绑定步骤回调，断点据此判断哪个阶段已完成
+                agent.step_callback = partial(self._crew_step_callback, agent_key=key)
+        for agent in self._agents.values():
+            # 重置跨任务累计的重试计数
+            agent._times_executed = 0
+        return self._agents
 
 
     def parse_result(self, result: str, target_code: str, target_url: str, file_name: str, target_key: str) -> str:
@@ -44,15 +181,29 @@ class CTFExecutor:
         flag_found = validation.startswith("✅ 发现有效Flag")
         flag_content = validation.split(":", 1)[1].strip() if flag_found else ""
         self.logger.info(f"CTF挑战完成，{target_code} - {target_url} {('发现Flag: ' + flag_content) if flag_found else '未找到flag'}")
+        self.escalator.finish(flag_found)
+        if self.checkpoint is not None:
+            if flag_found:
+                self.checkpoint.clear()
+            else:
+                self.checkpoint.save(force=True)
         # 返回尽可能简化的结果：仅返回 flag 字符串（若未找到则返回原始结果以便排错）
         return flag_content if flag_found else result
 
-    def _crew_step_callback(self, step_output):
-        """CrewAI步骤回调，用于监控执行进度"""
+    def _crew_step_callback(self, step_output, agent_key: str | None = None):
+        """CrewAI步骤回调，用于监控执行进度并记录断点"""
         self.ailogger.info(f"步骤输出: {str(step_output)}")
+        if self.checkpoint is not None:
+            self.checkpoint.record_step(step_output, agent_key)
 
-    def execute_ctf(self, target_code: str, target_url: str, hint: str | None = None, failure_counts: int = 0):
-        self.logger.info(f"🎯 开始CTF挑战: {target_code} - {target_url} - {hint} - {failure_counts}")
+    def _crew_task_callback(self, task_output):
+        """CrewAI任务回调，任务结束时立即落盘断点"""
+        self.ailogger.info(f"任务输出: {str(task_output)}")
+        if self.checkpoint is not None:
+            self.checkpoint.record_task(task_output)
+
+    def prepare_crew(self, target_code: str, target_url: str, hint: str | None = None):
+        """构建本题的Crew，返回 (crew, 日志文件名, 记忆命名空间)"""
         embedder_conf = get_embedder_config_from_env()
         # 为每题设置独立的命名空间，避免记忆混淆
         target_key = f"ctf_{target_code}_{target_url.replace('://', '_').replace('/', '_')}"
@@ -64,6 +215,7 @@ class CTFExecutor:
         from crewai.memory.long_term.long_term_memory import LongTermMemory
 
         self.ailogger = get_logger(f"ai.{target_key}", False)
+        self.checkpoint = ChallengeCheckpoint(target_key)
         
         if is_debug():
             worker_agents = self.system.create_debug_agents()
@@ -71,82 +223,136 @@ class CTFExecutor:
             workflow = self.system.create_debug_workflow(target_url, target_code, hint)
         else:
             # 获取agents和工作流
-            agents = self.system._get_opportunistic_agents()
+            agents = self._get_agents()
             worker_agents = [agent for key, agent in agents.items() if key != "opportunistic_coordinator"]
             manager_agent = agents["opportunistic_coordinator"]
-            workflow = self.system.create_opportunistic_workflow(target_url, target_code, hint)
+            resume = self.checkpoint.to_prompt()
+            if resume:
+                self.logger.info(f"从断点续跑: {self.checkpoint.path}")
+            workflow = self.system.create_opportunistic_workflow(target_url, target_code, hint, resume)
 
         db_storage_path = get_db_storage_path(target_key)
 
         Path(f"logs/{datetime.now().strftime('%Y-%m-%d')}/crew").mkdir(parents=True, exist_ok=True)
         file_name = f"{datetime.now().strftime('%Y-%m-%d')}/crew/{target_code}_{target_url.replace('://', '_').replace('/', '_')}.log"
-        try:
-            stream=False
-            # 创建分层crew
-            crew = Crew(
-                name=f"ctf_attack_{target_code}",
-                output_log_file=f"logs/{file_name}",
-                agents=worker_agents,
-                tasks=workflow,
-                stream=stream,
-                process=Process.hierarchical,  # 关键改进：使用分层流程
-                manager_agent=manager_agent,  # 协调器作为经理
-                llm=self.system.llm_config.get_llm_by_role("opportunistic_coordinator"),
-                # chat_llm=self.system.llm_config.get_llm_by_role("opportunistic_coordinator"),
-                # function_calling_llm=self.system.llm_config.get_llm_by_role("tool_call"),
-                verbose=is_verbose(),
-                tracing=is_verbose(),
-                memory=False,
-                max_rpm=30,  # 更合理的限制
-                max_iter=8,   # 给予更多推理空间
-                max_execution_time=1700,  # 1800秒超时
-                task_callback=self._crew_step_callback,  # 添加任务回调
-                step_callback=self._crew_step_callback,  # 添加步骤回调
-                # embedder=embedder_conf,
-                long_term_memory=LongTermMemory(
-                    path=f"{db_storage_path}/long_term_memory_storage.db"
-                )
+        # 创建分层crew
+        crew = Crew(
+            name=f"ctf_attack_{target_code}",
+            output_log_file=f"logs/{file_name}",
+            agents=worker_agents,
+            tasks=workflow,
+            # crew级流式会让kickoff返回需迭代的输出对象；LLM级流式由 CREWAI_LLM_STREAM 控制，
+            # 分片经 _on_llm_stream 实时写入日志并嗅探flag
+            stream=False,
+            process=Process.hierarchical,  # 关键改进：使用分层流程
+            manager_agent=manager_agent,  # 协调器作为经理
+            llm=self.system.llm_config.get_llm_by_role("opportunistic_coordinator"),
+            # chat_llm=self.system.llm_config.get_llm_by_role("opportunistic_coordinator"),
+            # function_calling_llm=self.system.llm_config.get_llm_by_role("tool_call"),
+            verbose=is_verbose(),
+            tracing=is_verbose(),
+            memory=False,
+            # 不再按crew单独设置max_rpm，由 lib.ratelimit 跨进程共享限流
+            max_iter=8,   # 给予更多推理空间
+            max_execution_time=1700,  # 1800秒超时
+            task_callback=self._crew_task_callback,  # 添加任务回调
+            step_callback=self._crew_step_callback,  # 添加步骤回调
+            # embedder=embedder_conf,
+            long_term_memory=LongTermMemory(
+                path=f"{db_storage_path}/long_term_memory_storage.db"
             )
+        )
 
-            crew._short_term_memory = ShortTermMemory(
-                crew=crew,
-                embedder_config=embedder_conf,
-                path=db_storage_path,
-            )
-            crew.short_term_memory = crew._short_term_memory
-            crew._entity_memory = EntityMemory(
-                crew=crew, embedder_config=embedder_conf, path=db_storage_path
-            )
-            crew.entity_memory = crew._entity_memory
+        crew._short_term_memory = ShortTermMemory(
+            crew=crew,
+            embedder_config=embedder_conf,
+            path=db_storage_path,
+        )
+        crew.short_term_memory = crew._short_term_memory
+        crew._entity_memory = EntityMemory(
+            crew=crew, embedder_config=embedder_conf, path=db_storage_path
+        )
+        crew.entity_memory = crew._entity_memory
+        return crew, file_name, target_key
 
+    def execute_ctf(self, target_code: str, target_url: str, hint: str | None = None, failure_counts: int = 0):
+        self.logger.info(f"🎯 开始CTF挑战: {target_code} - {target_url} - {hint} - {failure_counts}")
+        self.first_llm_call_at = None
+        self.found_flag = None
+        self.submitted_flag = None
+        self.flag_verdicts = {}
+        try:
+            crew, file_name, target_key = self.prepare_crew(target_code, target_url, hint)
         except Exception as e:
             self.logger.error(f"创建Crew失败: {e} {traceback.format_exc()}")
             return f"⚠️ 创建Crew失败: {e}"
 
+        kickoff_at = None
         try:
-            def _is_memory_initialized(target_key: str) -> bool:
-                """线程安全地检查memory是否已初始化"""
-                with memory_lock:
-                    return memory_key_status.get(target_key, False)
-            if not _is_memory_initialized(target_key):
+            if claim_memory_init(target_key):
                 for command_type in ['entity', 'short', 'long', ]: # kickoff_outputs、knowledge 看情况
                     try:
                         crew.reset_memories(command_type=command_type)
                     except:
                         pass
-                with memory_lock:
-                    memory_key_status[target_key] = True
+            self.checkpoint.start_run()
+            self.target_code = target_code
+            response_memory.reset()
+            request_index.reset()
+            self.compactor.reset()
+            self.escalator.start(self._agents, self.checkpoint)
+            set_metrics_context(code=str(target_code))
+            from lib.llm import token_usage_snapshot
+            usage_before = token_usage_snapshot(self.system.llm_config.cache.values())
+            kickoff_at = time.time()
             result = crew.kickoff()
-            if stream:
-                for chunk in result:
-                    pass
-                    # print(chunk.content, end="", flush=True)
-                result = result.result
             self.logger.info(f"usage_metrics: {crew.usage_metrics}")
+            self._log_prompt_cache_ratio(usage_before, target_code)
+            if self.found_flag is not None:
+                # 以平台确认正确的flag为准
+                result = self.found_flag
             return self.parse_result(result, target_code, target_url, file_name, target_key)
         except Exception as e:
+            if self.found_flag is not None:
+                # flag确认后LLM调用被阻止，kickoff以异常结束属预期
+                self.logger.info(f"Crew已因Flag确认提前终止: {e}")
+                return self.parse_result(self.found_flag, target_code, target_url, file_name, target_key)
+            self.checkpoint.save(force=True)
             self.logger.error(f"kickoff 执行失败: {e} {traceback.format_exc()}")
             return f"⚠️ kickoff 异常: {e}"
+        finally:
+            if kickoff_at is not None:
+                # 与 llm_call 事件对照，区分LLM耗时和工具耗时
+                record_event("crew_run", duration=round(time.time() - kickoff_at, 3), flag_found=self.found_flag is not None)
+                if self.compactor.compactions:
+                    self.logger.info(
+                        f"对话压缩 {self.compactor.compactions} 次，共节省约 {self.compactor.saved_tokens} tokens，"
+                        f"前缀缓存失效约 {self.compactor.invalidated_tokens} tokens"
+                    )
+            # 异常结束时同样恢复被升级的模型
+            self.escalator.finish(False)
+            # 浏览器会话在本题内跨调用复用，题目结束时释放
+            browser = self.system.tools.get("browser")
+            if browser is not None:
+                browser.close_session()
+            set_metrics_context(code=None)
+            # 任务结束后停止嗅探/拦截，submitted_flag/flag_verdicts 保留供调用方判断是否已提交
+            self.target_code = None
+            self.found_flag = None
+
+
+# 进程内CTFExecutor缓存（按CDP URL集合），pebble worker常驻(max_tasks=0)，后续任务直接复用
+_executor_cache: Dict[str, CTFExecutor] = {}
+
+def get_cached_executor(cdp_urls: List[str]) -> Tuple[CTFExecutor, bool]:
+    """获取当前进程内的执行器，返回 (执行器, 是否命中缓存)"""
+    cache_key = ",".join(cdp_urls)
+    executor = _executor_cache.get(cache_key)
+    if executor is not None:
+        return executor, True
+    executor = CTFExecutor(cdp_urls=cdp_urls)
+    _executor_cache[cache_key] = executor
+    return executor, False
 
 
 class PebbleCTFExecutor:
@@ -154,99 +360,139 @@ class PebbleCTFExecutor:
     
     def __init__(self, cdp_urls: List[str] = None, max_concurrent: int = 2):
         self.cdp_urls = cdp_urls or [os.getenv("STEEL_CONNECT_URL", "ws://127.0.0.1:13001")]
-        self.max_workers = min(len(self.cdp_urls), max_concurrent)
+        # 进程池按上限创建；浏览器按需租用，实际同时执行的任务数由自适应控制器决定
+        self.max_workers = max_concurrent
         
         # 使用简单的日志设置，避免传递复杂对象
         self.logger = get_logger("pebble")
+
+        from lib.concurrency import ConcurrencyController
+        from lib.cdppool import CDPLeasePool
+        lease_pool = CDPLeasePool(self.cdp_urls)
+        from lib.steelpool import SteelSessionPool
+        # 主进程维护预热的Steel会话并回收被杀worker遗留的会话；
+        # 维护线程在首次提交任务、进程池fork出worker之后才启动，worker不会继承其持有的锁
+        self.session_pool = SteelSessionPool(lease_pool)
+        self.controller = ConcurrencyController(
+            initial=min(len(self.cdp_urls) * lease_pool.slots, max_concurrent),
+            maximum=max_concurrent,
+            browser_status=lease_pool.get_pool_status,
+        )
         
         self.process_pool = ProcessPool(
             max_workers=self.max_workers,
             max_tasks=0,
-            initializer=self._process_initializer
+            initializer=self._process_initializer,
+            initargs=(self.cdp_urls,)
         )
-        self.logger.info(f"Pebble执行器初始化完成 - 进程数: {self.max_workers}")
+        self.logger.info(f"Pebble执行器初始化完成 - 进程数: {self.max_workers}，初始并发: {self.controller.limit}")
 
-    def _process_initializer(self):
-        """进程初始化"""
-        pass
-        # 在子进程中重新初始化日志
-        # logging.basicConfig(
-        #     level=logging.INFO,
-        #     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        # )
+    def admission_limit(self) -> int:
+        """当前允许同时执行的任务数"""
+        return self.controller.update()
 
-    def run_batch_concurrently(self, batch_items: List[Dict[str, Any]], args) -> List[Tuple[str, bool, str]]:
-        """并发执行批量任务 - 修复序列化问题"""
+    @staticmethod
+    def _process_initializer(cdp_urls: List[str]):
+        """进程初始化：预热crewai导入、LLM配置、工具、知识库和agents，填充执行器缓存"""
+        logger = get_logger("pebble")
+        start_time = time.perf_counter()
+        try:
+            get_cached_executor(cdp_urls)[0]._get_agents()
+        except Exception as e:
+            # 预热失败不影响任务执行，任务中会按需重新构建
+            logger.error(f"执行器预热失败: {e}")
+            return
+        logger.info(f"进程 {os.getpid()} 执行器预热完成 - 耗时: {format_duration((time.perf_counter() - start_time) * 1000)}")
+
+    def _build_task_data(self, index: int, item: Dict[str, Any], args) -> Dict[str, Any]:
+        """构造可序列化的任务数据"""
+        return {
+            'url': item['url'],
+            'code': item.get("code", f"unknown_{index}"),
+            'failure_counts': item.get('failure_counts', 0),
+            # 浏览器不在提交时绑定，由BrowserTool首次使用时从租约池按需租用
+            'cdp_urls': self.cdp_urls,
+            'hint_last_hour': getattr(args, 'hint_last_hour', False)
+        }
+
+    def schedule_task_data(self, task_data: Dict[str, Any]):
+        """把任务数据交给进程池执行，返回future"""
+        future = self.process_pool.schedule(
+            execute_single_task,  # 使用模块级函数，避免传递self
+            args=(task_data,),  # 只传递可序列化数据
+            timeout=1700
+        )
+        # 进程池在首次 schedule 时才创建worker
+        self.session_pool.start_maintainer()
+        return future
+
+    def submit_task(self, index: int, item: Dict[str, Any], args, results_queue: "queue.Queue"):
+        """提交单个任务，完成时通过回调把future放入结果队列"""
+        future = self.schedule_task_data(self._build_task_data(index, item, args))
+        future.add_done_callback(lambda f: results_queue.put((index, item, f)))
+        self.logger.info(f"提交任务: {item.get('code', f'unknown_{index}')} - {item['url']}")
+        return future
+
+    def collect_result(self, future, item: Dict[str, Any]) -> Tuple[str, bool, str]:
+        """从已完成的future中取出结果，异常统一转换为失败结果"""
+        challenge_code = item.get("code", "unknown")
+        try:
+            result = future.result()
+            self.logger.info(f"任务完成: {challenge_code} - 结果: {'成功' if result[1] else '失败'}")
+            record_event("task_result", code=str(challenge_code), status="solved" if result[1] else "failed")
+            return result
+        except (ProcessExpired, TimeoutError):
+            self.logger.warning(f"任务超时: {challenge_code}")
+            record_event("task_result", code=str(challenge_code), status="timeout")
+            return (item["url"], False, "执行超时")
+        except Exception as e:
+            self.logger.error(f"任务异常: {challenge_code} - {e}")
+            record_event("task_result", code=str(challenge_code), status="error", error=type(e).__name__)
+            return (item["url"], False, f"执行异常: {str(e)}")
+
+    def _iter_completed(self, batch_items: List[Dict[str, Any]], args) -> Iterator[Tuple[int, Dict[str, Any], Tuple[str, bool, str]]]:
+        """按完成顺序产出 (序号, 题目, 结果)，由完成回调驱动；同时执行数不超过 admission_limit"""
+        results_queue: "queue.Queue" = queue.Queue()
+        waiting = list(enumerate(batch_items))
+        running = 0
+        completed = 0
+        # 只有真正取到结果才计数，等待超时不消耗次数
+        while completed < len(batch_items):
+            while waiting and running < self.admission_limit():
+                i, item = waiting.pop(0)
+                self.submit_task(i, item, args, results_queue)
+                running += 1
+            try:
+                # 定期醒来以便并发上调时及时补充任务
+                i, item, future = results_queue.get(timeout=5)
+            except queue.Empty:
+                continue
+            running -= 1
+            completed += 1
+            yield i, item, self.collect_result(future, item)
+
+    def iter_batch_results(self, batch_items: List[Dict[str, Any]], args) -> Iterator[Tuple[Dict[str, Any], Tuple[str, bool, str]]]:
+        """流式执行批量任务：每个题目完成后立即产出 (题目, (url, flag_found, flag))"""
         self.logger.info(f"开始执行 {len(batch_items)} 个CTF任务")
-        
         start_time = time.time()
-        futures = {}
         results = []
-        
-        # 提交所有任务 - 只传递可序列化的数据
-        for i, item in enumerate(batch_items):
-            cdp_url = self.cdp_urls[i % len(self.cdp_urls)]
-            challenge_code = item.get("code", f"unknown_{i}")
-            
-            # 准备可序列化的任务数据
-            task_data = {
-                'url': item['url'],
-                'code': challenge_code,
-                'failure_counts': item.get('failure_counts', 0),
-                'cdp_url': cdp_url,
-                'hint_last_hour': getattr(args, 'hint_last_hour', False)
-            }
-            
-            future = self.process_pool.schedule(
-                execute_single_task,  # 使用模块级函数，避免传递self
-                args=(task_data,),    # 只传递可序列化数据
-                timeout=1700
-            )
-            time.sleep(1)
-            futures[future] = (i, item)
-            self.logger.info(f"提交任务: {challenge_code} - {item['url']}")
-        
-        # 监控任务执行
-        completed_count = 0
-        total_tasks = len(futures)
-        
-        while futures and completed_count < total_tasks:
-            finished_futures = []
-            for future, task_info in list(futures.items()):
-                if future.done():
-                    finished_futures.append((future, task_info))
-            
-            for future, (i, item) in finished_futures:
-                challenge_code = item.get("code", "unknown")
-                
-                try:
-                    result = future.result()
-                    results.append((i, result))
-                    self.logger.info(f"任务完成: {challenge_code} - 结果: {'成功' if result[1] else '失败'}")
-                    
-                except (ProcessExpired, TimeoutError):
-                    results.append((i, (item["url"], False, "执行超时")))
-                    self.logger.warning(f"任务超时: {challenge_code}")
-                    
-                except Exception as e:
-                    results.append((i, (item["url"], False, f"执行异常: {str(e)}")))
-                    self.logger.error(f"任务异常: {challenge_code} - {e}")
-                
-                completed_count += 1
-                del futures[future]
-            
-            # 进度更新
-            if futures:
-                # progress = (completed_count / total_tasks) * 100
-                # self.logger.info(f"进度: {completed_count}/{total_tasks} ({progress:.1f}%)")
-                time.sleep(5)
-        
+        for _, item, result in self._iter_completed(batch_items, args):
+            results.append(result)
+            yield item, result
+        self._generate_summary(results, time.time() - start_time)
+
+    def run_batch_concurrently(self, batch_items: List[Dict[str, Any]], args) -> List[Tuple[str, bool, str]]:
+        """并发执行批量任务，全部完成后按提交顺序返回结果"""
+        self.logger.info(f"开始执行 {len(batch_items)} 个CTF任务")
+        start_time = time.time()
+        results = [(i, result) for i, _, result in self._iter_completed(batch_items, args)]
+
         # 整理结果
         final_results = self._organize_results(results, batch_items)
-        
+
         # 生成摘要
         self._generate_summary(final_results, time.time() - start_time)
-        
+
         return final_results
 
     def _organize_results(self, results: List, batch_items: List) -> List[Tuple[str, bool, str]]:
@@ -286,6 +532,7 @@ class PebbleCTFExecutor:
     def close(self):
         """安全关闭"""
         self.logger.info("关闭进程池...")
+        self.session_pool.stop_maintainer()
         try:
             self.process_pool.close()
             self.process_pool.join(timeout=0.1)
@@ -317,14 +564,17 @@ def execute_single_task(task_data: Dict[str, Any]) -> Tuple[str, bool, str]:
         # target_key = f"ctf_{task_data['code']}_{task_data['url'].replace('://', '_').replace('/', '_')}"
         # os.environ["CREWAI_STORAGE_DIR"] = f"{target_key}"
         
-        # 执行CTF逻辑 - 在子进程中创建执行器
-        executor = CTFExecutor(cdp_url=task_data['cdp_url'])
+        # 执行CTF逻辑 - 复用子进程内缓存的执行器
+        executor, warm = get_cached_executor(task_data['cdp_urls'])
         result = executor.execute_ctf(
             str(challenge_code), 
             url, 
             hint_text, 
             task_data.get('failure_counts', 0)
         )
+        if executor.first_llm_call_at is not None:
+            startup_str = format_duration((executor.first_llm_call_at - start_time) * 1000)
+            logger.info(f"首次LLM调用前耗时: {startup_str} ({'热启动' if warm else '冷启动'})")
 
         elapsed_ms = (time.perf_counter() - start_time) * 1000
         elapsed_str = format_duration(elapsed_ms)
@@ -334,7 +584,13 @@ def execute_single_task(task_data: Dict[str, Any]) -> Tuple[str, bool, str]:
         flag_found, flag_content = validate_result(result, challenge_code, logger)
         
         if flag_found:
-            auto_submit_flag(challenge_code, flag_content, logger)
+            if flag_content in executor.flag_verdicts:
+                verdict = executor.flag_verdicts[flag_content]
+            else:
+                verdict = auto_submit_flag(challenge_code, flag_content, logger)
+            if verdict is False:
+                logger.warning(f"任务结束但Flag被平台拒绝: {flag_content}")
+                return (url, False, f"Flag被平台拒绝: {flag_content}")
             logger.info(f"任务成功 - 找到Flag: {flag_content}")
         else:
             logger.info("任务完成但未找到Flag")
@@ -384,37 +640,108 @@ def validate_result(result: str, challenge_code: str, logger) -> Tuple[bool, str
         return False, ""
 
 
-def auto_submit_flag(challenge_code: str, flag_content: str, logger):
-    """自动提交Flag - 模块级函数"""
+FLAG_VERDICT_KEYS = ("correct", "is_correct", "success", "accepted", "solved")
+FLAG_REJECT_WORDS = ("incorrect", "wrong", "invalid", "错误", "不正确")
+FLAG_ACCEPT_WORDS = ("correct", "accepted", "success", "正确", "成功")
+
+
+def parse_submit_verdict(submit_res) -> Optional[bool]:
+    """解析平台的提交结果：True 正确，False 错误，None 无法判断
+
+    兼容不同返回格式：布尔值；JSON 中的 correct/is_correct/success/accepted/solved 布尔字段
+    (含嵌套的 data)，或 status/result/message/msg 文本；纯文本按关键字判断（先判断否定词）。
+    """
+    if isinstance(submit_res, bool):
+        return submit_res
+    data = submit_res
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+    if isinstance(data, bool):
+        return data
+    if isinstance(data, dict):
+        for key in FLAG_VERDICT_KEYS:
+            if isinstance(data.get(key), bool):
+                return data[key]
+        if isinstance(data.get("data"), (dict, bool)):
+            verdict = parse_submit_verdict(data["data"])
+            if verdict is not None:
+                return verdict
+        data = " ".join(str(data[key]) for key in ("status", "result", "message", "msg") if data.get(key) is not None)
+    text = str(data or "").lower()
+    if any(word in text for word in FLAG_REJECT_WORDS):
+        return False
+    if any(word in text for word in FLAG_ACCEPT_WORDS):
+        return True
+    return None
+
+
+def auto_submit_flag(challenge_code: str, flag_content: str, logger) -> Optional[bool]:
+    """自动提交Flag - 模块级函数，返回平台结论（无提交接口、提交异常或结果无法解析时为 None）"""
+    if not submit_ctf_flag:
+        return None
     try:
-        if submit_ctf_flag:
-            submit_res = submit_ctf_flag(str(challenge_code), flag_content)
-            logger.info(f"Flag提交成功:{challenge_code} - {submit_res}")
+        submit_res = submit_ctf_flag(str(challenge_code), flag_content)
     except Exception as e:
         logger.error(f"Flag提交失败:{challenge_code} - {e}")
+        return None
+    verdict = parse_submit_verdict(submit_res)
+    status = {True: "正确", False: "错误", None: "结果未知"}[verdict]
+    logger.info(f"Flag已提交({status}):{challenge_code} - {flag_content} - {submit_res}")
+    record_event("flag_submit", code=str(challenge_code), verdict=verdict)
+    return verdict
 
 
 # 全局执行器实例
 _executor = None
 
+def get_pebble_executor(args) -> PebbleCTFExecutor:
+    """获取全局Pebble执行器（首次调用时创建）；指定 --coordinator 时返回多机协调器"""
+    global _executor
+    if _executor is None:
+        # 子进程继承运行ID，共享同一组记忆初始化标记
+        os.environ.setdefault("CTF_RUN_ID", str(os.getpid()))
+        _install_cleanup_handlers()
+        if getattr(args, "coordinator", ""):
+            # 多机模式：任务分发给远程worker执行
+            from lib.cluster import ClusterCTFExecutor
+            _executor = ClusterCTFExecutor(args.coordinator)
+        else:
+            _executor = PebbleCTFExecutor(get_cdp_urls(), max_concurrent=args.max_concurrent)
+    return _executor
+
+
 def run_batch_for_items(batch_items: List[Dict[str, Any]], args) -> List[Tuple[str, bool, str]]:
     """主要执行函数"""
-    global _executor
-    
-    cdp_urls = get_cdp_urls()
-    
     logger = get_logger("main")
     
-    if _executor is None:
-        _executor = PebbleCTFExecutor(cdp_urls, max_concurrent=args.max_concurrent)
+    executor = get_pebble_executor(args)
     
     try:
-        return _executor.run_batch_concurrently(batch_items, args)
+        return executor.run_batch_concurrently(batch_items, args)
     except Exception as e:
         logger.error(f"执行失败: {e}")
         return [(item["url"], False, f"执行异常: {e}") for item in batch_items]
 
 
+def iter_batch_for_items(batch_items: List[Dict[str, Any]], args) -> Iterator[Tuple[Dict[str, Any], Tuple[str, bool, str]]]:
+    """流式执行函数：每个题目完成即产出 (题目, 结果)；执行异常时其余题目按失败产出"""
+    logger = get_logger("main")
+    remaining = list(batch_items)
+    try:
+        for item, result in get_pebble_executor(args).iter_batch_results(batch_items, args):
+            remaining = [it for it in remaining if it is not item]
+            yield item, result
+    except Exception as e:
+        logger.error(f"执行失败: {e}")
+        for item in remaining:
+            yield item, (item["url"], False, f"执行异常: {e}")
+
+
 def get_cdp_urls() -> List[str]:
     """获取CDP URLs"""
     cdp_urls_str = os.getenv("CDP_URLS", "")
@@ -423,16 +750,28 @@ def get_cdp_urls() -> List[str]:
     return [os.getenv("STEEL_CONNECT_URL", "ws://127.0.0.1:13001")]
 
 
-# 清理函数
-import atexit
+# 清理函数 - 仅在创建进程池时安装，单纯 import 本模块不产生副作用
+_cleanup_pid = None
+
 def cleanup():
+    # pebble子进程会继承信号处理器，只允许主进程清理
+    if os.getpid() != _cleanup_pid:
+        return
     if _executor:
         _executor.close()
-atexit.register(cleanup)
+    shutil.rmtree(_memory_init_dir(), ignore_errors=True)
+
 
-import signal
 def signal_handler(sig, frame):
     cleanup()
     exit(0)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+
+
+def _install_cleanup_handlers():
+    global _cleanup_pid
+    if _cleanup_pid is not None:
+        return
+    _cleanup_pid = os.getpid()
+    atexit.register(cleanup)
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
@@ -0,0 +1,78 @@
+import os
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+# LLM提供商连接池：同一进程内按 scheme://host[:port] 共享一个 keep-alive 连接池，
+# 避免每个角色/每次浏览器调用各自建连和TLS握手。
+# pebble worker 由 fork 产生，按 pid 区分，子进程不会复用父进程的socket。
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+_lock = threading.Lock()
+_pid: Optional[int] = None
+_sync_clients: Dict[str, httpx.Client] = {}
+# AsyncClient 的连接绑定创建它的事件循环，按循环分别缓存，循环回收后自动释放
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def pool_key(base_url: Optional[str]) -> str:
+    parts = urlsplit(str(base_url or DEFAULT_BASE_URL))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("LLM_HTTP2", "true").lower() != "true":
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120")),
+    )
+
+
+def _check_pid():
+    global _pid
+    if _pid != os.getpid():
+        # fork 后父进程的连接不可用，直接丢弃（不关闭，避免影响父进程）
+        _pid = os.getpid()
+        _sync_clients.clear()
+        _async_clients.clear()
+
+
+def get_http_client(base_url: Optional[str]) -> httpx.Client:
+    """同步客户端（crew LLM），协商成功时使用HTTP/2，否则回落HTTP/1.1"""
+    key = pool_key(base_url)
+    with _lock:
+        _check_pid()
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.Client(http2=_http2_enabled(), limits=_limits(), timeout=None)
+            _sync_clients[key] = client
+        return client
+
+
+def get_async_http_client(base_url: Optional[str]) -> httpx.AsyncClient:
+    """异步客户端（browser_use LLM），需在事件循环内调用"""
+    key = pool_key(base_url)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _check_pid()
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=_http2_enabled(), limits=_limits(), timeout=None)
+            clients[key] = client
+        return client
@@ -1,18 +1,515 @@
 from crewai import LLM
 from crewai.llms.providers.openai.completion import OpenAICompletion
 from crewai.llms.providers.anthropic.completion import AnthropicCompletion
+from crewai.events.types.llm_events import LLMCallType
 from browser_use.llm import ChatOpenAI, ChatDeepSeek, ChatAnthropic
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic
 import os
+import re
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as futures_wait, FIRST_COMPLETED
+import httpx
+import openai
+import anthropic
+from lib.metrics import record_event, percentile
+from lib.llmcache import get_llm_cache, cache_key
+from lib.ratelimit import get_limiter, bucket_key, estimate_tokens, ROLE_PRIORITY, DEFAULT_PRIORITY
+from lib.logger import get_logger
+from lib.httpclient import get_http_client, get_async_http_client
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """判断异常(含其 __cause__ 链)是否为 429 限流"""
+    while error is not None:
+        if getattr(error, "status_code", None) == 429 or "rate limit" in str(error).lower():
+            return True
+        error = error.__cause__
+    return False
+
+
+def wait_for_rate_limit(rate_key: str, role: str, messages) -> float:
+    """经跨进程令牌桶排队，返回等待秒数"""
+    if not rate_key:
+        return 0.0
+    waited = get_limiter().acquire(rate_key, ROLE_PRIORITY.get(role, DEFAULT_PRIORITY), estimate_tokens(messages))
+    if waited >= 1:
+        get_logger("ratelimit").info(f"LLM限流等待: {role or '-'} {waited:.1f}s")
+    return waited
+
+
+_call_state = threading.local()
+_stream_listeners = []
+
+_ACTION_INPUT_RE = re.compile(r"Action\s*Input\s*:\s*", re.IGNORECASE)
+
+
+def register_stream_listener(listener):
+    """注册流式输出监听器 listener(role, text, delta)，text 为本次调用目前为止的完整输出"""
+    _stream_listeners.append(listener)
+
+
+def _notify_stream(role: str, text: str, delta: str):
+    for listener in _stream_listeners:
+        try:
+            listener(role, text, delta)
+        except Exception as e:
+            get_logger("llm").warning(f"流式监听器异常: {e}")
+
+
+def react_action_end(text: str):
+    """ReAct 输出中 Action Input 的JSON参数已完整时返回其结束位置，否则返回 None"""
+    if "Final Answer" in text:
+        return None
+    match = _ACTION_INPUT_RE.search(text)
+    if not match or match.end() >= len(text) or text[match.end()] != "{":
+        return None
+    start = match.end()
+    depth, in_string, escaped = 0, False, False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                try:
+                    json.loads(text[start:i + 1])
+                except ValueError:
+                    return None
+                return i + 1
+    return None
+
+
+def _parse_pricing() -> dict:
+    """LLM_PRICING: {"模型名": [输入, 输出, 缓存命中输入]}，单位为每百万token的价格"""
+    try:
+        return json.loads(os.getenv("LLM_PRICING", "") or "{}")
+    except ValueError:
+        get_logger("llm").warning("LLM_PRICING 不是合法JSON，忽略费用统计")
+        return {}
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+    """按 LLM_PRICING 估算单次调用费用，未配置价格时返回 None"""
+    price = _parse_pricing().get(model)
+    if not price:
+        return None
+    input_price, output_price = price[0], price[1]
+    cached_price = price[2] if len(price) > 2 else input_price
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return round((uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000, 6)
+
+
+def record_llm_call(role: str, model: str, latency: float, waited: float, usage: dict = None,
+                    ttft: float = None, error: BaseException = None, cached: bool = False, early_dispatch: bool = False,
+                    tier: str = None, hedge_loser: bool = False):
+    """记录一条 llm_call 事件：角色、模型、排队等待、首token时间、总耗时、token、费用和结果
+
+    hedge_loser: 对冲中落败、结果被丢弃的请求（汇总时不计入调用数和LLM耗时，token和费用照计）
+    """
+    usage = usage or {}
+    fields = {
+        "role": role,
+        "model": model,
+        "ok": error is None,
+        "latency": round(latency, 3),
+        "waited": round(waited, 3),
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cached_tokens": usage.get("cached_tokens", 0),
+    }
+    if tier:
+        fields["tier"] = tier
+    if early_dispatch:
+        fields["early_dispatch"] = True
+    if hedge_loser:
+        fields["hedge_loser"] = True
+    if cached:
+        fields["cached"] = True
+    else:
+        fields["cost"] = call_cost(model, fields["prompt_tokens"], fields["completion_tokens"], fields["cached_tokens"])
+    if error is not None:
+        fields["rate_limited"] = is_rate_limit_error(error)
+        fields["error"] = type(error).__name__
+    record_event("llm_call", **fields)
+
+
+# 对冲请求：主/备调用在独立线程中执行，落败的一方继续跑完后丢弃
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_THREADS", "16")), thread_name_prefix="llm-hedge")
+_latency_samples: dict = {}
+_latency_lock = threading.Lock()
+
+
+def _observe_latency(role: str, model: str, latency: float):
+    with _latency_lock:
+        _latency_samples.setdefault((role, model), deque(maxlen=100)).append(latency)
+
+
+def hedge_delay(role: str, model: str) -> float:
+    """对冲等待时间：进程内该角色/模型最近成功调用的p95延迟；样本不足时用 LLM_HEDGE_DELAY"""
+    with _latency_lock:
+        samples = list(_latency_samples.get((role, model), ()))
+    if len(samples) < int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10")):
+        return float(os.getenv("LLM_HEDGE_DELAY", "30"))
+    return max(float(os.getenv("LLM_HEDGE_MIN_DELAY", "3")), percentile(samples, 95))
+
+
+def is_failover_error(error: BaseException) -> bool:
+    """5xx、429、超时和连接错误可转移到备用提供商"""
+    if is_rate_limit_error(error):
+        return True
+    while error is not None:
+        status = getattr(error, "status_code", None)
+        if status == 429 or (isinstance(status, int) and status >= 500):
+            return True
+        if isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError, httpx.TransportError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+class InstrumentedLLMMixin:
+    """LLM调用包装：可选的磁盘响应缓存(LLM_CACHE_MODE)、共享限流器排队，
+    并记录每次调用的角色、模型、排队/首token/调用耗时、token用量和错误类型到指标文件"""
+
+    role: str = ""
+    tier: str = "strong"
+    rate_key: str = ""
+    backup = None
+
+    def call(self, messages, *args, **kwargs):
+        # call(messages, tools, callbacks, available_functions, from_task, from_agent, response_model)
+        available_functions = kwargs.get("available_functions", args[2] if len(args) > 2 else None)
+        # 带 available_functions 的调用会在内部执行函数，重复发送有副作用，不对冲
+        if self.backup is None or available_functions:
+            return self._call_once(messages, *args, **kwargs)
+        return self._hedged_call(messages, *args, **kwargs)
+
+    def _hedged_call(self, messages, *args, **kwargs):
+        """主提供商超过近期p95延迟仍未返回时向备用提供商发同样的请求，先返回者胜出；
+        主提供商 5xx/429/连接错误时直接转移到备用。落败的请求无法中断，结果丢弃。
+
+        对冲开始后两路的流式输出都暂不推送给监听器，胜出一方的输出在返回前补发；
+        落败一方的 llm_call 事件标记 hedge_loser，不重复计入LLM耗时。
+        """
+        # 执行器只给主LLM设置了ReAct停止词
+        self.backup.stop = list(self.stop or [])
+        primary_slot = {"racing": False, "lost": False, "text": "", "delivered": 0}
+        primary = _hedge_pool.submit(contextvars.copy_context().run, self._call_once, messages, *args, hedge=primary_slot, **kwargs)
+        delay = hedge_delay(self.role, self.model)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+        except Exception as e:
+            if not is_failover_error(e):
+                raise
+            get_logger("llm").warning(f"LLM故障转移: {self.role} {self.model} -> {self.backup.model} ({type(e).__name__}: {e})")
+            record_event("llm_failover", role=self.role, primary=self.model, backup=self.backup.model, error=type(e).__name__)
+            return self.backup.call(messages, *args, **kwargs)
+
+        record_event("llm_hedge", role=self.role, primary=self.model, backup=self.backup.model, delay=round(delay, 3))
+        primary_slot["racing"] = True
+        backup_slot = {"racing": True, "lost": False, "text": "", "delivered": 0}
+        backup = _hedge_pool.submit(contextvars.copy_context().run, self.backup._call_once, messages, *args, hedge=backup_slot, **kwargs)
+        pending = {primary: ("primary", primary_slot), backup: ("backup", backup_slot)}
+        errors = {}
+        while pending:
+            done, _ = futures_wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                winner, slot = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[winner] = e
+                    continue
+                for _, other in pending.values():
+                    other["lost"] = True
+                record_event("llm_hedge_result", role=self.role, winner=winner, model=self.model if winner == "primary" else self.backup.model)
+                if slot["text"][slot["delivered"]:]:
+                    _notify_stream(self.role, slot["text"], slot["text"][slot["delivered"]:])
+                return result
+        raise errors.get("primary") or errors["backup"]
+
+    def _call_once(self, messages, *args, hedge: dict = None, **kwargs):
+        tools = kwargs.get("tools", args[0] if len(args) > 0 else None)
+        available_functions = kwargs.get("available_functions", args[2] if len(args) > 2 else None)
+        cache = get_llm_cache()
+        key = None
+        # 带 available_functions 的调用会在内部执行函数，不能缓存
+        if cache.enabled and not available_functions:
+            key = cache_key(
+                self.model, messages, tools, getattr(self, "temperature", None),
+                getattr(self, "max_tokens", None), kwargs.get("response_model"),
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                record_llm_call(self.role, self.model, 0.0, 0.0, cached=True, tier=self.tier)
+                return cached
+
+        waited = wait_for_rate_limit(self.rate_key, self.role, messages)
+        # 本次调用的首token时间与token用量（工具调用后的追加请求一并累计）
+        state = {"start": time.perf_counter(), "ttft": None, "text": "", "hedge": hedge, "usage": {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}}
+        _call_state.current = state
+        try:
+            result = super().call(messages, *args, **kwargs)
+        except Exception as e:
+            record_llm_call(
+                self.role, self.model, time.perf_counter() - state["start"], waited, state["usage"], state["ttft"],
+                error=e, tier=self.tier, hedge_loser=bool(hedge and hedge["lost"]),
+            )
+            raise
+        finally:
+            _call_state.current = None
+        latency = time.perf_counter() - state["start"]
+        _observe_latency(self.role, self.model, latency)
+        record_llm_call(
+            self.role, self.model, latency, waited, state["usage"], state["ttft"],
+            early_dispatch=state.get("early_dispatch", False), tier=self.tier, hedge_loser=bool(hedge and hedge["lost"]),
+        )
+        if key is not None:
+            cache.put(key, self.model, result)
+        return result
+
+    def _emit_stream_chunk_event(self, chunk, *args, **kwargs):
+        state = getattr(_call_state, "current", None)
+        if state is not None:
+            if state["ttft"] is None:
+                state["ttft"] = time.perf_counter() - state["start"]
+            # 原生 function calling 的工具参数分片(JSON)不是正文，不进入输出缓冲，也不参与动作/停止词检测
+            tool_call = kwargs.get("tool_call", args[2] if len(args) > 2 else None)
+            if isinstance(chunk, str) and chunk and tool_call is None:
+                state["text"] += chunk
+                hedge = state.get("hedge")
+                if hedge is None:
+                    _notify_stream(self.role, state["text"], chunk)
+                else:
+                    # 对冲中的请求：胜负未分前不推送，由 _hedged_call 补发胜出一方的输出
+                    hedge["text"] = state["text"]
+                    if not hedge["racing"]:
+                        hedge["delivered"] = len(state["text"])
+                        _notify_stream(self.role, state["text"], chunk)
+        return super()._emit_stream_chunk_event(chunk, *args, **kwargs)
+
+    def _track_token_usage_internal(self, usage_data: dict) -> None:
+        state = getattr(_call_state, "current", None)
+        if state is not None:
+            usage = state["usage"]
+            usage["prompt_tokens"] += usage_data.get("prompt_tokens") or usage_data.get("input_tokens") or 0
+            usage["completion_tokens"] += usage_data.get("completion_tokens") or usage_data.get("output_tokens") or 0
+            usage["cached_tokens"] += usage_data.get("cached_tokens") or usage_data.get("cached_prompt_tokens") or 0
+        super()._track_token_usage_internal(usage_data)
+
+
+class InstrumentedOpenAICompletion(InstrumentedLLMMixin, OpenAICompletion):
+    """OpenAI兼容接口：依赖提供商的自动前缀缓存，补充统计命中缓存的prompt token；
+    流式模式下动作参数一完整就结束读取，提前交给crew执行工具
+
+    提前执行只作用于ReAct文本协议（CREWAI_LLM_PROVIDER=deepseek，关闭了原生function calling）；
+    其他提供商由crewai传入 tools 走原生function calling，工具调用在流末尾才完整，提前截断没有收益，走原实现。
+    """
+
+    def _early_cut(self, text: str):
+        """出现停止词或 ReAct 动作参数JSON完整时返回截断位置"""
+        cuts = [i for i in (text.find(word) for word in (self.stop or [])) if i >= 0]
+        action_end = react_action_end(text)
+        if action_end is not None:
+            cuts.append(action_end)
+        return min(cuts) if cuts else None
+
+    def _handle_streaming_completion(self, params, available_functions=None, from_task=None, from_agent=None, response_model=None) -> str:
+        # 结构化输出和原生 function calling(除deepseek外的提供商) 需要完整响应，走原实现
+        if response_model is not None or available_functions or params.get("tools"):
+            return super()._handle_streaming_completion(params, available_functions, from_task, from_agent, response_model)
+
+        stream = _sync_client(self).chat.completions.create(**{**params, "stream_options": {"include_usage": True}})
+        text, cut, usage_seen = "", None, False
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self._track_token_usage_internal(self._extract_openai_token_usage(chunk))
+                    usage_seen = True
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                text += delta
+                self._emit_stream_chunk_event(chunk=delta, from_task=from_task, from_agent=from_agent)
+                # 只在可能完成动作参数或出现停止词的分片上检查
+                if "}" in delta or "\n" in delta or ":" in delta:
+                    cut = self._early_cut(text)
+                    if cut is not None:
+                        break
+        finally:
+            # 提前结束时关闭连接，服务端停止生成剩余内容
+            stream.close()
+
+        if cut is not None:
+            text = text[:cut]
+            state = getattr(_call_state, "current", None)
+            if state is not None:
+                state["early_dispatch"] = True
+        if not usage_seen:
+            # 提前结束收不到末尾的usage分片，按字符数估算
+            self._track_token_usage_internal({"prompt_tokens": estimate_tokens(params["messages"]), "completion_tokens": len(text) // 3 + 1})
+        text = self._apply_stop_words(text)
+        self._emit_call_completed_event(
+            response=text,
+            call_type=LLMCallType.LLM_CALL,
+            from_task=from_task,
+            from_agent=from_agent,
+            messages=params["messages"],
+        )
+        return text
+
+    def _extract_openai_token_usage(self, response) -> dict:
+        usage = super()._extract_openai_token_usage(response)
+        raw = getattr(response, "usage", None)
+        if raw is not None:
+            details = getattr(raw, "prompt_tokens_details", None)
+            # OpenAI: prompt_tokens_details.cached_tokens；DeepSeek: prompt_cache_hit_tokens
+            cached = getattr(details, "cached_tokens", None) if details is not None else None
+            if cached is None:
+                cached = getattr(raw, "prompt_cache_hit_tokens", None)
+            if cached is None and getattr(raw, "model_extra", None):
+                cached = raw.model_extra.get("prompt_cache_hit_tokens")
+            usage["cached_tokens"] = int(cached or 0)
+        return usage
+
+
+def _count_cache_breakpoints(content) -> int:
+    if isinstance(content, list):
+        return sum(1 for block in content if isinstance(block, dict) and "cache_control" in block)
+    return 0
+
+
+def _with_cache_control(content):
+    """把消息内容转成带 cache_control 断点的content block列表"""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+    if isinstance(content, list) and content and isinstance(content[-1], dict):
+        return content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+    return content
+
+
+class InstrumentedAnthropicCompletion(InstrumentedLLMMixin, AnthropicCompletion):
+    """Anthropic：在system、首条user(任务描述)和最后一条消息上设置 cache_control 断点（上限4个）"""
+
+    def _prepare_completion_params(self, messages, *args, **kwargs) -> dict:
+        # 新版 crewai 额外传入 available_functions，这里原样透传
+        params = super()._prepare_completion_params(messages, *args, **kwargs)
+        messages = [dict(m) for m in params.get("messages", [])]
+        # 新版 crewai 自身也可能已打断点，总数不超过 Anthropic 上限4个
+        budget = 4 - _count_cache_breakpoints(params.get("system")) - sum(_count_cache_breakpoints(m.get("content")) for m in messages)
+        if params.get("system") and budget > 0 and not _count_cache_breakpoints(params["system"]):
+            params["system"] = _with_cache_control(params["system"])
+            budget -= 1
+        # 首条消息(任务描述)；以及滚动断点：下一轮可复用到本轮为止的全部前缀
+        targets = [0, len(messages) - 1] if len(messages) > 1 else [0] if messages else []
+        for i in targets:
+            if budget > 0 and not _count_cache_breakpoints(messages[i]["content"]):
+                messages[i]["content"] = _with_cache_control(messages[i]["content"])
+                budget -= 1
+        params["messages"] = messages
+        return params
+
+    def _extract_anthropic_token_usage(self, response) -> dict:
+        usage = super()._extract_anthropic_token_usage(response)
+        raw = getattr(response, "usage", None)
+        if raw is not None:
+            cache_read = int(getattr(raw, "cache_read_input_tokens", 0) or 0)
+            if "cached_prompt_tokens" not in usage:
+                # 旧版 crewai 的 input_tokens 不含缓存部分，这里还原为完整prompt长度便于计算命中率
+                cache_write = int(getattr(raw, "cache_creation_input_tokens", 0) or 0)
+                usage["input_tokens"] = usage.get("input_tokens", 0) + cache_read + cache_write
+                usage["total_tokens"] = usage["input_tokens"] + usage.get("output_tokens", 0)
+            usage["cached_tokens"] = cache_read
+        return usage
+
+
+def token_usage_snapshot(llms) -> dict:
+    """汇总一组crew LLM的累计prompt/缓存命中token"""
+    prompt = cached = 0
+    llms = list(llms)
+    # 对冲/故障转移到备用提供商的用量一并统计
+    llms += [llm.backup for llm in llms if getattr(llm, "backup", None) is not None]
+    for llm in llms:
+        usage = getattr(llm, "_token_usage", None) or {}
+        prompt += usage.get("prompt_tokens", 0)
+        cached += usage.get("cached_prompt_tokens", 0)
+    return {"prompt_tokens": prompt, "cached_prompt_tokens": cached}
+
+
+def _sync_client(llm):
+    """crewai 不同版本的同步SDK客户端属性：新版为惰性的 _client，旧版为 client"""
+    return llm._get_sync_client() if hasattr(llm, "_get_sync_client") else llm.client
+
+
+def _attach_http_client(llm, base_url):
+    """用共享连接池重建crew LLM的同步SDK客户端（异步客户端保持不变，crew只走同步调用）"""
+    sdk_cls = Anthropic if isinstance(llm, AnthropicCompletion) else OpenAI
+    try:
+        client = sdk_cls(**{**llm._get_client_params(), "http_client": get_http_client(base_url)})
+    except Exception as e:
+        get_logger("llm").warning(f"共享连接池不可用，使用默认客户端: {e}")
+        return
+    if hasattr(llm, "_get_sync_client"):
+        llm._client = client
+    else:
+        llm.client = client
+
 
 class CrewLLMConfig:
-    """LLM 配置类：根据角色类型返回 ChatOpenAI 实例"""
+    """LLM 配置类：根据角色类型(及档位)返回 ChatOpenAI 实例
+
+    档位：strong 使用 CREWAI_LLM_*；fast 使用 CREWAI_LLM_FAST_*（未配置 CREWAI_LLM_FAST_NAME 时全部为 strong）。
+    默认侦察与漏洞猎人走 fast 档，卡住时由 lib.escalation 升级到 strong。
+    """
 
     cache = {}  
+    role_tiers = {"recon_scout": "fast", "vulnerability_hunter": "fast"}
+
+    def tier_for_role(self, role_type: str) -> str:
+        """角色默认档位，可用 CREWAI_LLM_ROLE_TIERS=recon_scout=fast,ctf_exploit_expert=strong 覆盖"""
+        if not os.getenv("CREWAI_LLM_FAST_NAME"):
+            return "strong"
+        tiers = dict(self.role_tiers)
+        for item in os.getenv("CREWAI_LLM_ROLE_TIERS", "").split(","):
+            if "=" in item:
+                role, tier = item.split("=", 1)
+                tiers[role.strip()] = tier.strip()
+        return "fast" if tiers.get(role_type) == "fast" else "strong"
+
+    def get_llm_by_role(self, role_type: str, tier: str = None) -> LLM:
+        tier = tier or self.tier_for_role(role_type)
+        cache_key = role_type if tier == "strong" else f"{role_type}@{tier}"
+        if cache_key in self.cache:
+            return self.cache[cache_key]
 
-    def get_llm_by_role(self, role_type: str) -> LLM:
-        if role_type in self.cache:
-            return self.cache[role_type]
+        llm = self._build_llm(role_type, tier, "CREWAI_LLM_FAST" if tier == "fast" else None)
+        if os.getenv("CREWAI_LLM_BACKUP_BASE_URL") or os.getenv("CREWAI_LLM_BACKUP_NAME"):
+            # 备用提供商：慢请求对冲、5xx/429 故障转移（见 InstrumentedLLMMixin.call）
+            llm.backup = self._build_llm(role_type, tier, "CREWAI_LLM_BACKUP")
+        self.cache[cache_key] = llm
+        return llm
 
+    def _build_llm(self, role_type: str, tier: str, override_prefix: str = None) -> LLM:
+        """按 CREWAI_LLM_* 构建，override_prefix 下的同名变量(如 CREWAI_LLM_FAST_NAME)优先"""
         configs = {
             "recon_scout": {"model": "deepseek-chat", "temperature": 0.15, "max_tokens": 4096},
             "vulnerability_hunter": {"model": "deepseek-chat", "temperature": 0.2, "max_tokens": 4096},
@@ -26,12 +523,17 @@ class CrewLLMConfig:
         api_key     = os.getenv("CREWAI_LLM_API_KEY")
         stream      = os.getenv("CREWAI_LLM_STREAM", "false").lower() == "true"
         llm_timeout = int(os.getenv("LLM_TIMEOUT", "60"))
+        if override_prefix:
+            provider    = os.getenv(f"{override_prefix}_PROVIDER", provider)
+            model_name  = os.getenv(f"{override_prefix}_NAME", model_name)
+            base_url    = os.getenv(f"{override_prefix}_BASE_URL", base_url)
+            api_key     = os.getenv(f"{override_prefix}_API_KEY", api_key)
         
         cfg = configs.get(role_type, configs["vulnerability_hunter"])
 
         if provider == "anthropic":
             os.environ["ANTHROPIC_API_KEY"] = api_key
-            llm = AnthropicCompletion(
+            llm = InstrumentedAnthropicCompletion(
                 provider="anthropic",
                 model=model_name or cfg["model"],
                 base_url=base_url,
@@ -39,10 +541,11 @@ class CrewLLMConfig:
                 temperature=1.0,
                 max_tokens=cfg["max_tokens"],
                 timeout=llm_timeout,
+                stream=stream,
             )
             llm.supports_tools = True
         elif provider == "deepseek":
-            llm = OpenAICompletion(
+            llm = InstrumentedOpenAICompletion(
                 model=(model_name or cfg["model"]),
                 base_url=base_url,
                 api_key=api_key,
@@ -53,7 +556,7 @@ class CrewLLMConfig:
             )
             llm.is_o1_model = True
         else:
-            llm = OpenAICompletion(
+            llm = InstrumentedOpenAICompletion(
                 model=model_name or cfg["model"],
                 base_url=base_url,
                 api_key=api_key,
@@ -64,31 +567,90 @@ class CrewLLMConfig:
                 # extra_body={"reasoning_split": True},
                 # reasoning_effort="none"
             )
-        self.cache[role_type] = llm
+        # 同一 base_url 的所有角色共享一个 keep-alive 连接池
+        _attach_http_client(llm, base_url)
+        llm.role = role_type
+        llm.tier = tier
+        llm.rate_key = bucket_key(provider, base_url, api_key)
         return llm
 
 
 
-if os.getenv("BROWSER_MODEL_PROVIDER") == "anthropic":
-    BrowserLLM = ChatAnthropic(
-        model=os.getenv("BROWSER_MODEL_NAME"),
-        api_key=os.getenv("BROWSER_OPENAI_KEY"),
-        base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
-        temperature=0.15
-    )
-elif os.getenv("BROWSER_MODEL_PROVIDER") == "deepseek":
-    BrowserLLM = ChatDeepSeek(
-        model=os.getenv("BROWSER_MODEL_NAME"),
-        api_key=os.getenv("BROWSER_OPENAI_KEY"),
-        base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
-        temperature=0.15
-    )
-else:
-    BrowserLLM = ChatOpenAI(
-        model=os.getenv("BROWSER_MODEL_NAME"),
-        api_key=os.getenv("BROWSER_OPENAI_KEY"),
-        base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
-        temperature=0.15,
-        reasoning_models=["deepseek/deepseek-reasoner", "MiniMax-M2", "MiniMaxAI/MiniMax-M2"],
-        # reasoning_effort="none"
-    )
\ No newline at end of file
+class RateLimitedChatMixin:
+    """browser_use 模型与crew共用限流器，按 browser 角色排队，并记录 llm_call 指标"""
+
+    async def ainvoke(self, messages, output_format=None, **kwargs):
+        rate_key = bucket_key(os.getenv("BROWSER_MODEL_PROVIDER"), os.getenv("BROWSER_OPENAI_BASE_URL"), os.getenv("BROWSER_OPENAI_KEY"))
+        waited = await asyncio.to_thread(wait_for_rate_limit, rate_key, "browser", messages)
+        start = time.perf_counter()
+        try:
+            # 新版 browser_use 会额外传入 session_id 等参数
+            result = await super().ainvoke(messages, output_format, **kwargs)
+        except Exception as e:
+            record_llm_call("browser", self.model, time.perf_counter() - start, waited, error=e)
+            raise
+        usage = getattr(result, "usage", None)
+        record_llm_call("browser", self.model, time.perf_counter() - start, waited, {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": usage.prompt_cached_tokens or 0,
+        } if usage is not None else None)
+        return result
+
+
+class RateLimitedChatOpenAI(RateLimitedChatMixin, ChatOpenAI):
+    def _get_client_params(self):
+        # browser_use 每次调用都新建 AsyncOpenAI，注入共享连接池以复用连接
+        return {**super()._get_client_params(), "http_client": get_async_http_client(self.base_url)}
+
+
+class RateLimitedChatDeepSeek(RateLimitedChatMixin, ChatDeepSeek):
+    def _client(self):
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            http_client=get_async_http_client(self.base_url),
+            **(self.client_params or {}),
+        )
+
+
+class RateLimitedChatAnthropic(RateLimitedChatMixin, ChatAnthropic):
+    def _get_client_params(self):
+        return {**super()._get_client_params(), "http_client": get_async_http_client(self.base_url)}
+
+
+_browser_llm = None
+_browser_llm_lock = threading.Lock()
+
+
+def get_browser_llm():
+    """browser_use 使用的LLM，首次使用时创建（导入本模块不再构建客户端）"""
+    global _browser_llm
+    with _browser_llm_lock:
+        if _browser_llm is not None:
+            return _browser_llm
+        if os.getenv("BROWSER_MODEL_PROVIDER") == "anthropic":
+            _browser_llm = RateLimitedChatAnthropic(
+                model=os.getenv("BROWSER_MODEL_NAME"),
+                api_key=os.getenv("BROWSER_OPENAI_KEY"),
+                base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
+                temperature=0.15
+            )
+        elif os.getenv("BROWSER_MODEL_PROVIDER") == "deepseek":
+            _browser_llm = RateLimitedChatDeepSeek(
+                model=os.getenv("BROWSER_MODEL_NAME"),
+                api_key=os.getenv("BROWSER_OPENAI_KEY"),
+                base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
+                temperature=0.15
+            )
+        else:
+            _browser_llm = RateLimitedChatOpenAI(
+                model=os.getenv("BROWSER_MODEL_NAME"),
+                api_key=os.getenv("BROWSER_OPENAI_KEY"),
+                base_url=os.getenv("BROWSER_OPENAI_BASE_URL"),
+                temperature=0.15,
+                reasoning_models=["deepseek/deepseek-reasoner", "MiniMax-M2", "MiniMaxAI/MiniMax-M2"],
+                # reasoning_effort="none"
+            )
+        return _browser_llm
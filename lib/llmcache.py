@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from lib.logger import get_logger
+
+CACHE_MODES = ("off", "record", "replay")
+
+
+def _normalize_messages(messages) -> List[Dict[str, Any]]:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for m in messages or []:
+        if isinstance(m, dict):
+            normalized.append({
+                "role": m.get("role", "user"),
+                "content": str(m.get("content", "")).strip(),
+                **({"tool_calls": m["tool_calls"]} if m.get("tool_calls") else {}),
+                **({"tool_call_id": m["tool_call_id"]} if m.get("tool_call_id") else {}),
+            })
+        else:
+            normalized.append({"role": "user", "content": str(m).strip()})
+    return normalized
+
+
+def cache_key(model: str, messages, tools=None, temperature=None, max_tokens=None, response_model=None) -> str:
+    """规范化后的 (模型, 消息, 工具, 温度, 输出长度, 结构化输出) 的 SHA-256"""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": _normalize_messages(messages),
+            "tools": tools or [],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_model": getattr(response_model, "__name__", None),
+        },
+        ensure_ascii=False, sort_keys=True, default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """磁盘LLM响应缓存 - SQLite存储，超过容量按最近最少使用淘汰
+
+    模式（LLM_CACHE_MODE）：
+    - off:    不读不写（默认）
+    - record: 总是真实调用并写入/覆盖缓存
+    - replay: 命中直接返回缓存；未命中时真实调用并写入
+    """
+
+    def __init__(self, mode: str = None, db_path: str = None, max_bytes: int = None):
+        mode = (mode or os.getenv("LLM_CACHE_MODE", "off")).lower()
+        self.mode = mode if mode in CACHE_MODES else "off"
+        self.db_path = db_path or os.getenv("LLM_CACHE_DB", "logs/llm_cache.db")
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024)
+        self.logger = get_logger("llmcache")
+        if self.mode != "off":
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created_at REAL, last_used REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def get(self, key: str) -> Optional[str]:
+        """replay 模式下查询缓存"""
+        if self.mode != "replay":
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        if not self.enabled or not isinstance(response, str) or not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, model, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """总大小超过上限时按 last_used 淘汰到上限的 90%"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        self.logger.info(f"LLM缓存淘汰 {removed} 条，当前 {total / 1024 / 1024:.1f}MB")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"mode": self.mode}
+        with closing(self._connect()) as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"mode": self.mode, "entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """进程内共享的响应缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
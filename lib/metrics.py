@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# 运行指标：每个事件一行JSON，按天落盘到 logs/metrics/YYYY-MM-DD.jsonl
+# 各进程以追加方式写入同一文件，单行写入足够小，无需加锁
+# 汇总：python -m lib.metrics [--day YYYY-MM-DD] [--since-hours N]
+
+# 进程级上下文字段（如当前题目code），合并进之后的每条事件
+_context: Dict[str, Any] = {}
+
+
+def set_context(**fields: Any):
+    """设置/清除(值为None)进程级上下文字段"""
+    for key, value in fields.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = value
+
+
+def get_metrics_path(day: Optional[str] = None) -> Path:
+    metrics_dir = Path(os.getenv("METRICS_DIR", "logs/metrics"))
+    return metrics_dir / f"{day or datetime.now().strftime('%Y-%m-%d')}.jsonl"
+
+
+def record_event(kind: str, **fields: Any):
+    """记录一条指标事件，失败时静默（指标不影响主流程）"""
+    event = {"ts": round(time.time(), 3), "kind": kind, "pid": os.getpid(), **_context, **fields}
+    try:
+        path = get_metrics_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+    except Exception:
+        pass
+
+
+def read_events(path: Path, kinds: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """读取指标文件中的全部事件"""
+    kinds = set(kinds) if kinds else None
+    events = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if kinds is None or event.get("kind") in kinds:
+                    events.append(event)
+    except FileNotFoundError:
+        pass
+    return events
+
+
+class EventTail:
+    """增量读取指标文件（跨天自动切换），保留最近 window 秒内的事件"""
+
+    def __init__(self, kinds: Iterable[str], window: float = 120.0):
+        self.kinds = set(kinds)
+        self.window = window
+        self.events: List[Dict[str, Any]] = []
+        self._path: Optional[Path] = None
+        self._offset = 0
+
+    def poll(self) -> List[Dict[str, Any]]:
+        path = get_metrics_path()
+        if path != self._path:
+            self._path, self._offset = path, 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                f.seek(self._offset)
+                while True:
+                    line = f.readline()
+                    # 只消费完整的行，写入中的半行留待下次读取
+                    if not line.endswith("\n"):
+                        break
+                    self._offset = f.tell()
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if event.get("kind") in self.kinds:
+                        self.events.append(event)
+        except FileNotFoundError:
+            pass
+        cutoff = time.time() - self.window
+        self.events = [e for e in self.events if e.get("ts", 0) >= cutoff]
+        return self.events
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _summarize_calls(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # 对冲落败的请求与胜出请求并行且结果被丢弃：不计调用数/延迟/LLM耗时，token和费用照计
+    counted = [e for e in calls if not e.get("hedge_loser")]
+    latencies = [e.get("latency", 0.0) for e in counted if e.get("ok") and not e.get("cached")]
+    ttfts = [e["ttft"] for e in counted if e.get("ttft") is not None]
+    waits = [e.get("waited", 0.0) for e in counted]
+    return {
+        "calls": len(counted),
+        "errors": sum(1 for e in counted if not e.get("ok")),
+        "cached": sum(1 for e in counted if e.get("cached")),
+        "hedge_lost": len(calls) - len(counted),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttft_p50": percentile(ttfts, 50),
+        "wait_p95": percentile(waits, 95),
+        "llm_seconds": sum(e.get("latency", 0.0) + e.get("waited", 0.0) for e in counted),
+        "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in calls),
+        "completion_tokens": sum(e.get("completion_tokens") or 0 for e in calls),
+        "cached_tokens": sum(e.get("cached_tokens") or 0 for e in calls),
+        "cost": sum(e.get("cost") or 0.0 for e in calls),
+    }
+
+
+def summarize(events: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """按角色、按题目汇总 llm_call 事件；题目维度附带 crew_run 总耗时以区分LLM/工具耗时，及对话压缩节省/使前缀缓存失效的token"""
+    calls = [e for e in events if e.get("kind") == "llm_call"]
+    by_role: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    by_code: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for e in calls:
+        role = e.get("role") or "-"
+        by_role[f"{role}@fast" if e.get("tier") == "fast" else role].append(e)
+        by_code[str(e.get("code") or "-")].append(e)
+
+    run_seconds: Dict[str, float] = defaultdict(float)
+    compact_saved: Dict[str, int] = defaultdict(int)
+    compact_invalidated: Dict[str, int] = defaultdict(int)
+    for e in events:
+        if e.get("kind") == "crew_run":
+            run_seconds[str(e.get("code"))] += e.get("duration", 0.0)
+        elif e.get("kind") == "compaction":
+            compact_saved[str(e.get("code"))] += e.get("saved", 0)
+            compact_invalidated[str(e.get("code"))] += e.get("cache_invalidated", 0)
+
+    codes = {}
+    for code, items in by_code.items():
+        stats = _summarize_calls(items)
+        wall = run_seconds.get(code, 0.0)
+        stats["run_seconds"] = wall
+        # LLM调用期间同一crew内不会并行执行工具，差值近似为工具/框架耗时
+        stats["llm_share"] = min(1.0, stats["llm_seconds"] / wall) if wall else None
+        stats["compact_saved"] = compact_saved.get(code, 0)
+        # 压缩改写prompt中段后，下一次调用无法命中前缀缓存的token数
+        stats["compact_invalidated"] = compact_invalidated.get(code, 0)
+        codes[code] = stats
+    return {"role": {k: _summarize_calls(v) for k, v in by_role.items()}, "code": codes}
+
+
+def _print_table(title: str, rows: Dict[str, Dict[str, Any]], with_run: bool = False):
+    print(f"== {title} ==")
+    header = f"{'name':<28}{'calls':>6}{'err':>5}{'hit':>5}{'p50':>8}{'p95':>8}{'p99':>8}{'ttft50':>8}{'wait95':>8}{'prompt':>10}{'compl':>9}{'cached':>9}{'cost':>9}"
+    if with_run:
+        header += f"{'run_s':>9}{'llm%':>7}{'saved':>8}{'inval':>8}"
+    print(header)
+    for name, s in sorted(rows.items(), key=lambda kv: -kv[1]["llm_seconds"]):
+        line = (
+            f"{name[:27]:<28}{s['calls']:>6}{s['errors']:>5}{s['cached']:>5}"
+            f"{s['p50']:>8.1f}{s['p95']:>8.1f}{s['p99']:>8.1f}{s['ttft_p50']:>8.1f}{s['wait_p95']:>8.1f}"
+            f"{s['prompt_tokens']:>10}{s['completion_tokens']:>9}{s['cached_tokens']:>9}{s['cost']:>9.4f}"
+        )
+        if with_run:
+            share = f"{s['llm_share']:.0%}" if s["llm_share"] is not None else "-"
+            line += f"{s['run_seconds']:>9.0f}{share:>7}{s['compact_saved']:>8}{s['compact_invalidated']:>8}"
+        print(line)
+    print()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="汇总LLM调用指标（按角色/按题目的延迟分位数、token和费用）")
+    parser.add_argument("--day", action="append", help="日期 YYYY-MM-DD，可重复；默认今天")
+    parser.add_argument("--path", action="append", help="直接指定指标文件，可重复")
+    parser.add_argument("--since-hours", type=float, default=None, help="只统计最近N小时")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args(argv)
+
+    paths = [Path(p) for p in (args.path or [])] or [get_metrics_path(day) for day in (args.day or [None])]
+    events = [e for p in paths for e in read_events(p, ["llm_call", "crew_run", "compaction"])]
+    if args.since_hours is not None:
+        cutoff = time.time() - args.since_hours * 3600
+        events = [e for e in events if e.get("ts", 0) >= cutoff]
+    summary = summarize(events)
+    if args.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    if not summary["role"]:
+        print(f"无LLM调用事件: {', '.join(str(p) for p in paths)}")
+        return
+    _print_table("按角色", summary["role"])
+    _print_table("按题目", summary["code"], with_run=True)
+
+
+if __name__ == "__main__":
+    main()
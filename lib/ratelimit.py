@@ -0,0 +1,180 @@
+import os
+import time
+import sqlite3
+import random
+import hashlib
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+from lib.logger import get_logger
+
+# 角色优先级：数值越小越优先（协调器卡住会阻塞整题，优先放行）
+ROLE_PRIORITY = {
+    "opportunistic_coordinator": 0,
+    "ctf_exploit_expert": 1,
+    "vulnerability_hunter": 2,
+    "recon_scout": 3,
+    "browser": 3,
+}
+DEFAULT_PRIORITY = 2
+
+
+def bucket_key(provider: str, base_url: str, api_key: str) -> str:
+    """按 provider + base_url + key 划分预算，key 只保留摘要"""
+    digest = hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:8]
+    return f"{provider or 'openai'}|{base_url or ''}|{digest}"
+
+
+def estimate_tokens(messages) -> int:
+    """粗略估计prompt的token数（约3字符/token）"""
+    if isinstance(messages, str):
+        return len(messages) // 3 + 1
+    return sum(len(str(m.get("content", "") if isinstance(m, dict) else m)) for m in (messages or [])) // 3 + 1
+
+
+class TokenBucketLimiter:
+    """跨进程LLM令牌桶限流 - 基于SQLite文件锁
+
+    所有worker进程共享同一个库，按 bucket_key 分别限制每分钟请求数(RPM)和token数(TPM)，
+    两者默认均为0即不限流，需显式配置 LLM_RATE_RPM/LLM_RATE_TPM。
+    等待者按 (优先级 - 等待时长/aging) 排队，仅队首可取令牌：同优先级先到先得，
+    低优先级等待越久越靠前，不会饿死。持有者进程已退出的排队记录会被自动清理。
+    """
+
+    def __init__(self, db_path: str = None, rpm: float = None, tpm: float = None, burst_seconds: float = None, aging: float = 60.0):
+        self.db_path = db_path or os.getenv("LLM_RATE_DB", "logs/llm_ratelimit.db")
+        self.rpm = rpm if rpm is not None else float(os.getenv("LLM_RATE_RPM", "0"))
+        self.tpm = tpm if tpm is not None else float(os.getenv("LLM_RATE_TPM", "0"))
+        # 桶容量 = burst_seconds 秒的配额，避免启动瞬间全部并发打满
+        self.burst_seconds = burst_seconds if burst_seconds is not None else float(os.getenv("LLM_RATE_BURST_SECONDS", "10"))
+        self.aging = aging
+        self.logger = get_logger("ratelimit")
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS waiters ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, priority INTEGER, enqueued_at REAL, owner_pid INTEGER)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _capacity(self, per_minute: float) -> float:
+        return max(1.0, per_minute * self.burst_seconds / 60.0)
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _purge_dead_waiters(self, conn: sqlite3.Connection):
+        for row_id, pid in conn.execute("SELECT id, owner_pid FROM waiters").fetchall():
+            if not self._pid_alive(pid):
+                conn.execute("DELETE FROM waiters WHERE id = ?", (row_id,))
+
+    def _try_take(self, conn: sqlite3.Connection, key: str, tokens: int) -> float:
+        """队首尝试取令牌：成功返回0，否则返回还需等待的秒数"""
+        now = time.time()
+        req_cap = self._capacity(self.rpm) if self.rpm > 0 else 0
+        tok_cap = self._capacity(self.tpm) if self.tpm > 0 else 0
+        row = conn.execute("SELECT requests, tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+        requests, avail_tokens, updated_at = row if row else (req_cap, tok_cap, now)
+        elapsed = max(0.0, now - updated_at)
+        if self.rpm > 0:
+            requests = min(req_cap, requests + elapsed * self.rpm / 60.0)
+        if self.tpm > 0:
+            avail_tokens = min(tok_cap, avail_tokens + elapsed * self.tpm / 60.0)
+            # 单次请求超过桶容量时按满桶放行，避免永远等待
+            tokens = min(tokens, tok_cap)
+
+        wait = 0.0
+        if self.rpm > 0 and requests < 1:
+            wait = max(wait, (1 - requests) * 60.0 / self.rpm)
+        if self.tpm > 0 and avail_tokens < tokens:
+            wait = max(wait, (tokens - avail_tokens) * 60.0 / self.tpm)
+        if wait == 0.0:
+            requests -= 1 if self.rpm > 0 else 0
+            avail_tokens -= tokens if self.tpm > 0 else 0
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+            (key, requests, avail_tokens, now),
+        )
+        return wait
+
+    def acquire(self, key: str, priority: int = DEFAULT_PRIORITY, tokens: int = 0,
+                min_poll: float = 0.05, max_poll: float = 1.0) -> float:
+        """阻塞直到获得一次调用配额，返回等待秒数
+
+        队首按令牌补充所需时间等待；非队首从 min_poll 起指数退避到 max_poll 并加随机抖动，
+        避免大量worker同时轮询争抢写锁。
+        """
+        if not self.enabled:
+            return 0.0
+        start = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO waiters (key, priority, enqueued_at, owner_pid) VALUES (?, ?, ?, ?)",
+                (key, priority, start, os.getpid()),
+            )
+            waiter_id = cursor.lastrowid
+            poll = min_poll
+            try:
+                while True:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._purge_dead_waiters(conn)
+                        head = conn.execute(
+                            "SELECT id FROM waiters WHERE key = ? ORDER BY priority - (? - enqueued_at) / ?, id LIMIT 1",
+                            (key, time.time(), self.aging),
+                        ).fetchone()
+                        wait = None
+                        if head and head[0] == waiter_id:
+                            wait = self._try_take(conn, key, tokens)
+                            if wait == 0.0:
+                                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                    if wait == 0.0:
+                        return time.time() - start
+                    if wait is None:
+                        wait, poll = poll, min(poll * 2, max_poll)
+                    else:
+                        poll = min_poll
+                    time.sleep(min(wait, max_poll) * random.uniform(0.8, 1.2))
+            finally:
+                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+        finally:
+            conn.close()
+
+
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> TokenBucketLimiter:
+    """进程内共享的限流器"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucketLimiter()
+        return _limiter
@@ -0,0 +1,228 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+from lib.logger import get_logger
+
+# 记录的资源类型（CDP Network.ResourceType），图片/样式/字体等静态资源不入索引
+RECORD_TYPES = ("Document", "XHR", "Fetch", "Other", "Script", "EventSource", "WebSocket", "Ping")
+# 重放时不带的请求头（由请求库或连接决定）
+SKIP_HEADERS = ("content-length", "connection", "accept-encoding", "host")
+
+
+def _headers_dict(headers) -> Dict[str, str]:
+    """CDP(dict) / HAR(list[{name, value}]) 两种请求头格式统一为dict"""
+    if isinstance(headers, dict):
+        return {str(k): str(v) for k, v in headers.items()}
+    return {str(h.get("name")): str(h.get("value")) for h in headers or [] if h.get("name") and not str(h.get("name")).startswith(":")}
+
+
+class RequestIndex:
+    """单题请求清单 - 浏览器代理见过的每个请求(XHR/表单提交/页面)的结构化索引
+
+    数据来源：
+    - BrowserTool 会话的CDP网络事件（实时，含HTTP请求）
+    - browser_use 写出的HAR文件（会话关闭时合并，仅HTTPS）
+    按 (方法, URL, 请求体) 去重，编号 H1、H2…；RawHttpTool 可按编号直接重放，
+    其他agent无需再用爬虫或浏览器重新发现同一批请求。
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("REQUEST_INDEX_MAX", "500"))
+        self.logger = get_logger("request_index")
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """新题开始时清空"""
+        with self._lock:
+            self._entries: Dict[str, Dict[str, Any]] = {}
+            self._keys: Dict[Tuple[str, str, str], str] = {}
+            self._pending: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, method: str, url: str, headers=None, post_data: Optional[str] = None,
+            resource_type: Optional[str] = None, source: str = "cdp") -> Optional[str]:
+        """登记一个请求，返回编号（已存在则返回原编号并合并请求头）"""
+        if not url or not url.startswith(("http://", "https://")):
+            return None
+        if resource_type and resource_type not in RECORD_TYPES:
+            return None
+        method = (method or "GET").upper()
+        url = url.split("#", 1)[0]
+        post_data = post_data or ""
+        key = (method, url, post_data)
+        headers = _headers_dict(headers)
+        with self._lock:
+            entry_id = self._keys.get(key)
+            if entry_id is not None:
+                self._entries[entry_id]["headers"].update(headers)
+                self._entries[entry_id]["hits"] += 1
+                return entry_id
+            if len(self._entries) >= self.max_entries:
+                return None
+            entry_id = f"H{len(self._entries) + 1}"
+            parts = urlsplit(url)
+            params = [k for k, _ in parse_qsl(parts.query, keep_blank_values=True)]
+            if post_data and "json" not in headers.get("Content-Type", headers.get("content-type", "")):
+                params += [k for k, _ in parse_qsl(post_data, keep_blank_values=True)]
+            self._entries[entry_id] = {
+                "id": entry_id,
+                "method": method,
+                "url": url,
+                "params": list(dict.fromkeys(params)),
+                "headers": headers,
+                "post_data": post_data,
+                "cookies": {},
+                "type": resource_type or "",
+                "status": None,
+                "mime": "",
+                "set_cookies": [],
+                "source": source,
+                "hits": 1,
+            }
+            self._keys[key] = entry_id
+            return entry_id
+
+    def set_response(self, entry_id: str, status: Optional[int] = None, mime: str = "", set_cookies: List[str] = None):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return
+            if status is not None:
+                entry["status"] = status
+            if mime:
+                entry["mime"] = mime
+            for cookie in set_cookies or []:
+                if cookie not in entry["set_cookies"]:
+                    entry["set_cookies"].append(cookie)
+
+    def add_cookies(self, entry_id: str, cookies: Dict[str, str]):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is not None:
+                entry["cookies"].update(cookies)
+
+    # ---------- CDP 网络事件 ----------
+
+    def on_cdp_event(self, method: str, params: Dict[str, Any]):
+        """处理 Network.* 事件（在浏览器事件循环中调用，不能抛异常）"""
+        try:
+            request_id = params.get("requestId")
+            if method == "Network.requestWillBeSent":
+                request = params.get("request") or {}
+                entry_id = self.add(
+                    request.get("method"), request.get("url"), request.get("headers"),
+                    request.get("postData"), params.get("type"),
+                )
+                if entry_id and request_id:
+                    # ExtraInfo 事件可能晚于 loadingFinished 到达，映射不随请求结束删除，超量时整体清理
+                    if len(self._pending) > self.max_entries * 4:
+                        self._pending.clear()
+                    self._pending[request_id] = entry_id
+            elif method == "Network.requestWillBeSentExtraInfo":
+                entry_id = self._pending.get(request_id)
+                if entry_id:
+                    cookies = {
+                        c["cookie"]["name"]: c["cookie"]["value"]
+                        for c in params.get("associatedCookies") or []
+                        if not c.get("blockedReasons") and c.get("cookie")
+                    }
+                    self.add_cookies(entry_id, cookies)
+            elif method == "Network.responseReceived":
+                entry_id = self._pending.get(request_id)
+                response = params.get("response") or {}
+                if entry_id:
+                    self.set_response(entry_id, response.get("status"), response.get("mimeType", ""))
+            elif method == "Network.responseReceivedExtraInfo":
+                entry_id = self._pending.get(request_id)
+                if entry_id:
+                    headers = params.get("headers") or {}
+                    set_cookie = next((v for k, v in headers.items() if k.lower() == "set-cookie"), "")
+                    self.set_response(entry_id, params.get("statusCode"), set_cookies=[c for c in set_cookie.split("\n") if c])
+        except Exception as e:
+            self.logger.debug(f"处理网络事件失败 {method}: {e}")
+
+    # ---------- HAR ----------
+
+    def ingest_har(self, path) -> int:
+        """合并HAR文件中的请求，返回新增数量"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        try:
+            har = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            self.logger.warning(f"解析HAR失败: {path} - {e}")
+            return 0
+        before = len(self._entries)
+        for item in har.get("log", {}).get("entries", []):
+            request = item.get("request") or {}
+            response = item.get("response") or {}
+            entry_id = self.add(
+                request.get("method"), request.get("url"), request.get("headers"),
+                (request.get("postData") or {}).get("text"), source="har",
+            )
+            if entry_id is None:
+                continue
+            self.add_cookies(entry_id, {c["name"]: c.get("value", "") for c in request.get("cookies") or [] if c.get("name")})
+            set_cookies = [v for k, v in _headers_dict(response.get("headers")).items() if k.lower() == "set-cookie"]
+            self.set_response(entry_id, response.get("status"), (response.get("content") or {}).get("mimeType", ""), set_cookies)
+        added = len(self._entries) - before
+        if added:
+            self.logger.info(f"HAR合并 {added} 个新请求: {path}")
+        return added
+
+    # ---------- 查询与重放 ----------
+
+    def get(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(str(entry_id).strip().upper())
+            return json.loads(json.dumps(entry)) if entry else None
+
+    def describe(self, entry: Dict[str, Any]) -> str:
+        line = f"{entry['id']} {entry['method']} {entry['url']}"
+        if entry["status"]:
+            line += f" -> {entry['status']}"
+        if entry["params"]:
+            line += f" 参数: {', '.join(entry['params'][:10])}"
+        if entry["post_data"]:
+            line += f" 请求体: {entry['post_data'][:120]}"
+        if entry["set_cookies"]:
+            line += f" Set-Cookie: {'; '.join(c.split(';', 1)[0] for c in entry['set_cookies'][:3])}"
+        return line
+
+    def listing(self, since: int = 0, limit: int = 30) -> str:
+        """列出编号 > since 的请求（按发现顺序）"""
+        with self._lock:
+            entries = [e for e in self._entries.values() if int(e["id"][1:]) > since]
+        lines = [self.describe(e) for e in entries[:limit]]
+        if len(entries) > limit:
+            lines.append(f"...(另有 {len(entries) - limit} 个)")
+        return "\n".join(lines)
+
+    def to_raw_request(self, entry_id: str) -> Optional[Tuple[str, str]]:
+        """生成可直接交给 RawHttpTool 的 (url, 原始请求报文)"""
+        entry = self.get(entry_id)
+        if entry is None:
+            return None
+        parts = urlsplit(entry["url"])
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        lines = [f"{entry['method']} {path} HTTP/1.1", f"Host: {parts.netloc}"]
+        headers = {k: v for k, v in entry["headers"].items() if k.lower() not in SKIP_HEADERS}
+        if entry["cookies"] and not any(k.lower() == "cookie" for k in headers):
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in entry["cookies"].items())
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        raw = "\r\n".join(lines) + "\r\n\r\n" + entry["post_data"]
+        return f"{parts.scheme}://{parts.netloc}", raw
+
+
+# 进程内单例：每个worker同一时间只执行一道题，开始新题时 reset()
+request_index = RequestIndex()
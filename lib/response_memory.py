@@ -0,0 +1,73 @@
+import os
+import difflib
+import threading
+from typing import Dict, List, Tuple
+
+# 每个端点保留最近几次响应用于比对
+MAX_PER_ENDPOINT = 3
+MIN_COMPACT_LENGTH = 400
+
+
+class ResponseMemory:
+    """任务内响应记忆 - 同一端点的新响应与历史响应几乎相同时只返回差异
+
+    每个响应分配引用编号 [R<n>]，近似响应返回「与 [R<n>] 的差异」而非完整内容，
+    减少重复HTML/命令输出占用的上下文。按行比对，单行压缩的页面只有完全相同才会省略。
+    每个任务开始时 reset()。
+    """
+
+    def __init__(self, similarity: float = None, max_diff_chars: int = 3000):
+        # RESPONSE_DEDUP_SIMILARITY >= 1 时相当于关闭（只省略完全相同的响应）
+        self.similarity = similarity if similarity is not None else float(os.getenv("RESPONSE_DEDUP_SIMILARITY", "0.9"))
+        self.max_diff_chars = max_diff_chars
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._seq = 0
+            self._entries: Dict[str, List[Tuple[str, str]]] = {}
+
+    def _diff(self, old: str, new: str) -> str:
+        lines = list(difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=1))
+        # 去掉 ---/+++ 文件头
+        return "\n".join(lines[2:])
+
+    def compact(self, endpoint: str, body: str, full: bool = False) -> str:
+        """记录响应并返回给agent的内容：完整内容(带引用编号)或与历史响应的差异
+
+        full=True 时仍记录本次响应，但总是返回完整内容。
+        """
+        with self._lock:
+            self._seq += 1
+            ref = f"R{self._seq}"
+            history = self._entries.setdefault(endpoint, [])
+            best = None
+            if not full and len(body) >= MIN_COMPACT_LENGTH:
+                new_lines = body.splitlines()
+                for old_ref, old_body in reversed(history):
+                    matcher = difflib.SequenceMatcher(None, old_body.splitlines(), new_lines, autojunk=False)
+                    if matcher.quick_ratio() < self.similarity:
+                        continue
+                    ratio = matcher.ratio()
+                    if ratio >= self.similarity and (best is None or ratio > best[1]):
+                        best = (old_ref, ratio, old_body)
+            history.append((ref, body))
+            del history[:-MAX_PER_ENDPOINT]
+
+        if best is None:
+            return f"[{ref}]\n{body}"
+        old_ref, ratio, old_body = best
+        if old_body == body:
+            return f"[{ref}] 与 [{old_ref}] 完全相同（{len(body)} 字符），已省略；如需完整内容请设置 full_response=true"
+        diff = self._diff(old_body, body)
+        if len(diff) > self.max_diff_chars or len(diff) > len(body) // 2:
+            return f"[{ref}]\n{body}"
+        return (
+            f"[{ref}] 与 [{old_ref}] 相似度 {ratio:.0%}，仅显示差异（-旧 +新）；如需完整内容请设置 full_response=true\n"
+            f"{diff}"
+        )
+
+
+# 进程内共享：pebble worker 同一时间只执行一个任务
+response_memory = ResponseMemory()
@@ -0,0 +1,193 @@
+import time
+import queue
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lib.logger import get_logger
+from lib.utils import competition_minutes_left
+
+
+def item_key(item: Dict[str, Any]) -> str:
+    """题目唯一标识：题目代码+URL（多端口题目每个端口一个条目，共用同一个题目代码）"""
+    code = item.get("code")
+    url = str(item.get("url"))
+    return f"{code}@{url}" if code is not None else url
+
+
+# 各难度的 (基础解题概率, 预期耗时分钟)
+DIFFICULTY_PROFILE = {
+    "easy": (0.6, 10.0),
+    "medium": (0.35, 18.0),
+    "hard": (0.15, 25.0),
+}
+DEFAULT_PROFILE = (0.3, 18.0)
+
+
+def estimate_priority(item: Dict[str, Any], minutes_left: Optional[float] = None) -> float:
+    """估计题目的期望收益：每分钟解题概率（解题概率 / 预期耗时）
+
+    - 难度决定基础概率和预期耗时
+    - 每失败一次概率衰减 25%
+    - 已查看提示(或最后一小时会自动获取提示)概率提升 30%
+    - 比赛时段剩余时间不足预期耗时时按比例折减
+    """
+    p_solve, expected_minutes = DIFFICULTY_PROFILE.get(str(item.get("difficulty", "")).lower(), DEFAULT_PROFILE)
+    p_solve *= 0.75 ** int(item.get("failure_counts", 0) or 0)
+    if item.get("hint_viewed") or item.get("hint_expected"):
+        p_solve = min(0.95, p_solve * 1.3)
+    if minutes_left is not None and minutes_left < expected_minutes:
+        p_solve *= max(minutes_left, 0.0) / expected_minutes
+    return p_solve / expected_minutes
+
+
+def rank_items(items: List[Dict[str, Any]], minutes_left: Optional[float] = None) -> List[Dict[str, Any]]:
+    """按期望收益从高到低排序"""
+    return sorted(items, key=lambda it: estimate_priority(it, minutes_left), reverse=True)
+
+
+class AdmissionScheduler:
+    """持续准入调度器 - 轮询平台与执行解耦
+
+    后台按 poll_interval 持续拉取题目，跳过正在执行的题目；
+    进程池一有空位就立即开新题，不再等待整批结束。
+    """
+
+    def __init__(
+        self,
+        executor,
+        fetch_items: Callable[[], List[Dict[str, Any]]],
+        on_result: Callable[[Dict[str, Any], Tuple[str, bool, str]], None],
+        args,
+        poll_interval: float = 30,
+    ):
+        self.executor = executor
+        self.fetch_items = fetch_items
+        self.on_result = on_result
+        self.args = args
+        self.poll_interval = poll_interval
+        self.logger = get_logger("scheduler")
+
+        self.results_queue: "queue.Queue" = queue.Queue()
+        self.pending: List[Dict[str, Any]] = []
+        self.running: Dict[str, Tuple[Dict[str, Any], Any, float]] = {}
+        self._submitted = 0
+        self._next_poll = 0.0
+
+    def _refresh_pending(self):
+        """拉取最新题目列表，替换待执行队列（已解/已下线的题目自然移出）"""
+        try:
+            items = self.fetch_items() or []
+        except Exception as e:
+            self.logger.error(f"拉取题目失败: {e}")
+            return
+        self.pending = [it for it in items if item_key(it) not in self.running]
+        self.logger.info(f"待执行: {len(self.pending)} | 执行中: {len(self.running)}")
+
+    def _next_item(self) -> Optional[Dict[str, Any]]:
+        """取出下一个待执行题目"""
+        return self.pending.pop(0) if self.pending else None
+
+    def _admit(self):
+        """有空闲进程即开题（同时执行数不超过执行器的自适应并发上限）"""
+        while len(self.running) < self.executor.admission_limit():
+            item = self._next_item()
+            if item is None:
+                return
+            future = self.executor.submit_task(self._submitted, item, self.args, self.results_queue)
+            self.running[item_key(item)] = (item, future, time.time())
+            self._submitted += 1
+
+    def _handle_done(self, item: Dict[str, Any], future):
+        """处理完成的任务"""
+        self.running.pop(item_key(item), None)
+        result = self.executor.collect_result(future, item)
+        try:
+            self.on_result(item, result)
+        except Exception as e:
+            self.logger.error(f"处理结果失败: {item_key(item)} - {e}")
+
+    def run_once(self, wait: float):
+        """调度一轮：必要时拉取题目、开题，并最多等待 wait 秒收集一个结果"""
+        if time.time() >= self._next_poll:
+            self._refresh_pending()
+            self._next_poll = time.time() + self.poll_interval
+        self._admit()
+        try:
+            _, item, future = self.results_queue.get(timeout=wait)
+        except queue.Empty:
+            return
+        self._handle_done(item, future)
+
+    def run(self):
+        """常驻运行（不会返回）"""
+        self.logger.info(f"持续准入调度启动 - 并发: {self.executor.max_workers}，轮询间隔: {self.poll_interval}s")
+        while True:
+            self.run_once(wait=max(0.5, self._next_poll - time.time()))
+
+
+class PriorityAdmissionScheduler(AdmissionScheduler):
+    """期望收益优先的准入调度器，支持抢占
+
+    待执行队列按 estimate_priority 排序；进程池满时，若已运行超过
+    preempt_after 秒的题目收益明显低于等待中的最优题目，则终止它
+    并放回待执行队列（不计入失败次数），把进程让给更容易的题目。
+    每被抢占一次收益减半，被抢占 max_preemptions 次后不再被抢占，避免反复开题又被杀。
+    """
+
+    def __init__(self, *args, preempt_after: float = 20 * 60, preempt_margin: float = 2.0, max_preemptions: int = 2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preempt_after = preempt_after
+        self.preempt_margin = preempt_margin
+        self.max_preemptions = max_preemptions
+        self.preempted: Dict[str, Dict[str, Any]] = {}
+        # 各题目被抢占的次数（按 item_key，拉取题目列表会替换条目，不能记在条目上）
+        self.preempt_counts: Dict[str, int] = {}
+
+    def _priority(self, item: Dict[str, Any], minutes_left: Optional[float]) -> float:
+        return estimate_priority(item, minutes_left) * 0.5 ** self.preempt_counts.get(item_key(item), 0)
+
+    def _next_item(self) -> Optional[Dict[str, Any]]:
+        if not self.pending:
+            return None
+        minutes_left = competition_minutes_left()
+        self.pending.sort(key=lambda it: self._priority(it, minutes_left), reverse=True)
+        return self.pending.pop(0)
+
+    def _maybe_preempt(self):
+        """进程池已满且有更优题目等待时，抢占收益最低的长时间运行题目"""
+        if self.preempt_after <= 0 or not self.pending or len(self.running) < self.executor.admission_limit():
+            return
+        minutes_left = competition_minutes_left()
+        best_waiting = max(self._priority(it, minutes_left) for it in self.pending)
+        now = time.time()
+        candidates = [
+            (self._priority(item, minutes_left), key, future)
+            for key, (item, future, started_at) in self.running.items()
+            if key not in self.preempted
+            and now - started_at >= self.preempt_after
+            and self.preempt_counts.get(key, 0) < self.max_preemptions
+        ]
+        if not candidates:
+            return
+        victim_score, victim_key, victim_future = min(candidates, key=lambda c: c[0])
+        if victim_score * self.preempt_margin >= best_waiting:
+            return
+        self.logger.info(f"抢占题目: {victim_key} (收益 {victim_score:.4f} < 等待中最优 {best_waiting:.4f})")
+        self.preempted[victim_key] = self.running[victim_key][0]
+        victim_future.cancel()
+
+    def _handle_done(self, item: Dict[str, Any], future):
+        key = item_key(item)
+        if future.cancelled() and key in self.preempted:
+            # 被抢占：不回调结果、不计失败，重新排队
+            self.running.pop(key, None)
+            self.pending.append(self.preempted.pop(key))
+            self.preempt_counts[key] = self.preempt_counts.get(key, 0) + 1
+            self.logger.info(f"已抢占并重新排队: {key} (第 {self.preempt_counts[key]} 次)")
+            return
+        self.preempted.pop(key, None)
+        self.preempt_counts.pop(key, None)
+        super()._handle_done(item, future)
+
+    def run_once(self, wait: float):
+        self._maybe_preempt()
+        super().run_once(wait)
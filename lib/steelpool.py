@@ -0,0 +1,239 @@
+import os
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from steel import Client
+
+from lib.cdppool import CDPLeasePool
+from lib.metrics import record_event
+
+
+def steel_base_url(cdp_url: str) -> str:
+    """CDP地址(ws/wss)转换为Steel API地址(http/https)"""
+    if cdp_url.startswith("wss://"):
+        return "https://" + cdp_url[len("wss://"):]
+    if cdp_url.startswith("ws://"):
+        return "http://" + cdp_url[len("ws://"):]
+    return cdp_url
+
+
+class SteelSessionPool:
+    """Steel会话池 - 预热会话、健康检查、回收孤儿会话
+
+    与 CDPLeasePool 共用同一个SQLite库，表 steel_sessions 登记本系统创建的每个会话
+    (owner_pid 为空表示就绪待取用)：
+    - 主进程的维护线程为完全空闲的实例补足 STEEL_POOL_SIZE 个就绪会话（默认1，自托管
+      Steel每个实例同一时间只有一个会话）；创建前先独占租用该实例，不会顶掉使用中的会话
+    - 独占实例：worker 租到实例后 checkout() 直接取用就绪会话（确认仍为 live），没有才现建；
+      共享实例(CDP_CONTEXTS_PER_INSTANCE>1)：就绪会话即各任务共用的浏览器，worker不取用
+    - 回收：登记的持有者已不再持有该实例租约(如被pebble超时杀死)的会话一律释放；
+      实例空闲时，Steel API 上 live 但未登记的会话、以及就绪过久的会话释放后重建
+    会话先登记后创建，回收线程不会误杀正在创建的会话。
+    """
+
+    def __init__(self, lease_pool: CDPLeasePool, size: int = None, session_timeout: float = None):
+        self.lease_pool = lease_pool
+        self.db_path = lease_pool.db_path
+        self.size = size if size is not None else int(os.getenv("STEEL_POOL_SIZE", "1"))
+        # Steel会话超时(秒)，就绪会话超过其80%未被取用即重建
+        self.session_timeout = session_timeout if session_timeout is not None else float(os.getenv("STEEL_SESSION_TIMEOUT", "1800"))
+        self.api_key = os.getenv("STEEL_API_KEY", "keys")
+        self.logger = logging.getLogger("steel.pool")
+        self._clients: Dict[str, Client] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS steel_sessions ("
+                "session_id TEXT PRIMARY KEY, cdp_url TEXT, owner_pid INTEGER, created_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def client(self, cdp_url: str) -> Client:
+        client = self._clients.get(cdp_url)
+        if client is None:
+            client = Client(base_url=steel_base_url(cdp_url), steel_api_key=self.api_key)
+            self._clients[cdp_url] = client
+        return client
+
+    def _ready_cutoff(self) -> float:
+        return time.time() - self.session_timeout * 0.8
+
+    def _create(self, cdp_url: str, owner_pid: Optional[int]) -> str:
+        session_id = str(uuid.uuid4())
+        # 先登记再创建，回收时不会被当作孤儿
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO steel_sessions (session_id, cdp_url, owner_pid, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, cdp_url, owner_pid, time.time())
+            )
+        try:
+            self.client(cdp_url).sessions.create(
+                session_id=session_id, extra_body={"timeout": int(self.session_timeout * 1000)}
+            )
+        except Exception:
+            self._forget(session_id)
+            raise
+        return session_id
+
+    def _forget(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM steel_sessions WHERE session_id = ?", (session_id,))
+
+    def _release(self, cdp_url: str, session_id: str):
+        try:
+            self.client(cdp_url).sessions.release(session_id)
+        except Exception as e:
+            self.logger.warning(f"释放Steel会话失败: {session_id}@{cdp_url} - {e}")
+        self._forget(session_id)
+
+    def _is_live(self, cdp_url: str, session_id: str) -> bool:
+        try:
+            return self.client(cdp_url).sessions.retrieve(session_id).status == "live"
+        except Exception:
+            return False
+
+    def _claim_ready(self, cdp_url: str) -> Optional[str]:
+        """把该实例最新的一个就绪会话标记为本进程持有"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT session_id FROM steel_sessions WHERE cdp_url = ? AND owner_pid IS NULL AND created_at > ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (cdp_url, self._ready_cutoff())
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE steel_sessions SET owner_pid = ? WHERE session_id = ?", (os.getpid(), row[0]))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def checkout(self, cdp_url: str) -> str:
+        """取用实例上的会话（调用方须已持有该实例租约），返回会话ID"""
+        start = time.perf_counter()
+        while True:
+            session_id = self._claim_ready(cdp_url)
+            if session_id is None:
+                break
+            if self._is_live(cdp_url, session_id):
+                record_event("steel_checkout", cdp_url=cdp_url, warm=True, seconds=round(time.perf_counter() - start, 3))
+                return session_id
+            self.logger.warning(f"就绪Steel会话已失效，丢弃: {session_id}@{cdp_url}")
+            self._forget(session_id)
+        session_id = self._create(cdp_url, os.getpid())
+        record_event("steel_checkout", cdp_url=cdp_url, warm=False, seconds=round(time.perf_counter() - start, 3))
+        return session_id
+
+    def checkin(self, cdp_url: str, session_id: str):
+        """用完释放会话，由维护线程在实例空闲后补充新的就绪会话"""
+        self._release(cdp_url, session_id)
+
+    def top_up(self):
+        """为空闲实例补足就绪会话"""
+        if self.size <= 0:
+            return
+        with self._connect() as conn:
+            ready = dict(conn.execute(
+                "SELECT cdp_url, COUNT(*) FROM steel_sessions WHERE owner_pid IS NULL AND created_at > ? GROUP BY cdp_url",
+                (self._ready_cutoff(),)
+            ).fetchall())
+        for cdp_url in self.lease_pool.cdp_urls:
+            need = self.size - ready.get(cdp_url, 0)
+            if need <= 0 or not self.lease_pool.try_acquire(cdp_url, exclusive=True):
+                continue
+            try:
+                if not self.lease_pool.check_health(cdp_url):
+                    continue
+                for _ in range(need):
+                    self._create(cdp_url, None)
+                self.logger.info(f"预热Steel会话 x{need}: {cdp_url}")
+            except Exception as e:
+                self.logger.warning(f"预热Steel会话失败: {cdp_url} - {e}")
+            finally:
+                self.lease_pool.release(cdp_url, all_slots=True)
+
+    def reap(self) -> int:
+        """回收孤儿会话并清理已失效的就绪登记，返回释放数量"""
+        # 先列出live会话再读登记：列出时已存在的会话，其登记必然早于读取（先登记后创建）
+        live: Dict[str, set] = {}
+        for cdp_url in self.lease_pool.cdp_urls:
+            try:
+                live[cdp_url] = {s.id for s in self.client(cdp_url).sessions.list(status="live")}
+            except Exception as e:
+                self.logger.debug(f"列出Steel会话失败: {cdp_url} - {e}")
+        # 租约与会话登记在同一个写事务内读取：worker 租约和登记都经由写事务，
+        # 否则两次读取之间 worker 租到实例并取用/创建会话，会被误判为持有者已无租约而释放
+        cutoff = self._ready_cutoff()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                leases = self.lease_pool.read_live_leases(conn)
+                rows = conn.execute("SELECT session_id, cdp_url, owner_pid, created_at FROM steel_sessions").fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        known = set()
+        released = 0
+        for session_id, cdp_url, owner_pid, created_at in rows:
+            if owner_pid is None and (created_at > cutoff or cdp_url in leases):
+                # 实例使用中(共享实例的任务正在用这个会话)时，过期的就绪会话留待空闲后重建
+                if cdp_url in live and session_id not in live[cdp_url]:
+                    self.logger.warning(f"就绪Steel会话已失效，丢弃: {session_id}@{cdp_url}")
+                    self._forget(session_id)
+                else:
+                    known.add(session_id)
+            elif owner_pid is not None and owner_pid in leases.get(cdp_url, []):
+                known.add(session_id)
+            else:
+                self.logger.warning(f"回收Steel会话: {session_id}@{cdp_url} (pid {owner_pid})")
+                self._release(cdp_url, session_id)
+                known.add(session_id)
+                released += 1
+
+        for cdp_url, session_ids in live.items():
+            if self.size <= 0 or cdp_url in leases:
+                # 未启用预热时，自托管Steel空闲时的默认会话也不登记，不能回收
+                continue
+            for session_id in session_ids - known:
+                self.logger.warning(f"回收未登记的Steel会话: {session_id}@{cdp_url}")
+                self._release(cdp_url, session_id)
+                released += 1
+        if released:
+            record_event("steel_reap", released=released)
+        return released
+
+    def _maintain(self, interval: float):
+        while True:
+            try:
+                self.reap()
+                self.top_up()
+            except Exception as e:
+                self.logger.error(f"Steel会话池维护失败: {e}")
+            if self._stop.wait(interval):
+                return
+
+    def start_maintainer(self, interval: float = None):
+        """启动维护线程（仅主进程），立即执行一轮预热"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        interval = interval if interval is not None else float(os.getenv("STEEL_POOL_INTERVAL", "5"))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._maintain, args=(interval,), name="steel-pool", daemon=True)
+        self._thread.start()
+
+    def stop_maintainer(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
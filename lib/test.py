@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 load_dotenv()
-from tools import RawHttpTool, SQLMapTool, KatanaTool, BrowserTool, SandboxExecTool, FlagValidatorTool
+from tools import RawHttpTool, SQLMapTool, KatanaTool, BrowserTool, BrowserProbeTool, SandboxExecTool, FlagValidatorTool
 
 
 
@@ -46,6 +46,15 @@ def test_browser_tool(url: str):
     }   
     result = tool.run(**k)
     print(result)
+    tool.close_session()
+
+def test_browser_probe_tool(url: str):
+    browser = BrowserTool()
+    tool = BrowserProbeTool(browser_tool=browser)
+    for action in ("cookies", "forms", "local_storage", "links"):
+        result = tool.run(action=action, url=url)
+        print(result)
+    browser.close_session()
 
 def test_sandbox_exec_tool():
     tool = SandboxExecTool()
@@ -63,10 +72,64 @@ def test_flag_validator_tool():
     result = tool.run(**k)
     print(result)
 
+def test_cluster_loopback():
+    """多机协调器本机回环：分发、回传结果、心跳丢失后重排到另一个worker，以及令牌校验"""
+    import json, socket, threading, time
+    from concurrent.futures import ThreadPoolExecutor
+    import cluster
+
+    class LocalExecutor:
+        """代替Pebble进程池的本地执行器"""
+        cdp_urls = []
+
+        def __init__(self):
+            self.pool = ThreadPoolExecutor(2)
+
+        def admission_limit(self):
+            return 1
+
+        def schedule_task_data(self, task_data):
+            return self.pool.submit(lambda: (task_data["url"], True, f"flag{{{task_data['code']}}}"))
+
+        def collect_result(self, future, item):
+            return future.result()
+
+    cluster.HEARTBEAT_INTERVAL, cluster.HEARTBEAT_TIMEOUT = 0.2, 1.0
+    coordinator = cluster.ClusterCTFExecutor("127.0.0.1:0", token="secret")
+    address = f"127.0.0.1:{coordinator.address[1]}"
+    try:
+        # 令牌错误的连接被拒绝
+        with socket.create_connection(coordinator.address, timeout=5) as bad:
+            bad.sendall(b'{"type": "hello", "worker_id": "intruder", "token": "wrong"}\n')
+            assert bad.makefile("rb").readline() == b"", "错误令牌未被拒绝"
+
+        # 只注册不发心跳的worker：收到任务后失联
+        silent = socket.create_connection(coordinator.address, timeout=5)
+        silent.sendall(b'{"type": "hello", "worker_id": "silent", "slots": 1, "token": "secret"}\n')
+        while "silent" not in coordinator._workers:
+            time.sleep(0.05)
+        future = coordinator.schedule_task_data({"url": "http://127.0.0.1:8080/", "code": "c1"})
+        job = json.loads(silent.makefile("rb").readline())
+        assert job["type"] == "job" and job["task_data"]["code"] == "c1", job
+        print(f"分发到 silent: {job['job_id']}")
+
+        # 正常worker上线后，silent 心跳超时，任务重排给它执行并回传结果
+        worker = cluster.ClusterWorker(address, worker_id="local", token="secret", executor=LocalExecutor())
+        threading.Thread(target=worker.run, daemon=True).start()
+        result = future.result(timeout=15)
+        assert tuple(result) == ("http://127.0.0.1:8080/", True, "flag{c1}"), result
+        assert "silent" not in coordinator._workers
+        print(f"心跳丢失后重排并完成: {result}")
+        silent.close()
+    finally:
+        coordinator.close()
+
 if __name__ == "__main__":
     # test_katana_tool("https://example.com/")
     test_browser_tool("https://example.com/")
+    # test_browser_probe_tool("https://example.com/")
     # test_sandbox_exec_tool()
     # test_flag_validator_tool()
     # test_raw_http_tool()
     # test_sqlmap_tool()
+    # test_cluster_loopback()
@@ -5,9 +5,9 @@ import shlex
 import subprocess
 import os
 import asyncio
+import threading
 # import traceback
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Type, Optional, Any
+from typing import Dict, List, Type, Optional, Any, Callable, Awaitable, Literal
 from contextlib import asynccontextmanager
 import requests_raw
 import json
@@ -18,7 +18,14 @@ from crewai.tools import BaseTool
 from browser_use import Agent as BrowserAgent, BrowserSession, Tools
 from steel import Client
 
-from lib.llm import BrowserLLM
+from lib.llm import get_browser_llm
+from lib.cdppool import CDPLeasePool
+from lib.steelpool import SteelSessionPool
+from lib.browserctx import ContextBrowserSession, IsolatedBrowserContext, tap_cdp_events
+from lib.requestindex import request_index
+from lib.browserprobe import probe
+from lib.utils import find_flags
+from lib.response_memory import response_memory
 
 # 配置
 browser_use_tools = Tools(exclude_actions=["search"])
@@ -34,6 +41,11 @@ class BrowserSessionConfig:
         self.keep_alive = True
         self.record_har_path = f"/app/browser_{datetime.now().strftime('%Y%m%d_%H%M%S')}.har"
         self.disable_security = True
+        # 设置后在首次启动浏览器时才从租约池租用CDP URL，关闭时归还
+        self.lease_pool: Optional[CDPLeasePool] = None
+        # 配合租约池使用：从预热池取用Steel会话，关闭时释放
+        self.session_pool: Optional[SteelSessionPool] = None
+        self.lease_timeout = float(os.getenv("CDP_LEASE_TIMEOUT", "300"))
 
 class ToolExecutionError(Exception):
     """工具执行异常"""
@@ -45,39 +57,91 @@ class BrowserSessionManager:
     def __init__(self, config: BrowserSessionConfig):
         self.config = config
         self.browser: Optional[BrowserSession] = None
-        self.steel_client = Client(
-            base_url=self.config.cdp_url.replace("ws://", "http://"), 
-            steel_api_key="keys"
-        )
+        self.steel_client = None
         self.session = None
+        self.session_id: Optional[str] = None
+        self.leased_url: Optional[str] = None
+        self.browser_context: Optional[IsolatedBrowserContext] = None
         self._is_active = False
 
+    @property
+    def shared_instance(self) -> bool:
+        """实例是否由多个任务共享（各用独立浏览器上下文）"""
+        return self.config.lease_pool is not None and self.config.lease_pool.slots > 1
+
+    async def _acquire_cdp_url(self) -> str:
+        """获取本次会话使用的CDP URL：配置了租约池则按需租用空闲实例"""
+        if self.config.lease_pool is None:
+            return self.config.cdp_url
+        self.leased_url = await asyncio.to_thread(self.config.lease_pool.acquire, self.config.lease_timeout)
+        return self.leased_url
+
+    def _release_cdp_url(self):
+        """归还租用的CDP URL"""
+        if self.leased_url and self.config.lease_pool is not None:
+            self.config.lease_pool.release(self.leased_url)
+        self.leased_url = None
+
     async def start(self) -> BrowserSession:
         """启动浏览器会话"""
         if self._is_active:
             return self.browser
             
         try:
-            self.session = self.steel_client.sessions.create()
-            
-            self.browser = BrowserSession(
+            cdp_url = await self._acquire_cdp_url()
+            browser_kwargs = dict(
                 is_local=True,
                 headless=self.config.headless,
-                cdp_url=self.config.cdp_url,
+                cdp_url=cdp_url,
                 keep_alive=self.config.keep_alive,
                 record_har_path=self.config.record_har_path,
                 disable_security=self.config.disable_security,
             )
+            if self.shared_instance:
+                # 共享实例：不新建Steel会话(会重启浏览器)，在现有浏览器内创建隔离上下文
+                self.browser_context = IsolatedBrowserContext(cdp_url)
+                browser_context_id = await self.browser_context.create()
+                self.browser = ContextBrowserSession(**browser_kwargs).bind_context(browser_context_id)
+            else:
+                if self.config.session_pool is not None:
+                    self.session_id = await asyncio.to_thread(self.config.session_pool.checkout, cdp_url)
+                else:
+                    self.steel_client = Client(
+                        base_url=cdp_url.replace("ws://", "http://"), 
+                        steel_api_key="keys"
+                    )
+                    self.session = self.steel_client.sessions.create()
+                self.browser = BrowserSession(**browser_kwargs)
             
             await self.browser.start()
+            # 浏览器发出的请求实时登记到本题的请求清单
+            tap_cdp_events(self.browser.cdp_client, "Network.", request_index.on_cdp_event)
             self._is_active = True
             logger.info("✅ 浏览器会话启动成功")
             return self.browser
             
         except Exception as e:
             logger.error(f"❌ 浏览器会话启动失败: {e}")
+            await self._dispose_context()
+            self._release_session()
+            self._release_cdp_url()
             raise ToolExecutionError(f"浏览器启动失败: {e}")
 
+    async def _dispose_context(self):
+        """销毁本会话的浏览器上下文"""
+        if self.browser_context is not None:
+            await self.browser_context.dispose()
+            self.browser_context = None
+
+    def _release_session(self):
+        """释放Steel会话"""
+        if self.session_id and self.config.session_pool is not None:
+            self.config.session_pool.checkin(self.leased_url or self.config.cdp_url, self.session_id)
+        elif self.session:
+            self.steel_client.sessions.release(self.session.id)
+        self.session_id = None
+        self.session = None
+
     async def stop(self):
         """停止浏览器会话"""
         if not self._is_active:
@@ -86,8 +150,10 @@ class BrowserSessionManager:
         try:
             if self.browser:
                 await self.browser.kill()
-            if self.session:
-                self.steel_client.sessions.release(self.session.id)
+                # kill 时 browser_use 写出HAR，合并其中的请求
+                request_index.ingest_har(self.config.record_har_path)
+            await self._dispose_context()
+            self._release_session()
                 
             self._is_active = False
             logger.info("✅ 浏览器会话已关闭")
@@ -95,6 +161,8 @@ class BrowserSessionManager:
         except Exception as e:
             logger.error(f"❌ 浏览器会话关闭失败: {e}")
             # 不重新抛出异常，确保资源释放
+        finally:
+            self._release_cdp_url()
 
 
 class BrowserAgentManager:
@@ -132,7 +200,7 @@ class BrowserAgentManager:
                 "【内嵌工具】evaluate - Execute custom JavaScript code on the page (for advanced interactions, shadow DOM, custom selectors, data extraction)，requires arrow function format: () => {}(),(() => {javascript code})()\n"
                 "如果需要的话，可以通过evaluate工具执行js获取cookie等信息，没有获取到就说没有就行。不要重复执行相同的js代码。\n",
                 browser_session=browser,
-                llm=BrowserLLM,
+                llm=get_browser_llm(),
                 tools=browser_use_tools,
                 use_vision=False,
                 use_thinking=False,
@@ -160,9 +228,12 @@ class BrowserAgentManager:
         try:
             # 添加新任务
             self.agent.add_new_task(task_description)
+            # 复用的代理历史跨任务累积，只统计本次任务新增的步骤
+            start = len(self.agent.history.history)
             
             # 执行任务
             history = await self.agent.run(max_steps=max_steps)
+            history = history.model_copy(update={"history": history.history[start:]})
             
             # 记录任务结果
             task_result = {
@@ -237,9 +308,14 @@ class CommandExecutor:
         operation: str,
         timeout: int = 300,
         shell: bool = False,
-        cwd: Optional[str] = None
+        cwd: Optional[str] = None,
+        memory_key: Optional[str] = None,
+        full_response: bool = False
     ) -> str:
-        """执行命令并返回结果"""
+        """执行命令并返回结果
+
+        memory_key 非空时，成功输出经任务内响应记忆比对，与同一 key 的历史输出近似时只返回差异
+        """
         try:
             process = subprocess.Popen(
                 command,
@@ -254,6 +330,8 @@ class CommandExecutor:
                 stdout, stderr = process.communicate(timeout=timeout)
                 
                 if process.returncode == 0:
+                    if memory_key:
+                        stdout = response_memory.compact(memory_key, stdout, full=full_response)
                     return CommandExecutor._format_success_output(stdout, operation)
                 else:
                     return CommandExecutor._format_error_output(
@@ -459,14 +537,22 @@ class SQLMapTool(BaseTool):
 
 
 class BrowserTool(BaseTool):
-    """浏览器控制工具"""
+    """浏览器控制工具
+
+    每个工具实例持有一个常驻事件循环线程和一个浏览器会话：同一题目内多次调用复用
+    会话(cookie、登录态、页面缓存)，由执行器在题目结束时调用 close_session() 释放。
+    """
     
     name: str = "BrowserTool"
-    description: str = "控制浏览器进行网页导航和交互"
+    description: str = "控制浏览器进行网页导航和交互（同一题目内会话保持，cookie/登录态在多次调用间保留）"
     
     # 使用 PrivateAttr 来存储非Pydantic字段
     _session_manager: BrowserSessionManager = PrivateAttr()
     _agent_manager: Optional[BrowserAgentManager] = PrivateAttr()
+    _loop: Optional[asyncio.AbstractEventLoop] = PrivateAttr(default=None)
+    _loop_thread: Optional[threading.Thread] = PrivateAttr(default=None)
+    _loop_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _task_lock: Optional[asyncio.Lock] = PrivateAttr(default=None)
 
     def __init__(self, session_manager: Optional[BrowserSessionManager] = None, **kwargs):
         super().__init__(**kwargs)
@@ -474,22 +560,51 @@ class BrowserTool(BaseTool):
         self._session_manager = session_manager or BrowserSessionManager(BrowserSessionConfig())
         self._agent_manager = None
 
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """常驻事件循环线程（首次调用时启动），浏览器会话的连接都绑定在该循环上"""
+        with self._loop_lock:
+            if self._loop is None or self._loop_thread is None or not self._loop_thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="browser-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+                self._task_lock = None
+                self._agent_manager = None
+            return self._loop
+
+    def _ensure_agent_manager(self) -> BrowserAgentManager:
+        if self._task_lock is None:
+            self._task_lock = asyncio.Lock()
+        if self._agent_manager is None:
+            self._agent_manager = BrowserAgentManager(self._session_manager)
+        return self._agent_manager
+
     async def _arun(self, task_description: str, **kwargs) -> str:
-        """异步执行浏览器任务"""
-        try:
-            if self._agent_manager is None:
-                self._agent_manager = BrowserAgentManager(self._session_manager)
-            
-            max_steps = kwargs.get("max_steps", 10)
-            
-            async with self._agent_manager.browser_context():
+        """异步执行浏览器任务（在常驻循环中运行，会话跨调用保持）"""
+        self._ensure_agent_manager()
+        # 同一会话内的浏览器任务串行执行
+        async with self._task_lock:
+            try:
+                self._ensure_agent_manager()
+                
+                max_steps = kwargs.get("max_steps", 10)
+                
+                await self._agent_manager.initialize()
+                captured_before = len(request_index)
                 result = await self._agent_manager.execute_task(task_description, max_steps=max_steps)
+                if not result.get('success'):
+                    # 任务异常多为会话断开，关闭后下次调用重新建立
+                    await self._agent_manager.close()
+                    
+                output = self._format_browser_result(task_description, result)
+                captured = request_index.listing(since=captured_before, limit=int(os.getenv("REQUEST_INDEX_SHOW", "15")))
+                if captured:
+                    output += f"\n捕获的请求(可用 RawHttpTool 的 request_id 直接重放):\n{captured}"
+                return output
                 
-            return self._format_browser_result(task_description, result)
-            
-        except Exception as e:
-            logger.error(f"浏览器任务执行失败: {e}")
-            return f"❌ 浏览器任务执行失败: {e}"
+            except Exception as e:
+                logger.error(f"浏览器任务执行失败: {e}")
+                return f"❌ 浏览器任务执行失败: {e}"
 
     def _format_browser_result(self, task: str, result: Dict) -> str:
         """格式化浏览器任务结果"""
@@ -505,17 +620,79 @@ class BrowserTool(BaseTool):
 
     def _run(self, task_description: str, **kwargs) -> str:
         """同步执行浏览器任务"""
-        def run_async_task():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(self._arun(task_description, **kwargs))
-            finally:
-                loop.close()
+        future = asyncio.run_coroutine_threadsafe(self._arun(task_description, **kwargs), self._get_loop())
+        return future.result()
+
+    def run_in_session(self, operation: Callable[[BrowserSession], Awaitable[Any]], timeout: float = None) -> Any:
+        """在常驻循环中对当前浏览器会话执行 operation(browser)，与浏览器任务串行（会话未启动则先启动）"""
+        async def _run():
+            self._ensure_agent_manager()
+            async with self._task_lock:
+                agent_manager = self._ensure_agent_manager()
+                await agent_manager.initialize()
+                return await operation(self._session_manager.browser)
+
+        return asyncio.run_coroutine_threadsafe(_run(), self._get_loop()).result(timeout)
+
+    def close_session(self, timeout: float = 30):
+        """题目结束时关闭浏览器会话并归还CDP租约；事件循环线程保留供下一题使用"""
+        if self._loop is None or not self._loop.is_running():
+            return
+        agent_manager, self._agent_manager = self._agent_manager, None
+
+        async def _close():
+            if agent_manager is not None:
+                await agent_manager.close()
+            # BrowserAgent 初始化失败时会话可能已启动，同样需要释放
+            await self._session_manager.stop()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), self._loop).result(timeout)
+        except Exception as e:
+            logger.error(f"❌ 关闭浏览器会话失败: {e}")
 
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_task)
-            return future.result()
+
+class BrowserProbeToolInput(BaseModel):
+    """浏览器快速观察工具输入参数"""
+    action: Literal["cookies", "forms", "local_storage", "session_storage", "text", "links", "html"] = Field(
+        ..., description="cookies=当前页面cookie(含HttpOnly) forms=表单与输入框 local_storage/session_storage=存储内容 "
+                         "text=渲染后的页面文本 links=链接/脚本/表单地址/HTML注释 html=渲染后的DOM"
+    )
+    url: Optional[str] = Field(None, description="先导航到该URL再观察；省略则观察浏览器当前页面（如BrowserTool操作后的页面）")
+    max_chars: Optional[int] = Field(4000, description="返回内容的最大字符数")
+
+class BrowserProbeTool(BaseTool):
+    """浏览器快速观察工具 - 不经过浏览器LLM，直接在 BrowserTool 的会话上执行CDP命令"""
+
+    name: str = "BrowserProbe"
+    description: str = (
+        "在浏览器当前会话中直接读取cookie、表单、localStorage/sessionStorage、渲染后的页面文本/链接/DOM，"
+        "毫秒级返回且不消耗额外token；与BrowserTool共用会话(登录态一致)。只需观察页面时优先使用，"
+        "点击、填写、多步交互再用BrowserTool"
+    )
+    args_schema: Type[BaseModel] = BrowserProbeToolInput
+    # 页面状态随浏览器操作变化，相同参数的观察结果不能复用缓存
+    cache_function: Callable = lambda _args=None, _result=None: False
+
+    _browser_tool: BrowserTool = PrivateAttr()
+
+    def __init__(self, browser_tool: BrowserTool, **kwargs):
+        super().__init__(**kwargs)
+        self._browser_tool = browser_tool
+
+    def _run(self, action: str, url: Optional[str] = None, max_chars: int = 4000, **kwargs) -> str:
+        captured_before = len(request_index)
+        try:
+            output = self._browser_tool.run_in_session(
+                lambda browser: probe(browser, action, url, max_chars or 4000), timeout=60
+            )
+        except Exception as e:
+            logger.error(f"浏览器快速观察失败: {action} - {e}")
+            return f"❌ 浏览器快速观察失败({action}): {e}"
+        captured = request_index.listing(since=captured_before, limit=int(os.getenv("REQUEST_INDEX_SHOW", "15")))
+        if captured:
+            output += f"\n捕获的请求(可用 RawHttpTool 的 request_id 直接重放):\n{captured}"
+        return output
 
 
 class CTFDirSearchTool(BaseTool):
@@ -548,20 +725,11 @@ class FlagValidatorTool(BaseTool):
         """验证Flag格式"""
         if not content:
             return "❌ 输入内容为空"
-            
-        patterns = [
-            r"flag\{[^}]+\}",
-            r"CTF\{[^}]+\}", 
-            r"FLAG\{[^}]+\}",
-            # r"[A-Za-z0-9]{32}",  # 32位MD5类Flag
-            # r"[A-Z0-9]{8}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{12}",  # UUID格式
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                return f"✅ 发现有效Flag格式: {', '.join(matches[:3])}"  # 限制显示数量
-                
+
+        matches = find_flags(content)
+        if matches:
+            return f"✅ 发现有效Flag格式: {', '.join(matches[:3])}"  # 限制显示数量
+
         return "❌ 未发现有效Flag格式"
 
 
@@ -571,8 +739,11 @@ class SandboxExecTool(BaseTool):
     name: str = "SandboxExec"
     description: str = "在沙箱内执行命令（包含curl、python、php、base64等linux命令）"
 
-    def _run(self, command: str, timeout: int = 120) -> str:
-        """在沙箱中执行命令"""
+    def _run(self, command: str, timeout: int = 120, full_response: bool = False) -> str:
+        """在沙箱中执行命令
+
+        同类命令（同一程序 + 同一URL路径）输出与之前近似时只返回差异，full_response=True 返回完整输出
+        """
         container = os.getenv("SANDBOX_CONTAINER", os.getenv("SQLMAP_CONTAINER", "sqlmap"))
         
         # 检测是否需要shell
@@ -593,7 +764,17 @@ class SandboxExecTool(BaseTool):
                 shell_prog, "-lc", command
             ]
         
-        return CommandExecutor.execute_command(docker_cmd, "沙箱执行", timeout=timeout)
+        return CommandExecutor.execute_command(
+            docker_cmd, "沙箱执行", timeout=timeout,
+            memory_key=self._memory_key(command), full_response=full_response
+        )
+
+    @staticmethod
+    def _memory_key(command: str) -> str:
+        """程序名 + 命令中第一个URL(去掉查询串)，payload不同的同类请求归为同一端点"""
+        program = command.strip().split(maxsplit=1)[0] if command.strip() else ""
+        url = re.search(r"https?://[^\s'\"?#]+", command)
+        return f"sandbox:{os.path.basename(program)}:{url.group(0) if url else ''}"
 
 
 class KatanaTool(BaseTool):
@@ -627,12 +808,14 @@ class KatanaTool(BaseTool):
 
 class RawHttpToolInput(BaseModel):
     """原始HTTP请求工具输入参数"""
-    url: str = Field(..., description="目标URL")
-    raw_request: str = Field(..., description="原始HTTP请求报文(注意HTTP报文格式,尤其是空格、换行、URL编码)")
+    url: Optional[str] = Field("", description="目标URL（使用 request_id 时可省略）")
+    raw_request: Optional[str] = Field("", description="原始HTTP请求报文(注意HTTP报文格式,尤其是空格、换行、URL编码)；使用 request_id 时可省略")
+    request_id: Optional[str] = Field(None, description="重放BrowserTool捕获的请求编号(如 H3)；同时给出 raw_request 时以 raw_request 为准")
     timeout: Optional[float] = Field(15.0, description="请求超时时间(秒)")
     start_response_index: Optional[int] = Field(0, description="截取响应内容起始索引(字节)")
     end_response_index: Optional[int] = Field(8000, description="截取响应内容结束索引(字节)")
     redirect: Optional[bool] = Field(False, description="是否允许重定向, False可观察响应头，比如cookie")
+    full_response: Optional[bool] = Field(False, description="是否强制返回完整响应内容（默认与同一端点之前近似的响应只返回差异）")
 
 class RawHttpTool(BaseTool):
     """原始HTTP请求工具 - 用于SQL注入、SSTI、文件上传等安全测试"""
@@ -643,12 +826,14 @@ class RawHttpTool(BaseTool):
 
     def _run(
         self, 
-        url: str,
-        raw_request: str,
+        url: str = "",
+        raw_request: str = "",
         timeout: float = 15.0,
         start_response_index: int = 0,
         end_response_index: int = 8000,
         redirect: bool = False,
+        full_response: bool = False,
+        request_id: Optional[str] = None,
         **kwargs
     ) -> str:
         """
@@ -658,7 +843,18 @@ class RawHttpTool(BaseTool):
             url: 目标URL
             raw_request: 原始HTTP请求报文(注意HTTP报文格式,尤其是空格、换行、URL编码)
             timeout: 超时时间(秒)
+            full_response: 强制返回完整响应，不与同一端点的历史响应做差异压缩
+            request_id: 按编号重放请求清单中的请求（BrowserTool 捕获）
         """
+        if request_id and not raw_request:
+            replay = request_index.to_raw_request(request_id)
+            if replay is None:
+                known = request_index.listing(limit=20)
+                return f"❌ 请求清单中没有 {request_id}" + (f"，已捕获的请求:\n{known}" if known else "（尚未捕获任何请求）")
+            indexed_url, raw_request = replay
+            url = url or indexed_url
+        if not url or not raw_request:
+            return "❌ 请求失败: 需要提供 url 和 raw_request，或提供 request_id"
         try:
             auto_fix_content_length = True
             # 解析并预处理原始请求
@@ -711,19 +907,21 @@ class RawHttpTool(BaseTool):
             result.append("📄 响应内容:")
             
             content_type = response.headers.get('content-type', '').lower()
-            
+            body = response_text
             if 'application/json' in content_type:
                 try:
                     json_response = response.json()
                     # JSON也受长度限制
-                    json_str = json.dumps(json_response, indent=2, ensure_ascii=False)
+                    body = json.dumps(json_response, indent=2, ensure_ascii=False)
                     # if len(json_str) > end_response_index - start_response_index:
                     #     json_str = json_str[:end_response_index - start_response_index]
-                    result.append(json_str)
                 except:
-                    result.append(response_text)
-            else:
-                result.append(response_text)
+                    body = response_text
+            
+            # 同一端点(方法 + 路径，不含查询串)的近似响应只返回差异
+            method = raw_request.lstrip().split(" ", 1)[0].upper()
+            endpoint = f"http:{url.rstrip('/')}|{method} {request_uri.split('?', 1)[0]}"
+            result.append(response_memory.compact(endpoint, body, full=full_response))
             
             return "\n".join(result)
             
@@ -836,20 +1034,32 @@ class RawHttpTool(BaseTool):
 
 
 
-def setup_tools(cdp_url: str = None) -> Dict[str, BaseTool]:
-    """初始化并返回所有工具"""
+def setup_tools(cdp_url: str = None, cdp_urls: List[str] = None) -> Dict[str, BaseTool]:
+    """初始化并返回所有工具
+
+    cdp_urls: 多个浏览器实例时由租约池按需分配，优先于固定的 cdp_url
+    """
     
     # 创建共享的浏览器会话管理器
     session_manager = None
-    if cdp_url is not None:
+    if cdp_urls:
+        browser_config = BrowserSessionConfig()
+        browser_config.lease_pool = CDPLeasePool(cdp_urls)
+        if browser_config.lease_pool.slots == 1:
+            # 独占实例才按任务取用/释放Steel会话；共享实例的会话由主进程维护
+            browser_config.session_pool = SteelSessionPool(browser_config.lease_pool)
+        session_manager = BrowserSessionManager(browser_config)
+    elif cdp_url is not None:
         browser_config = BrowserSessionConfig()
         browser_config.cdp_url = cdp_url
         session_manager = BrowserSessionManager(browser_config)
     
+    browser = BrowserTool(session_manager=session_manager)
     return {
         "dir_searcher": CTFDirSearchTool(),
         "katana": KatanaTool(),
-        "browser": BrowserTool(session_manager=session_manager), 
+        "browser": browser, 
+        "browser_probe": BrowserProbeTool(browser_tool=browser),
         "sqlmap": SQLMapTool(),
         "sandbox_exec": SandboxExecTool(),
         "flag_validator": FlagValidatorTool(),
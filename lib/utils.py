@@ -1,5 +1,6 @@
 import json
 import os
+import re
 from pathlib import Path
 from typing import Dict, Any, List
 from datetime import datetime
@@ -70,6 +71,40 @@ def is_in_last_hour_of_competition(now: datetime | None = None) -> bool:
     return hour in (11, 12, 16, 17)
 
 
+def competition_minutes_left(now: datetime | None = None) -> float | None:
+    """返回距当前比赛时段结束的剩余分钟数；不在比赛时段内返回 None。
+    比赛时段同 is_in_last_hour_of_competition：每天 10:00-13:00、15:00-18:00。
+    """
+    if now is None:
+        now = datetime.now()
+    minutes = now.hour * 60 + now.minute + now.second / 60
+    for start_hour, end_hour in ((10, 13), (15, 18)):
+        if start_hour * 60 <= minutes < end_hour * 60:
+            return end_hour * 60 - minutes
+    return None
+
+
+FLAG_PATTERNS = [
+    r"flag\{[^}]+\}",
+    r"CTF\{[^}]+\}",
+    r"FLAG\{[^}]+\}",
+    # r"[A-Za-z0-9]{32}",  # 32位MD5类Flag
+    # r"[A-Z0-9]{8}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{12}",  # UUID格式
+]
+_FLAG_RE = [re.compile(p, re.IGNORECASE) for p in FLAG_PATTERNS]
+
+
+def find_flags(content: str) -> List[str]:
+    """按 FLAG_PATTERNS 查找内容中的flag（按出现顺序去重）"""
+    if not content:
+        return []
+    for pattern in _FLAG_RE:
+        matches = pattern.findall(str(content))
+        if matches:
+            return list(dict.fromkeys(matches))
+    return []
+
+
 def parse_targets_from_file(path: str) -> List[str]:
     if not os.path.exists(path):
         return []
@@ -1,6 +1,14 @@
 from crewai import Task, Agent
 from crewai.knowledge.knowledge_config import KnowledgeConfig
 
+# 各agent共用的 BrowserProbe 使用说明
+BROWSER_PROBE_GUIDE = (
+    "【BrowserProbe】- 快速观察（不经过LLM，毫秒级）\n"
+    "• 读取cookie(含HttpOnly)、表单字段、localStorage/sessionStorage\n"
+    "• 获取渲染后的页面文本、链接、脚本和HTML注释\n"
+    "• 只需观察页面时优先使用，点击/填写等多步交互再用BrowserTool\n\n"
+)
+
 # from .agents import ComprehensiveCTFAgents, RobustCTFAgents, ReasoningCTFAgents
 # from .tools import CTFDirSearchTool, KatanaTool, BrowserTool, SQLMapTool, SandboxExecTool, FlagValidatorTool
 # class CTFCrewAISystem:
@@ -314,6 +322,8 @@ class CTFOpportunisticWorkflow:
                 "• 提取表单字段和参数名称\n"
                 "• 识别AJAX调用和异步接口\n\n"
                 
+                + BROWSER_PROBE_GUIDE +
+                
                 "【BrowserTool】- 交互分析\n"
                 "• 分析页面功能和用户交互点\n"
                 "• 检查表单、按钮、链接等输入向量\n"
@@ -340,12 +350,14 @@ class CTFOpportunisticWorkflow:
                 "• 支持GET、POST、PUT、DELETE等方法\n"
                 "• 可自定义请求头和体，比如文件上传\n"
                 "• 注意构造的请求格式要符合HTTP标准，比如换行符\n"
+                "• 可用 request_id 直接重放BrowserTool捕获的请求(如 H3)\n"
                 "• 检查响应状态码和内容\n\n"
             ),
             tools=[
                 self.tools["dir_searcher"], 
                 self.tools["katana"],
                 self.tools["browser"],
+                self.tools["browser_probe"],
                 self.tools["sandbox_exec"],
                 self.tools["flag_validator"],
                 self.tools["sqlmap"],
@@ -378,18 +390,16 @@ class CTFOpportunisticWorkflow:
             allow_delegation=True
         )
     
-    def create_opportunistic_workflow(self, target_url: str, target_code: str, hint: str = None):
-        """创建机会主义CTF工作流"""
+    def create_opportunistic_workflow(self, target_url: str, target_code: str, hint: str = None, resume: str = None):
+        """创建机会主义CTF工作流；resume 为断点续跑上下文"""
         
         # agents = self._get_opportunistic_agents()
         
         # 单一主任务 - 由机会主义协调器智能分解
         main_task = Task(
             description=(
-                f"🎯 尽快寻找到目标CTF题目的FLAG信息\n"
-                f"目标: {target_url} (编号: {target_code})\n"
-                f"提示线索: {hint or '无特定提示'}\n"
-                "注意：不要自行修改目标URL及其端口，仅对目标进行攻击！\n\n"
+                # 静态指令在前、本题信息在后，保证各题各轮的prompt前缀一致以命中提供商的前缀缓存
+                f"🎯 尽快寻找到目标CTF题目的FLAG信息（目标见末尾【本题信息】）\n\n"
                 f"👥 角色分工与委托指令\n"
                 f"══════════════════════════════\n"
                 f"1. 🚀 立即委托【快速侦察兵】执行初始侦察\n"
@@ -477,7 +487,14 @@ class CTFOpportunisticWorkflow:
                 f"• 当前路径受阻? → 立即扫描其他端点\n"
                 f"• 当前技术无效? → 立即切换攻击技术\n"
                 f"• 当前方法低效? → 立即优化或放弃\n"
-                f"• 时间投入过高? → 立即重新评估ROI"
+                f"• 时间投入过高? → 立即重新评估ROI\n\n"
+
+                f"📌 本题信息\n"
+                f"══════════════════════════════\n"
+                f"目标: {target_url} (编号: {target_code})\n"
+                f"提示线索: {hint or '无特定提示'}\n"
+                "注意：不要自行修改目标URL及其端口，仅对目标进行攻击！"
+                + (f"\n\n♻️ 断点续跑\n══════════════════════════════\n{resume}" if resume else "")
             ),
             expected_output=(
                 "CTF攻击成果报告:\n"
@@ -529,6 +546,8 @@ class CTFOpportunisticWorkflow:
                 "• 提取表单字段和参数名称\n"
                 "• 识别AJAX调用和异步接口\n\n"
                 
+                + BROWSER_PROBE_GUIDE +
+                
                 "【BrowserTool】- 交互分析\n"
                 "• 分析页面功能和用户交互点\n"
                 "• 检查表单、按钮、链接等输入向量\n"
@@ -584,7 +603,8 @@ class CTFOpportunisticWorkflow:
             tools=[
                 self.tools["dir_searcher"], 
                 self.tools["katana"],
-                self.tools["browser"]
+                self.tools["browser"],
+                self.tools["browser_probe"]
             ],
             llm=self.llm_config.get_llm_by_role("recon_scout"),
             max_iter=10,
@@ -613,6 +633,8 @@ class CTFOpportunisticWorkflow:
                 
                 "🛠️ 工具使用策略\n"
                 "══════════════════════════════\n"
+                + BROWSER_PROBE_GUIDE +
+                
                 "【BrowserTool】- 手动验证\n"
                 "• 测试输入点响应\n"
                 "• 验证payload效果\n"
@@ -634,6 +656,7 @@ class CTFOpportunisticWorkflow:
                 "• 支持GET、POST、PUT、DELETE等方法\n"
                 "• 可自定义请求头和体，比如文件上传\n"
                 "• 注意构造的请求格式要符合HTTP标准，比如换行符\n"
+                "• 可用 request_id 直接重放BrowserTool捕获的请求(如 H3)\n"
                 "• 检查响应状态码和内容\n\n"
 
                 "【CodeInterpreterTool】- 代码执行环境\n"
@@ -721,6 +744,7 @@ class CTFOpportunisticWorkflow:
             ),
             tools=[
                 self.tools["browser"], 
+                self.tools["browser_probe"], 
                 self.tools["sandbox_exec"], 
                 self.tools["sqlmap"],
                 self.tools["raw_http"],
@@ -761,6 +785,8 @@ class CTFOpportunisticWorkflow:
                 
                 "🛠️ 工具使用策略\n"
                 "══════════════════════════════\n"
+                + BROWSER_PROBE_GUIDE +
+                
                 "【BrowserTool】- 精确payload投递\n"
                 "• 投递精心构造的利用payload\n"
                 "• 验证命令执行结果\n"
@@ -778,6 +804,7 @@ class CTFOpportunisticWorkflow:
                 "• 测试文件上传和下载\n"
                 "• 验证API交互\n"
                 "• 注意构造的请求格式要符合HTTP标准，比如换行符\n"
+                "• 可用 request_id 直接重放BrowserTool捕获的请求(如 H3)\n"
                 "• 开发自定义利用链\n\n"
                 
                 "【SandboxExecTool】- 命令执行环境\n"
@@ -890,7 +917,7 @@ class CTFOpportunisticWorkflow:
                 "• 绕过技术的创新性\n"
                 "• 利用链的完整性"
             ),
-            tools=[self.tools["browser"], self.tools["sandbox_exec"], self.tools["raw_http"], self.tools["sqlmap"]],
+            tools=[self.tools["browser"], self.tools["browser_probe"], self.tools["sandbox_exec"], self.tools["raw_http"], self.tools["sqlmap"]],
             llm=self.llm_config.get_llm_by_role("ctf_exploit_expert"),
             reasoning=False,
             # knowledge_sources=[text_source],
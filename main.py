@@ -11,7 +11,8 @@ import json
 from hashlib import md5
 from typing import List, Dict, Any
 from lib.config import is_debug, set_debug, is_verbose, set_verbose
-from lib.executor import run_batch_for_items
+from lib.executor import iter_batch_for_items, get_pebble_executor
+from lib.scheduler import PriorityAdmissionScheduler, rank_items
 
 # import litellm
 # # litellm.json_logs = False
@@ -20,7 +21,7 @@ from lib.executor import run_batch_for_items
 
 
 from lib.logger import get_logger
-from lib.utils import load_processed_set, save_processed_set, load_failure_counts, save_failure_counts, is_in_last_hour_of_competition, parse_targets_from_file
+from lib.utils import load_processed_set, save_processed_set, load_failure_counts, save_failure_counts, is_in_last_hour_of_competition, parse_targets_from_file, competition_minutes_left
 
 # 引入 CTF 平台 API 接口
 try:
@@ -56,6 +57,8 @@ def _filter_items(batch_items, failure_counts, last_hour, watch_mode, logger):
             continue
         if watch_mode:
             it["failure_counts"] = c
+        # 最后一小时会自动获取提示，调度时按已有提示估计
+        it["hint_expected"] = bool(last_hour)
         new_items.append(it)
     return new_items
 
@@ -239,7 +242,10 @@ def main():
     parser.add_argument("--hint_last_hour",  default=True, help="仅在每个比赛时段的最后1小时为未解题目获取提示", action="store_true")
     parser.add_argument("--debug",  default=False, help="调试模式流程", action="store_true")
     parser.add_argument("--verbose",  default=False, help="verbose模式，输出更多信息", action="store_true")
-    parser.add_argument("--max_concurrent",  default=1, help="最大并发执行数", type=int)
+    parser.add_argument("--max_concurrent",  default=1, help="最大并发执行数（自适应并发的上限）", type=int)
+    parser.add_argument("--coordinator",  default="", help="多机模式：在 host:port 上监听，把题目分发给远程worker执行")
+    parser.add_argument("--worker",  default="", help="以worker守护进程运行，连接 host:port 的协调器并用本机浏览器执行任务")
+    parser.add_argument("--preempt_after",  default=20, help="轮询模式下题目运行超过该分钟数后可被更易解的题目抢占，0 表示禁用", type=float)
 
     args = parser.parse_args()
 
@@ -265,6 +271,11 @@ def main():
     # 批量来源：优先从 CTF 平台获取；否则从文件读取
     base_logger = get_logger("main")
 
+    if args.worker:
+        from lib.cluster import ClusterWorker
+        ClusterWorker(args.worker, max_concurrent=args.max_concurrent).run()
+        # 不会到达此处
+
     if args.use_ctf_api and args.watch_ctf_api:
         if fetch_ctf_challenges is None:
             print("CTF平台模块不可用，无法启用轮询模式")
@@ -272,28 +283,25 @@ def main():
         base_logger.info(f"进入CTF平台轮询模式，间隔 {args.poll_interval}s，标记规则: 尝试")
         processed = load_processed_set()
         failure_counts = load_failure_counts()
-        while True:
+
+        def fetch_items():
             batch_items = load_ctf_challenges_from_api(base_logger)
             if not batch_items:
                 base_logger.info("CTF平台暂无题目或解析失败，等待后重试...")
-                time.sleep(args.poll_interval)
-                continue
-           
-            new_items = _filter_items(batch_items, failure_counts, is_in_last_hour_of_competition(), True, base_logger)
+                return []
+            return _filter_items(batch_items, failure_counts, is_in_last_hour_of_competition(), True, base_logger)
 
-            if not new_items:
-                base_logger.info("可执行题目为空（均已失败≥3次），等待后重试...")
-                time.sleep(args.poll_interval)
-                continue
-
-            base_logger.info(f"发现新题目: {len(new_items)}，开始执行...")
-            results = run_batch_for_items(new_items, args)
-            _update_failure_counts(new_items, results, failure_counts)
-            _mark_processed(new_items, results, processed, False)
+        def on_result(item, result):
+            # 每完成一题立即落盘
+            _update_failure_counts([item], [result], failure_counts)
+            _mark_processed([item], [result], processed, False)
             save_failure_counts(failure_counts)
             save_processed_set(processed)
-            base_logger.info("轮询周期结束，等待后继续...")
-            time.sleep(args.poll_interval)
+
+        PriorityAdmissionScheduler(
+            get_pebble_executor(args), fetch_items, on_result, args, args.poll_interval,
+            preempt_after=args.preempt_after * 60,
+        ).run()
         # 不会到达此处
     else:
         # 单次批量：从平台或文件加载一次并执行
@@ -320,9 +328,10 @@ def main():
         print("可执行题目为空（均已失败≥10次），退出")
         return 1
 
-    results_summary = run_batch_for_items(filtered_items, args)
-    _update_failure_counts(filtered_items, results_summary, failure_counts)
-    save_failure_counts(failure_counts)
+    filtered_items = rank_items(filtered_items, competition_minutes_left())
+    for item, result in iter_batch_for_items(filtered_items, args):
+        _update_failure_counts([item], [result], failure_counts)
+        save_failure_counts(failure_counts)
 
     return 0
 